@@ -0,0 +1,95 @@
+#!/usr/bin/python3
+
+# Measure how fast the install progress screen can consume curtin's
+# journal output. The records in a saved journal dump (by default
+# examples/curtin-events.json) are replayed as fast as possible through
+# InstallProgressController, once applying and rendering each record on
+# its own (which is what happened before journal records were batched)
+# and once applying and rendering them in batches of the given size.
+#
+# Run as: PYTHONPATH=. python3 scripts/curtin-event-benchmark.py \
+#     [--repeat N] [--batch-size N] [events.json]
+
+import argparse
+import asyncio
+import json
+import os
+import tempfile
+import time
+
+from subiquitycore.context import Context
+from subiquity.controllers.installprogress import InstallProgressController
+
+
+class Thing:
+    # Just something to hang attributes off
+    pass
+
+
+class MiniApplication:
+    ui = signal = loop = base_model = None
+    # Never run, so spinners are started but never tick.
+    aio_loop = asyncio.new_event_loop()
+    project = "mini"
+    autoinstall_config = {}
+    answers = {}
+    opts = Thing()
+    opts.dry_run = True
+    log_dir = tempfile.gettempdir()
+    def report_start_event(*args): pass
+    def report_finish_event(*args): pass
+
+
+def load_events(path, controller):
+    events = []
+    with open(path) as fp:
+        for line in fp:
+            event = json.loads(line)
+            ident = event['SYSLOG_IDENTIFIER']
+            if ident.startswith('curtin_event'):
+                event['SYSLOG_IDENTIFIER'] = (
+                    controller._event_syslog_identifier)
+            elif ident.startswith('curtin_log'):
+                event['SYSLOG_IDENTIFIER'] = controller._log_syslog_identifier
+            events.append(event)
+    return events
+
+
+def make_controller():
+    app = MiniApplication()
+    app.context = Context.new(app)
+    controller = InstallProgressController(app)
+    root = app.context.child("install").child("curtin_install")
+    controller.curtin_event_contexts.add('', root)
+    return controller
+
+
+def replay(events, repeat, batch_size):
+    controller = make_controller()
+    view = controller.progress_view
+    records = events * repeat
+    start = time.perf_counter()
+    for i in range(0, len(records), batch_size):
+        controller._journal_events(records[i:i + batch_size])
+        view.render((80, 24))
+    return len(records), time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--repeat', type=int, default=20)
+    parser.add_argument('--batch-size', type=int, default=100)
+    parser.add_argument(
+        'events', nargs='?',
+        default=os.path.join(
+            os.path.dirname(__file__), '..', 'examples', 'curtin-events.json'))
+    args = parser.parse_args()
+
+    events = load_events(args.events, make_controller())
+    for label, batch_size in ('unbatched', 1), ('batched', args.batch_size):
+        count, elapsed = replay(events, args.repeat, batch_size)
+        print("{:10} {:6} records in {:7.3f}s: {:9.0f} records/s".format(
+            label, count, elapsed, count / elapsed))
+
+
+main()
@@ -0,0 +1,66 @@
+#!/usr/bin/python3
+
+# Time FilesystemModel._render_actions on large synthetic models. Each
+# "disk" gets a few partitions, every other pair of disks is combined
+# into a RAID1 holding an LVM volume group, and every partition and
+# logical volume is formatted and mounted somewhere in a nested
+# hierarchy so that mount ordering matters too. Pass --shuffle to present
+# the actions in a random order, which is the worst case for the
+# renderer's dependency tracking.
+#
+# Run as: PYTHONPATH=. python3 scripts/render-benchmark.py [--shuffle] [N]
+# where N is the approximate number of actions (default 10000).
+
+import random
+import sys
+import time
+
+from subiquity.models.tests.test_filesystem import (
+    make_disk,
+    make_model,
+    make_partition,
+    )
+
+
+def build_model(target_actions):
+    model = make_model()
+    n = 0
+    while len(model._actions) < target_actions:
+        disks = [make_disk(model, path='/dev/sd%d' % (n + i)) for i in (0, 1)]
+        for disk in disks:
+            for j in range(3):
+                part = make_partition(model, disk, size=1 << 30)
+                fs = model.add_filesystem(part, 'ext4')
+                model.add_mount(fs, '/srv/%d/%s/%d' % (n, disk.path[5:], j))
+        parts = [make_partition(model, disk, size=10 << 30) for disk in disks]
+        raid = model.add_raid('md%d' % n, 'raid1', set(parts), set())
+        vg = model.add_volgroup('vg%d' % n, {raid})
+        fs = model.add_filesystem(
+            model.add_logical_volume(vg, 'lv%d' % n, 1 << 30), 'ext4')
+        model.add_mount(fs, '/srv/%d' % n)
+        n += 2
+    return model
+
+
+def main():
+    args = sys.argv[1:]
+    shuffle = '--shuffle' in args
+    if shuffle:
+        args.remove('--shuffle')
+    target = int(args[0]) if args else 10000
+
+    start = time.perf_counter()
+    model = build_model(target)
+    if shuffle:
+        random.shuffle(model._actions)
+    built = time.perf_counter()
+    config = model._render_actions()
+    rendered = time.perf_counter()
+
+    assert len(config) == len(model._actions)
+    print("built {} actions in {:.3f}s".format(
+        len(model._actions), built - start))
+    print("rendered in {:.3f}s".format(rendered - built))
+
+
+main()
@@ -0,0 +1,161 @@
+#!/usr/bin/python3
+
+# Benchmark complete dry-run installs. Each examples/answers*.yaml file
+# and examples/autoinstall.yaml is run against a machine config (by
+# default examples/simple.json) with snaps loaded from examples/snaps
+# and the curtin replay sped up by SUBIQUITY_REPLAY_TIMESCALE, all on a
+# pseudo-terminal so no real terminal is needed. The installer writes
+# timings per controller and per screen transition, its peak RSS and
+# event loop lag to the file named by SUBIQUITY_BENCHMARK_REPORT (see
+# subiquitycore/benchmark.py), and these are collected into a single
+# JSON report so that runs from different releases can be compared.
+#
+# Run from the top of the tree as:
+#     python3 scripts/replay-benchmark.py [--output report.json] \
+#         [--timescale N] [--timeout SECONDS] [--machine-config CONFIG] \
+#         [scenario ...]
+# where each scenario is an answers or autoinstall file name.
+
+import argparse
+import glob
+import json
+import os
+import platform
+import pty
+import select
+import signal
+import subprocess
+import sys
+import tempfile
+import time
+
+
+STATE_FILES = [
+    '.subiquity/subiquity-curtin-install.conf',
+    '.subiquity/subiquity-debug.log',
+    '.subiquity/run/subiquity/updating',
+    ]
+
+
+def default_scenarios():
+    scenarios = sorted(glob.glob('examples/answers*.yaml'))
+    scenarios.append('examples/autoinstall.yaml')
+    return scenarios
+
+
+def git_describe():
+    try:
+        return subprocess.run(
+            ['git', 'describe', '--always', '--dirty'],
+            stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+            universal_newlines=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_scenario(scenario, args):
+    for path in STATE_FILES:
+        if os.path.exists(path):
+            os.unlink(path)
+
+    master, slave = pty.openpty()
+    tty = os.ttyname(slave)
+    cmd = [
+        sys.executable, '-m', 'subiquity.cmd.tui', '--dry-run',
+        '--snaps-from-examples', '--machine-config', args.machine_config,
+        ]
+    if os.path.basename(scenario).startswith('autoinstall'):
+        cmd.extend([
+            '--autoinstall', scenario,
+            '--kernel-cmdline',
+            'autoinstall console={}'.format(tty[len('/dev/'):]),
+            ])
+    else:
+        cmd.extend(['--answers', scenario])
+
+    fd, report_path = tempfile.mkstemp(suffix='.json')
+    os.close(fd)
+    env = os.environ.copy()
+    env.update({
+        'LANG': 'C.UTF-8',
+        'SUBIQUITY_REPLAY_TIMESCALE': str(args.timescale),
+        'SUBIQUITY_BENCHMARK_REPORT': report_path,
+        })
+
+    start = time.monotonic()
+    proc = subprocess.Popen(
+        cmd, stdin=slave, stdout=slave, stderr=slave, env=env,
+        start_new_session=True)
+    os.close(slave)
+    timed_out = False
+    # The installer's output has to be read or it will block once the
+    # pty's buffer fills up.
+    while proc.poll() is None:
+        if time.monotonic() - start > args.timeout:
+            timed_out = True
+            os.killpg(proc.pid, signal.SIGTERM)
+            proc.wait()
+            break
+        r, _, _ = select.select([master], [], [], 0.5)
+        if r:
+            try:
+                os.read(master, 65536)
+            except OSError:
+                pass
+    wall_time = time.monotonic() - start
+    os.close(master)
+
+    result = {
+        'scenario': scenario,
+        'returncode': proc.returncode,
+        'timed_out': timed_out,
+        'wall_time': wall_time,
+        'installer': None,
+        }
+    try:
+        with open(report_path) as fp:
+            result['installer'] = json.load(fp)
+    except (OSError, ValueError):
+        pass
+    os.unlink(report_path)
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--output', default='benchmark-report.json')
+    parser.add_argument('--timescale', type=float, default=1000)
+    parser.add_argument('--timeout', type=float, default=300)
+    parser.add_argument('--machine-config', default='examples/simple.json')
+    parser.add_argument('scenarios', nargs='*')
+    args = parser.parse_args()
+
+    scenarios = args.scenarios or default_scenarios()
+    results = []
+    for scenario in scenarios:
+        result = run_scenario(scenario, args)
+        installer = result['installer'] or {}
+        peak_rss = installer.get('peak_rss', 0) / 2**20
+        max_lag = installer.get('loop_lag', {}).get('max', 0.0)
+        print("{:40} {:8.2f}s rc={} rss {:6.1f}MiB max lag {:.3f}s".format(
+            scenario, result['wall_time'], result['returncode'], peak_rss,
+            max_lag))
+        results.append(result)
+
+    report = {
+        'version': git_describe(),
+        'python': platform.python_version(),
+        'machine': platform.machine(),
+        'time': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+        'timescale': args.timescale,
+        'machine_config': args.machine_config,
+        'results': results,
+        }
+    with open(args.output, 'w') as fp:
+        json.dump(report, fp, indent=2)
+
+    if any(r['returncode'] != 0 or r['installer'] is None for r in results):
+        sys.exit(1)
+
+
+main()
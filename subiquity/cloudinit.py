@@ -0,0 +1,52 @@
+# Copyright 2020 Canonical, Ltd.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import logging
+
+
+log = logging.getLogger('subiquity.cloudinit')
+
+AUTOINSTALL_PATH = '/autoinstall.yaml'
+
+# The states "cloud-init status --wait" waits for cloud-init to leave.
+CLOUD_INIT_PENDING = {'not run', 'running'}
+
+
+def parse_cloud_init_status(output):
+    for line in output.splitlines():
+        if line.startswith('status:'):
+            return line[len('status:'):].strip()
+    return None
+
+
+def write_autoinstall_from_cloud_config(path=AUTOINSTALL_PATH):
+    """Copy any autoinstall section of the cloud config to path.
+
+    This blocks while cloud-init's datasource is loaded, so do not call
+    it from the main thread once the UI is running. Returns whether an
+    autoinstall section was found.
+    """
+    from cloudinit import atomic_helper, safeyaml, stages
+    log.debug("loading cloud config")
+    init = stages.Init()
+    init.read_cfg()
+    init.fetch(existing="trust")
+    cloud = init.cloudify()
+    if 'autoinstall' not in cloud.cfg:
+        return False
+    atomic_helper.write_file(
+        path, safeyaml.dumps(cloud.cfg['autoinstall']).encode('utf-8'),
+        mode=0o600)
+    return True
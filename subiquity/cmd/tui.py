@@ -21,12 +21,16 @@ import fcntl
 import sys
 import time
 
-from cloudinit import atomic_helper, safeyaml, stages
-
+from subiquitycore import startup_profiler
 from subiquitycore.log import setup_logger
 from subiquitycore.utils import run_command
 
-from subiquity.core import Subiquity
+from subiquity.cloudinit import (
+    AUTOINSTALL_PATH,
+    CLOUD_INIT_PENDING,
+    parse_cloud_init_status,
+    write_autoinstall_from_cloud_config,
+    )
 
 
 class ClickAction(argparse.Action):
@@ -71,6 +75,12 @@ def parse_options(argv):
                         help='Synthesize a click on a button matching PAT')
     parser.add_argument('--answers')
     parser.add_argument('--autoinstall', action='store')
+    parser.add_argument(
+        '--async-cloud-init', action='store_true',
+        help=("Start the UI without waiting for cloud-init to finish, "
+              "and check for an autoinstall config from cloud-init in "
+              "the background."))
+    parser.set_defaults(cloud_init_pending=False)
     with open('/proc/cmdline') as fp:
         cmdline = fp.read()
     parser.add_argument('--kernel-cmdline', action='store', default=cmdline)
@@ -116,6 +126,12 @@ def main():
         LOGDIR = ".subiquity"
         if opts.snaps_from_examples is None:
             opts.snaps_from_examples = True
+    if os.environ.get(startup_profiler.ENV_VAR):
+        # Started before the heavyweight imports below so they are
+        # included in the profile, which is written once the first
+        # screen has been shown.
+        startup_profiler.start(
+            os.path.join(LOGDIR, 'startup-profile.json'))
     logfiles = setup_logger(dir=LOGDIR)
 
     logger = logging.getLogger('subiquity')
@@ -123,22 +139,21 @@ def main():
     logger.info("Starting Subiquity revision {}".format(version))
     logger.info("Arguments passed: {}".format(sys.argv))
 
-    if not opts.dry_run:
+    if not opts.dry_run and opts.async_cloud_init and opts.autoinstall is None:
+        status_txt = run_command(["cloud-init", "status"]).stdout
+        if parse_cloud_init_status(status_txt) in CLOUD_INIT_PENDING:
+            # Subiquity waits for cloud-init once the UI is up and
+            # restarts itself if an autoinstall config turns up.
+            logger.debug("cloud-init still running, not waiting for it")
+            opts.cloud_init_pending = True
+
+    if not opts.dry_run and not opts.cloud_init_pending:
         ci_start = time.time()
         status_txt = run_command(["cloud-init", "status", "--wait"]).stdout
         logger.debug("waited %ss for cloud-init", time.time() - ci_start)
         if "status: done" in status_txt:
-            logger.debug("loading cloud config")
-            init = stages.Init()
-            init.read_cfg()
-            init.fetch(existing="trust")
-            cloud = init.cloudify()
-            if 'autoinstall' in cloud.cfg:
-                atomic_helper.write_file(
-                    '/autoinstall.yaml',
-                    safeyaml.dumps(cloud.cfg['autoinstall']).encode('utf-8'),
-                    mode=0o600)
-                opts.autoinstall = '/autoinstall.yaml'
+            if write_autoinstall_from_cloud_config(AUTOINSTALL_PATH):
+                opts.autoinstall = AUTOINSTALL_PATH
         else:
             logger.debug(
                 "cloud-init status: %r, assumed disabled",
@@ -169,7 +184,10 @@ def main():
             opts.answers.close()
             opts.answers = None
 
-    subiquity_interface = Subiquity(opts, block_log_dir)
+    with startup_profiler.phase("import subiquity.core"):
+        from subiquity.core import Subiquity
+    with startup_profiler.phase("Subiquity()"):
+        subiquity_interface = Subiquity(opts, block_log_dir)
 
     subiquity_interface.note_file_for_apport(
         "InstallerLog", logfiles['debug'])
@@ -19,12 +19,6 @@ import logging
 import os
 import time
 
-import apport
-import apport.crashdb
-import apport.hookutils
-
-import bson
-
 import attr
 
 import requests
@@ -41,6 +35,36 @@ from subiquity.controllers.cmdlist import CmdListController
 
 log = logging.getLogger('subiquity.controllers.error')
 
+# How much of the end of the curtin log to include when uploading a
+# report (not counting newlines or leading and trailing whitespace).
+CURTIN_LOG_TAIL_LEN = 2048
+
+
+def log_tail(text, max_len):
+    """Return the last lines of text, stripped, totalling at most max_len.
+
+    The text is scanned backwards from the end, so this takes time
+    proportional to the size of the tail rather than of the whole text.
+    """
+    if isinstance(text, bytes):
+        text = text.decode('utf-8', 'replace')
+    lines = []
+    total = 0
+    end = len(text)
+    if text.endswith('\n'):
+        end -= 1
+    while True:
+        start = text.rfind('\n', 0, end) + 1
+        line = text[start:end].strip()
+        if total + len(line) > max_len:
+            break
+        lines.append(line)
+        total += len(line)
+        if start == 0:
+            break
+        end = start - 1
+    return "\n".join(reversed(lines))
+
 
 class ErrorReportState(enum.Enum):
     INCOMPLETE = enum.auto()
@@ -100,9 +124,11 @@ class ErrorReport(metaclass=urwid.MetaSignals):
 
     meta = attr.ib(default=attr.Factory(dict))
     uploader = attr.ib(default=None)
+    _load_task = attr.ib(default=None)
 
     @classmethod
     def new(cls, controller, kind):
+        import apport
         base = "{:.9f}.{}".format(time.time(), kind.name.lower())
         crash_file = open(
             os.path.join(controller.crash_directory, base + ".crash"),
@@ -115,15 +141,19 @@ class ErrorReport(metaclass=urwid.MetaSignals):
             controller=controller, base=base, pr=pr, file=crash_file,
             state=ErrorReportState.INCOMPLETE,
             context=controller.context.child(base))
+        r.meta["date"] = pr["Date"]
         r.set_meta("kind", kind.name)
         return r
 
     @classmethod
     def from_file(cls, controller, fpath):
+        # Only the .meta file is read here: the report itself is loaded
+        # by ensure_loaded() when something needs it.
+        import apport
         base = os.path.splitext(os.path.basename(fpath))[0]
         report = cls(
             controller, base, pr=apport.Report(date='???'),
-            state=ErrorReportState.LOADING, file=open(fpath, 'rb'),
+            state=ErrorReportState.LOADING, file=None,
             context=controller.context.child(base))
         try:
             fp = open(report.meta_path, 'r')
@@ -132,10 +162,18 @@ class ErrorReport(metaclass=urwid.MetaSignals):
         else:
             with fp:
                 report.meta = json.load(fp)
+        if "date" not in report.meta:
+            try:
+                mtime = os.stat(fpath).st_mtime
+            except OSError:
+                pass
+            else:
+                report.meta["date"] = time.asctime(time.localtime(mtime))
         return report
 
     def add_info(self, _bg_attach_hook, wait=False):
         def _bg_add_info():
+            import apport.hookutils
             _bg_attach_hook()
             # Add basic info to report.
             self.pr.add_proc_info()
@@ -180,18 +218,27 @@ class ErrorReport(metaclass=urwid.MetaSignals):
         else:
             schedule_task(add_info())
 
+    def ensure_loaded(self):
+        if self.state != ErrorReportState.LOADING:
+            return
+        if self._load_task is None:
+            self._load_task = schedule_task(self.load())
+        return self._load_task
+
     async def load(self):
         with self._context.child("load"):
             # Load report from disk in background.
             try:
+                self._file = open(self.path, 'rb')
                 await run_in_thread(self.pr.load, self._file)
             except Exception:
                 log.exception("loading problem report failed")
                 self.state = ErrorReportState.ERROR_LOADING
             else:
                 self.state = ErrorReportState.DONE
-        self._file.close()
-        self._file = None
+        if self._file is not None:
+            self._file.close()
+            self._file = None
         urwid.emit_signal(self, "changed")
 
     def upload(self):
@@ -213,6 +260,7 @@ class ErrorReport(metaclass=urwid.MetaSignals):
                 uploader._bg_update(uploader.bytes_sent + chunk_size)
 
         def _bg_upload():
+            import bson
             for_upload = {
                 "Kind": self.kind.value
                 }
@@ -226,12 +274,8 @@ class ErrorReport(metaclass=urwid.MetaSignals):
                 else:
                     log.debug("dropping %s of length %s", k, len(v))
             if "CurtinLog" in self.pr:
-                logtail = []
-                for line in self.pr["CurtinLog"].splitlines():
-                    logtail.append(line.strip())
-                    while sum(map(len, logtail)) > 2048:
-                        logtail.pop(0)
-                for_upload["CurtinLogTail"] = "\n".join(logtail)
+                for_upload["CurtinLogTail"] = log_tail(
+                    self.pr["CurtinLog"], CURTIN_LOG_TAIL_LEN)
             data = bson.BSON().encode(for_upload)
             self.uploader._bg_update(0, len(data))
             headers = {
@@ -286,6 +330,12 @@ class ErrorReport(metaclass=urwid.MetaSignals):
         k = self.meta.get("kind", "UNKNOWN")
         return getattr(ErrorReportKind, k, ErrorReportKind.UNKNOWN)
 
+    @property
+    def date(self):
+        if self.state == ErrorReportState.LOADING:
+            return self.meta.get("date", "???")
+        return self.pr.get("Date", "???")
+
     @property
     def seen(self):
         return self.meta.get("seen", False)
@@ -342,17 +392,12 @@ class ErrorController(CmdListController):
 
     def start(self):
         os.makedirs(self.crash_directory, exist_ok=True)
-        # scan for pre-existing crash reports and start loading them
-        # in the background
+        # scan for pre-existing crash reports; they are only loaded
+        # when they are looked at
         self.scan_crash_dir()
 
-    async def _load_reports(self, to_load):
-        for report in to_load:
-            await report.load()
-
     def scan_crash_dir(self):
         filenames = os.listdir(self.crash_directory)
-        to_load = []
         for filename in sorted(filenames, reverse=True):
             base, ext = os.path.splitext(filename)
             if ext != ".crash":
@@ -360,8 +405,6 @@ class ErrorController(CmdListController):
             path = os.path.join(self.crash_directory, filename)
             r = ErrorReport.from_file(self, path)
             self.reports.append(r)
-            to_load.append(r)
-        schedule_task(self._load_reports(to_load))
 
     def create_report(self, kind):
         r = ErrorReport.new(self, kind)
@@ -14,18 +14,21 @@
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
 import asyncio
+import functools
 import json
 import logging
 import os
 import select
 
-import pyudev
-
 from subiquitycore.async_helpers import (
     run_in_thread,
     schedule_task,
     SingleInstanceTask,
     )
+from subiquitycore.prober import (
+    block_device_fingerprints,
+    StorageProbeCache,
+    )
 from subiquitycore.utils import (
     run_command,
     )
@@ -57,6 +60,19 @@ BIOS_GRUB_SIZE_BYTES = 1 * 1024 * 1024    # 1MiB
 PREP_GRUB_SIZE_BYTES = 8 * 1024 * 1024    # 8MiB
 UEFI_GRUB_SIZE_BYTES = 512 * 1024 * 1024  # 512MiB EFI partition
 
+# The full probe runs each type of probe (blockdev, lvm, raid, ...) in
+# parallel so that one slow probe only loses us that type of data.
+PROBE_TYPE_TIMEOUT = 10.0
+PROBE_MAX_WORKERS = 8
+
+# udev events come in bursts (a disk and then its partitions, multipath
+# paths turning up one by one over several seconds), so rather than
+# re-probing for each one we wait until there have been none for
+# UDEV_QUIET_TIME seconds, but no more than UDEV_MAX_DELAY seconds after
+# the first.
+UDEV_QUIET_TIME = 1.0
+UDEV_MAX_DELAY = 5.0
+
 
 class FilesystemController(SubiquityController):
 
@@ -76,10 +92,19 @@ class FilesystemController(SubiquityController):
         self.answers.setdefault('manual', [])
         self._monitor = None
         self._crash_reports = {}
+        # Probe data is cached in the state dir so that it does not have to
+        # be collected again after a restart if nothing has changed. There
+        # is no point when the probe data comes from --machine-config.
+        self._probe_cache = None
+        if app.prober.saved_config is None:
+            self._probe_cache = StorageProbeCache(
+                os.path.join(app.state_dir, 'probe-cache.json'))
         self._probe_once_task = SingleInstanceTask(
             self._probe_once, propagate_errors=False)
         self._probe_task = SingleInstanceTask(
             self._probe, propagate_errors=False)
+        self._reprobe_handle = None
+        self._reprobe_deadline = None
 
     def load_autoinstall_data(self, data):
         log.debug("load_autoinstall_data %s", data)
@@ -97,6 +122,7 @@ class FilesystemController(SubiquityController):
 
     async def apply_autoinstall_config(self):
         self.stop_listening_udev()
+        self._flush_reprobe()
         await self._start_task
         await self._probe_task.wait()
         if not self.model.is_root_mounted():
@@ -106,24 +132,51 @@ class FilesystemController(SubiquityController):
                 "autoinstall config did not create needed bootloader "
                 "partition")
 
-    async def _probe_once(self, restricted):
+    def _save_probe_data(self, storage, fname, key):
+        fpath = os.path.join(self.app.block_log_dir, fname)
+        with open(fpath, 'w') as fp:
+            json.dump(storage, fp, indent=4)
+        self.app.note_file_for_apport(key, fpath)
+
+    async def _get_storage_by_type(self, use_cache):
+        # Returns probe data and failures like
+        # Prober.get_storage_by_type, updating the probe cache if there is
+        # one and, if use_cache is true, using it.
+        fingerprints = None
+        if self._probe_cache is not None:
+            fingerprints = await run_in_thread(block_device_fingerprints)
+            if use_cache:
+                storage = self._probe_cache.load(fingerprints)
+                if storage is not None:
+                    return storage, {}
+        storage, failures = await run_in_thread(
+            functools.partial(
+                self.app.prober.get_storage_by_type,
+                timeout=PROBE_TYPE_TIMEOUT,
+                max_workers=PROBE_MAX_WORKERS))
+        if fingerprints is not None and not failures:
+            try:
+                self._probe_cache.save(fingerprints, storage)
+            except OSError:
+                log.exception("saving probe cache failed")
+        return storage, failures
+
+    async def _probe_once(self, restricted, use_cache=False):
+        failures = {}
         if restricted:
-            probe_types = {'blockdev'}
             fname = 'probe-data-restricted.json'
             key = "ProbeDataRestricted"
+            storage = await run_in_thread(
+                self.app.prober.get_storage, {'blockdev'})
         else:
-            probe_types = None
             fname = 'probe-data.json'
             key = "ProbeData"
-        storage = await run_in_thread(
-            self.app.prober.get_storage, probe_types)
-        fpath = os.path.join(self.app.block_log_dir, fname)
-        with open(fpath, 'w') as fp:
-            json.dump(storage, fp, indent=4)
-        self.app.note_file_for_apport(key, fpath)
+            storage, failures = await self._get_storage_by_type(use_cache)
+        self._save_probe_data(storage, fname, key)
         self.model.load_probe_data(storage)
+        return failures
 
-    async def _probe(self):
+    async def _probe(self, use_cache=False):
         with self.context.child("_probe") as context:
             self._crash_reports = {}
             if isinstance(self.ui.body, ProbingFailed):
@@ -136,12 +189,17 @@ class FilesystemController(SubiquityController):
                 try:
                     desc = "restricted={}".format(restricted)
                     with context.child("probe_once", desc):
-                        await self._probe_once_task.start(restricted)
+                        await self._probe_once_task.start(
+                            restricted, use_cache)
                         # We wait on the task directly here, not
                         # self._probe_once_task.wait as if _probe_once_task
-                        # gets cancelled, we should be cancelled too.
-                        await asyncio.wait_for(
-                            self._probe_once_task.task, 15.0)
+                        # gets cancelled, we should be cancelled too. The
+                        # full probe times out each type of probe itself
+                        # and returns what it could get, so an overall
+                        # timeout would only throw that away.
+                        timeout = 15.0 if restricted else None
+                        failures = await asyncio.wait_for(
+                            self._probe_once_task.task, timeout)
                 except asyncio.CancelledError:
                     # asyncio.CancelledError is a subclass of Exception in
                     # Python 3.6 (sadface)
@@ -153,6 +211,8 @@ class FilesystemController(SubiquityController):
                         kind, "block probing", interrupt=False)
                     self._crash_reports[restricted] = report
                     continue
+                if failures:
+                    self._report_degraded_probe(failures)
                 break
         log.debug("self.ai_data = %s", self.ai_data)
         if 'layout' in self.ai_data:
@@ -175,17 +235,31 @@ class FilesystemController(SubiquityController):
                         self.model.grub_install_device = action
             self.model.swap = self.ai_data.get('swap')
 
+    def _report_degraded_probe(self, failures):
+        desc = ", ".join(
+            "{} {}".format(probe_type, failure)
+            for probe_type, failure in sorted(failures.items()))
+        block_discover_log.warning("block probing degraded: %s", desc)
+        self.app.note_data_for_apport("ProbeDegraded", desc)
+        self._crash_reports[False] = self.app.make_apport_report(
+            ErrorReportKind.BLOCK_PROBE_FAIL, "block probing degraded",
+            interrupt=False)
+
     def start(self):
         self._start_task = schedule_task(self._start())
 
     async def _start(self):
+        import pyudev
         context = pyudev.Context()
         self._monitor = pyudev.Monitor.from_netlink(context)
         self._monitor.filter_by(subsystem='block')
         self._monitor.enable_receiving()
         if self.app.interactive():
             self.start_listening_udev()
-        await self._probe_task.start()
+        # Only the first probe can use the cache: a re-probe is because
+        # udev has told us something changed and the fingerprints might
+        # not reflect what.
+        await self._probe_task.start(use_cache=True)
 
     def start_listening_udev(self):
         loop = asyncio.get_event_loop()
@@ -211,8 +285,28 @@ class FilesystemController(SubiquityController):
         while select.select([self._monitor.fileno()], [], [], 0)[0]:
             action, dev = self._monitor.receive_device()
             log.debug("_udev_event %s %s", action, dev)
+        self._schedule_reprobe()
+
+    def _schedule_reprobe(self):
+        loop = asyncio.get_event_loop()
+        now = loop.time()
+        if self._reprobe_handle is None:
+            self._reprobe_deadline = now + UDEV_MAX_DELAY
+        else:
+            self._reprobe_handle.cancel()
+        when = min(now + UDEV_QUIET_TIME, self._reprobe_deadline)
+        self._reprobe_handle = loop.call_at(when, self._reprobe)
+
+    def _reprobe(self):
+        self._reprobe_handle = None
         self._probe_task.start_sync()
 
+    def _flush_reprobe(self):
+        # Start a re-probe that is waiting for udev to go quiet now.
+        if self._reprobe_handle is not None:
+            self._reprobe_handle.cancel()
+            self._reprobe()
+
     async def _wait_for_probing(self):
         await self._start_task
         await self._probe_task.wait()
@@ -220,6 +314,7 @@ class FilesystemController(SubiquityController):
             self.start_ui()
 
     def start_ui(self):
+        self._flush_reprobe()
         if self._probe_task.task is None or not self._probe_task.task.done():
             self.ui.set_body(SlowProbing(self))
             schedule_task(self._wait_for_probing())
@@ -14,16 +14,19 @@
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
 import asyncio
+import collections
 import contextlib
 import datetime
 import logging
 import os
 import platform
 import re
+import shlex
 import shutil
 import subprocess
 import sys
 import tempfile
+import time
 import traceback
 
 from curtin.commands.install import (
@@ -53,6 +56,19 @@ from subiquity.ui.views.installprogress import ProgressView
 
 log = logging.getLogger("subiquitycore.controller.installprogress")
 
+# curtin can log thousands of lines a second and redrawing the screen for
+# each one is expensive, so journal records are collected and applied to
+# the progress view in batches at most this often (in seconds).
+JOURNAL_BATCH_INTERVAL = 0.1
+
+# How long to wait (in seconds) after curtin exits for the events of
+# contexts it started to arrive.
+CURTIN_EVENT_DRAIN_TIMEOUT = 5.0
+
+# apt-get prints this when it configures a package, which is the last
+# thing that happens when installing it.
+APT_SETTING_UP = re.compile(r"^Setting up ([^ :]+)(:[^ ]+)? \(")
+
 
 class InstallState:
     NOT_STARTED = 0
@@ -62,22 +78,223 @@ class InstallState:
 
 
 class TracebackExtractor:
+    """Pick the first traceback out of a stream of log lines.
+
+    At most max_len characters of it are kept: if the traceback is
+    longer than that, lines after the first are dropped from the middle
+    so the innermost frames and the exception itself survive.
+    """
 
     start_marker = re.compile(r"^Traceback \(most recent call last\):")
     end_marker = re.compile(r"\S")
 
-    def __init__(self):
-        self.traceback = []
+    def __init__(self, max_len=16384):
+        self.max_len = max_len
+        self.header = None
+        self.lines = collections.deque()
+        self.length = 0
+        self.dropped = 0
         self.in_traceback = False
 
+    @property
+    def traceback(self):
+        if self.header is None:
+            return []
+        tb = [self.header]
+        if self.dropped:
+            tb.append("  ... {} lines omitted ...".format(self.dropped))
+        tb.extend(self.lines)
+        return tb
+
+    def _append(self, line):
+        if self.header is None:
+            self.header = line
+            return
+        self.lines.append(line)
+        self.length += len(line)
+        while self.length > self.max_len and len(self.lines) > 1:
+            self.length -= len(self.lines.popleft())
+            self.dropped += 1
+
     def feed(self, line):
-        if not self.traceback and self.start_marker.match(line):
+        if self.header is None and self.start_marker.match(line):
             self.in_traceback = True
         elif self.in_traceback and self.end_marker.match(line):
-            self.traceback.append(line)
+            self._append(line)
             self.in_traceback = False
         if self.in_traceback:
-            self.traceback.append(line)
+            self._append(line)
+
+
+class _ContextNode:
+
+    __slots__ = ('context', 'children')
+
+    def __init__(self):
+        self.context = None
+        self.children = {}
+
+
+class CurtinEventContexts:
+    """The contexts of curtin events that have started but not finished.
+
+    Contexts are stored in a tree keyed by the segments of their
+    slash-separated curtin event names, so finding the closest live
+    ancestor of a new event, or removing an event when it finishes, only
+    walks the segments of its name once.
+
+    The number of live contexts is len(self), and the number of
+    started, finished and unmatched finish events seen are kept as
+    attributes, so a curtin event that started but never finished shows
+    up as a nonzero length once the install is complete. The root is not
+    a curtin event and is left out of those counts.
+
+    wait_drained() can be awaited to find out when every context below
+    the root (the context for the name '') has finished.
+    """
+
+    def __init__(self):
+        self._root = _ContextNode()
+        self._live = 0
+        self._drain_waiters = []
+        self.started = 0
+        self.finished = 0
+        self.unmatched = 0
+
+    def __len__(self):
+        return self._live
+
+    def drained(self):
+        return self._live == int(self._root.context is not None)
+
+    async def wait_drained(self):
+        while not self.drained():
+            fut = asyncio.get_event_loop().create_future()
+            self._drain_waiters.append(fut)
+            await fut
+
+    def _segments(self, name):
+        if name:
+            return name.split('/')
+        return []
+
+    def closest(self, name):
+        """Find the live context with the longest prefix of name.
+
+        Returns the context and the rest of the name after that prefix,
+        or (None, None) if there is no such context.
+        """
+        segments = self._segments(name)
+        node = self._root
+        found, depth = node.context, 0
+        for i, segment in enumerate(segments):
+            node = node.children.get(segment)
+            if node is None:
+                break
+            if node.context is not None:
+                found, depth = node.context, i + 1
+        if found is None:
+            return None, None
+        return found, '/'.join(segments[depth:])
+
+    def add(self, name, context):
+        node = self._root
+        segments = self._segments(name)
+        for segment in segments:
+            node = node.children.setdefault(segment, _ContextNode())
+        if node.context is None:
+            self._live += 1
+        node.context = context
+        if segments:
+            self.started += 1
+
+    def pop(self, name):
+        """Remove and return the context for name, or None."""
+        path = [self._root]
+        segments = self._segments(name)
+        for segment in segments:
+            node = path[-1].children.get(segment)
+            if node is None:
+                self.unmatched += 1
+                return None
+            path.append(node)
+        context = path[-1].context
+        if context is None:
+            if segments:
+                self.unmatched += 1
+            return None
+        path[-1].context = None
+        self._live -= 1
+        if segments:
+            self.finished += 1
+        if self.drained():
+            waiters, self._drain_waiters = self._drain_waiters, []
+            for fut in waiters:
+                if not fut.done():
+                    fut.set_result(None)
+        # Prune nodes that no longer lead to any live context.
+        for i in range(len(segments), 0, -1):
+            node = path[i]
+            if node.context is not None or node.children:
+                break
+            del path[i - 1].children[segments[i - 1]]
+        return context
+
+    def live_names(self):
+        names = []
+        todo = [('', self._root)]
+        while todo:
+            name, node = todo.pop()
+            if node.context is not None:
+                names.append(name)
+            for segment, child in node.children.items():
+                todo.append((name + '/' + segment if name else segment, child))
+        return sorted(names)
+
+
+class InstallStages:
+    """Run the stages of the install, each once its dependencies are done.
+
+    Stages that do not depend on each other run concurrently. The wall
+    time each stage took is recorded in self.timings (stages that did not
+    complete are left out).
+    """
+
+    def __init__(self):
+        self.stages = {}  # name -> (coroutine function, names of deps)
+        self.timings = {}
+
+    def add(self, name, func, after=()):
+        for dep in after:
+            if dep not in self.stages:
+                raise Exception(
+                    "stage {} depends on unknown stage {}".format(name, dep))
+        self.stages[name] = (func, after)
+
+    async def _run_stage(self, name, tasks):
+        func, after = self.stages[name]
+        for dep in after:
+            await tasks[dep]
+        start = time.monotonic()
+        await func()
+        self.timings[name] = time.monotonic() - start
+        log.debug("install stage %s took %.3fs", name, self.timings[name])
+
+    async def run(self):
+        tasks = {}
+        for name in self.stages:
+            tasks[name] = asyncio.ensure_future(self._run_stage(name, tasks))
+        try:
+            done, pending = await asyncio.wait(
+                tasks.values(), return_when=asyncio.FIRST_EXCEPTION)
+            for task in done:
+                task.result()
+        finally:
+            for task in tasks.values():
+                task.cancel()
+        log.info("install stage timings: %s", ", ".join(
+            "{} {:.1f}s".format(name, self.timings[name])
+            for name in self.stages))
 
 
 def install_step(label, level=None, childlevel=None):
@@ -98,7 +315,10 @@ class InstallProgressController(SubiquityController):
     def __init__(self, app):
         super().__init__(app)
         self.model = app.base_model
-        self.progress_view = ProgressView(self)
+        # Installer output that scrolls out of the log view's memory is
+        # kept on disk so that the whole of it can still be viewed.
+        self.progress_view = ProgressView(
+            self, os.path.join(app.log_dir, 'installer-output.log'))
         self.install_state = InstallState.NOT_STARTED
         self.journal_listener_handle = None
 
@@ -111,8 +331,14 @@ class InstallProgressController(SubiquityController):
         self._event_syslog_identifier = 'curtin_event.%s' % (os.getpid(),)
         self._log_syslog_identifier = 'curtin_log.%s' % (os.getpid(),)
         self.tb_extractor = TracebackExtractor()
-        self.curtin_event_contexts = {}
+        self.curtin_event_contexts = CurtinEventContexts()
+        # Progress view updates not yet applied: log lines, and for each
+        # curtin context that has started or finished, [message, started,
+        # finished].
+        self._pending_log_lines = []
+        self._pending_events = {}
         self.confirmation = asyncio.Event()
+        self.cloud_init_files = None
 
     def interactive(self):
         return self.app.interactive()
@@ -148,11 +374,27 @@ class InstallProgressController(SubiquityController):
         return ['systemd-cat', '--level-prefix=false',
                 '--identifier=' + self._log_syslog_identifier] + cmd
 
-    def _journal_event(self, event):
-        if event['SYSLOG_IDENTIFIER'] == self._event_syslog_identifier:
-            self.curtin_event(event)
-        elif event['SYSLOG_IDENTIFIER'] == self._log_syslog_identifier:
-            self.curtin_log(event)
+    def _journal_events(self, events):
+        for event in events:
+            if event['SYSLOG_IDENTIFIER'] == self._event_syslog_identifier:
+                self.curtin_event(event)
+            elif event['SYSLOG_IDENTIFIER'] == self._log_syslog_identifier:
+                self.curtin_log(event)
+        self._update_progress_view()
+
+    def _update_progress_view(self):
+        if self._pending_log_lines:
+            self.progress_view.add_log_lines(self._pending_log_lines)
+            self._pending_log_lines = []
+        for context, (message, started, finished) in (
+                self._pending_events.items()):
+            if started and finished:
+                self.progress_view.event_start_and_finish(context, message)
+            elif started:
+                self.progress_view.event_start(context, message)
+            else:
+                self.progress_view.event_finish(context)
+        self._pending_events = {}
 
     @contextlib.contextmanager
     def install_context(self, context, name, description,
@@ -178,46 +420,52 @@ class InstallProgressController(SubiquityController):
                 e[k[len(prefix):]] = v
         event_type = e["EVENT_TYPE"]
         if event_type == 'start':
-            def p(name):
-                parts = name.split('/')
-                for i in range(len(parts), -1, -1):
-                    yield '/'.join(parts[:i]), '/'.join(parts[i:])
-
             curtin_ctx = None
-            for pre, post in p(e["NAME"]):
-                if pre in self.curtin_event_contexts:
-                    parent = self.curtin_event_contexts[pre]
-                    curtin_ctx = parent.child(post, e["MESSAGE"])
-                    self.curtin_event_contexts[e["NAME"]] = curtin_ctx
-                    break
+            parent, rest = self.curtin_event_contexts.closest(e["NAME"])
+            if parent is not None:
+                curtin_ctx = parent.child(rest, e["MESSAGE"])
+                self.curtin_event_contexts.add(e["NAME"], curtin_ctx)
             if curtin_ctx:
                 curtin_ctx.enter()
-                self.progress_view.event_start(curtin_ctx, e["MESSAGE"])
+                self._pending_events[curtin_ctx] = [
+                    e["MESSAGE"], True, False]
         if event_type == 'finish':
             status = getattr(Status, e["RESULT"], Status.WARN)
-            curtin_ctx = self.curtin_event_contexts.pop(e["NAME"], None)
+            curtin_ctx = self.curtin_event_contexts.pop(e["NAME"])
             if curtin_ctx is not None:
                 curtin_ctx.exit(status)
-                self.progress_view.event_finish(curtin_ctx)
+                pending = self._pending_events.setdefault(
+                    curtin_ctx, [None, False, False])
+                pending[2] = True
 
     def curtin_log(self, event):
         log_line = event['MESSAGE']
-        self.progress_view.add_log_line(log_line)
+        self._pending_log_lines.append(log_line)
         self.tb_extractor.feed(log_line)
 
     def start_journald_listener(self, identifiers, callback):
+        # callback is called with lists of journal records, at most every
+        # JOURNAL_BATCH_INTERVAL seconds.
         reader = journal.Reader()
         args = []
         for identifier in identifiers:
             args.append("SYSLOG_IDENTIFIER={}".format(identifier))
         reader.add_match(*args)
+        loop = asyncio.get_event_loop()
+        batch = []
+
+        def flush():
+            events = batch[:]
+            del batch[:]
+            callback(events)
 
         def watch():
             if reader.process() != journal.APPEND:
                 return
-            for event in reader:
-                callback(event)
-        loop = asyncio.get_event_loop()
+            was_empty = not batch
+            batch.extend(reader)
+            if was_empty and batch:
+                loop.call_later(JOURNAL_BATCH_INTERVAL, flush)
         return loop.add_reader(reader.fileno(), watch)
 
     def _write_config(self, path, config):
@@ -273,11 +521,11 @@ class InstallProgressController(SubiquityController):
     async def curtin_install(self, context):
         log.debug('curtin_install')
         self.install_state = InstallState.RUNNING
-        self.curtin_event_contexts[''] = context
+        self.curtin_event_contexts.add('', context)
 
         self.journal_listener_handle = self.start_journald_listener(
             [self._event_syslog_identifier, self._log_syslog_identifier],
-            self._journal_event)
+            self._journal_events)
 
         curtin_cmd = self._get_curtin_command()
 
@@ -295,24 +543,22 @@ class InstallProgressController(SubiquityController):
         pass
 
     async def install(self, context):
-        try:
+        stages = InstallStages()
+
+        async def prepare():
             await asyncio.wait(
                 {e.wait() for e in self.model.install_events})
-
             await self.confirmation.wait()
-
             if os.path.exists(self.model.target):
                 await self.unmount_target(context, self.model.target)
 
-            await self.curtin_install(context)
-
-            await asyncio.wait(
-                {e.wait() for e in self.model.postinstall_events})
-
+        async def drain():
             await self.drain_curtin_events(context)
 
+        async def postinstall():
             await self.postinstall(context)
 
+        async def complete():
             self.ui.set_header(_("Installation complete!"))
             self.progress_view.set_status(_("Finished install!"))
             self.progress_view.show_complete()
@@ -322,7 +568,23 @@ class InstallProgressController(SubiquityController):
                 await self.run_unattended_upgrades(context)
                 self.progress_view.update_done()
 
+        async def copy_logs():
             await self.copy_logs_to_target(context)
+
+        # Everything the postinstall configuration needs is known once
+        # the postinstall events are set, so it is rendered while curtin
+        # runs and only written to the target once curtin is done.
+        stages.add('prepare', prepare)
+        stages.add('curtin', lambda: self.curtin_install(context), ['prepare'])
+        stages.add(
+            'render_config', self.render_postinstall_config, ['prepare'])
+        stages.add('drain', drain, ['curtin', 'render_config'])
+        stages.add('postinstall', postinstall, ['drain'])
+        stages.add('complete', complete, ['postinstall'])
+        stages.add('copy_logs', copy_logs, ['complete'])
+
+        try:
+            await stages.run()
         except Exception:
             self.curtin_error()
             if not self.interactive():
@@ -336,50 +598,122 @@ class InstallProgressController(SubiquityController):
             run_command(["chreipl", "/target/boot"])
         self.app.next_screen()
 
-    async def drain_curtin_events(self, context):
-        waited = 0.0
-        while self.progress_view.ongoing and waited < 5.0:
-            await asyncio.sleep(0.1)
-            waited += 0.1
-        log.debug("waited %s seconds for events to drain", waited)
-        self.curtin_event_contexts.pop('', None)
-
-    @install_step(
-        "final system configuration", level="INFO", childlevel="DEBUG")
-    async def postinstall(self, context):
+    async def drain_curtin_events(self, context,
+                                  timeout=CURTIN_EVENT_DRAIN_TIMEOUT):
+        contexts = self.curtin_event_contexts
+        start = time.monotonic()
+        try:
+            await asyncio.wait_for(contexts.wait_drained(), timeout)
+        except asyncio.TimeoutError:
+            log.warning(
+                "timed out after %ss waiting for curtin events to drain",
+                timeout)
+        log.debug(
+            "waited %.3f seconds for events to drain",
+            time.monotonic() - start)
+        contexts.pop('')
+        log.debug(
+            "curtin events: %d started, %d finished, %d unmatched finishes",
+            contexts.started, contexts.finished, contexts.unmatched)
+        if len(contexts) > 0:
+            log.warning(
+                "curtin events started but never finished: %s",
+                contexts.live_names())
+
+    async def render_postinstall_config(self):
+        await asyncio.wait(
+            {e.wait() for e in self.model.postinstall_events})
         autoinstall_path = os.path.join(
             self.app.root, 'var/log/installer/autoinstall-user-data')
         autoinstall_config = "#cloud-config\n" + yaml.dump(
             {"autoinstall": self.app.make_autoinstall()})
         write_file(autoinstall_path, autoinstall_config, mode=0o600)
+        self.cloud_init_files = await run_in_thread(
+            self.model._cloud_init_files)
+
+    @install_step(
+        "final system configuration", level="INFO", childlevel="DEBUG")
+    async def postinstall(self, context):
         await self.configure_cloud_init(context)
         packages = []
         if self.model.ssh.install_server:
             packages = ['openssh-server']
         packages.extend(self.app.base_model.packages)
-        for package in packages:
-            subcontext = self.install_context(
-                context,
-                "install_{}".format(package),
-                "installing {}".format(package))
-            with subcontext:
-                await self.install_package(package)
+        if packages:
+            await self.install_packages(context, packages)
         await self.restore_apt_config(context)
 
     @install_step("configuring cloud-init")
     async def configure_cloud_init(self, context):
-        await run_in_thread(self.model.configure_cloud_init)
+        await run_in_thread(
+            self.model.configure_cloud_init, self.cloud_init_files)
+
+    async def install_packages(self, context, packages):
+        # All the packages are installed by a single apt-get run. Each
+        # one still gets its own context, which is finished when apt
+        # reports setting the package up (or when apt-get exits, for
+        # packages that were already installed).
+        pending = {}
+        for package in packages:
+            # apt reports "Setting up name:arch (version)" for
+            # "name:arch", "name=version" and "name/release".
+            name = re.split('[=/:]', package)[0]
+            if name in pending:
+                # apt only sets each package up once, e.g. for "foo" and
+                # "foo=1.2", so only the first gets a context.
+                continue
+            stack = pending[name] = contextlib.ExitStack()
+            stack.enter_context(self.install_context(
+                context, "install_{}".format(package),
+                "installing {}".format(package)))
+
+        def finish(name, exc=None):
+            stack = pending.pop(name)
+            if exc is None:
+                stack.close()
+            else:
+                stack.__exit__(type(exc), exc, exc.__traceback__)
 
-    async def install_package(self, package):
         if self.opts.dry_run:
-            cmd = ["sleep", str(2/self.app.scale_factor)]
+            delay = 2/self.app.scale_factor
+            cmd = ["sh", "-c", "".join(
+                "sleep {}; echo {}; ".format(delay, shlex.quote(
+                    "Setting up {} (1.0) ...".format(name)))
+                for name in pending)]
         else:
             cmd = [
                 sys.executable, "-m", "curtin", "system-install", "-t",
                 "/target",
-                "--", package,
-                ]
-        await arun_command(self.logged_command(cmd), check=True)
+                "--",
+                ] + packages
+        # This does not use logged_command: the output is read here to
+        # follow apt's progress, and is passed on to the journal under
+        # the same identifier as systemd-cat would use.
+        proc = None
+        try:
+            proc = await astart_command(cmd, stderr=subprocess.STDOUT)
+            while True:
+                line = await proc.stdout.readline()
+                if not line:
+                    break
+                line = line.decode('utf-8', 'replace').rstrip('\n')
+                journal.send(
+                    line, SYSLOG_IDENTIFIER=self._log_syslog_identifier)
+                m = APT_SETTING_UP.match(line)
+                if m and m.group(1) in pending:
+                    finish(m.group(1))
+            await proc.wait()
+            if proc.returncode != 0:
+                raise subprocess.CalledProcessError(proc.returncode, cmd)
+        except BaseException as e:
+            if proc is not None and proc.returncode is None:
+                proc.kill()
+                await proc.wait()
+            for name in list(pending):
+                finish(name, e)
+            raise
+        for name in list(pending):
+            finish(name)
 
     @install_step("restoring apt configuration")
     async def restore_apt_config(self, context):
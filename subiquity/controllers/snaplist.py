@@ -13,7 +13,10 @@
 # You should have received a copy of the GNU Affero General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
+import asyncio
+import itertools
 import logging
+import os
 
 import requests.exceptions
 
@@ -29,25 +32,55 @@ from subiquity.controller import (
     )
 
 from subiquity.models.snaplist import SnapSelection
+from subiquity.snapd import SnapdResponseCache
 from subiquity.ui.views.snaplist import SnapListView
 
 log = logging.getLogger('subiquity.controllers.snaplist')
 
+# How many snap info requests to have in flight at once.
+SNAP_INFO_CONCURRENCY = 4
+
+# Info for snaps the user has asked to look at is fetched before info
+# for the rest of the list.
+PRIORITY_USER = 0
+PRIORITY_BACKGROUND = 1
+
+# Store responses are cached under the state dir. Cached responses older
+# than this (in seconds) are shown but refreshed in the background.
+SNAP_CACHE_TTL = 60 * 60
+# Responses to start the cache with, if the install media has them.
+SNAP_CACHE_SEED = '/cdrom/.disk/snap-store-cache.json'
+
 
 class SnapdSnapInfoLoader:
 
-    def __init__(self, model, snapd, store_section, context):
+    def __init__(self, model, snapd, store_section, context,
+                 concurrency=SNAP_INFO_CONCURRENCY, cache=None,
+                 list_refreshed=None):
         self.model = model
         self.store_section = store_section
         self.context = context
+        self.concurrency = concurrency
+        self.cache = cache
+        # Called when the list of snaps shown from the cache has been
+        # refreshed from the store.
+        self.list_refreshed = list_refreshed
 
         self.main_task = None
+        self.list_refresh_task = None
         self.snap_list_fetched = False
         self.failed = False
 
         self.snapd = snapd
-        self.pending_info_snaps = []
-        self.tasks = {}  # {snap:task}
+        # {snap:task} for the list (under None) and {snap:future} for
+        # the info of each snap, which is resolved by a worker.
+        self.tasks = {}
+        self.queue = asyncio.PriorityQueue()
+        self.queue_counter = itertools.count()
+        self.fetching = set()
+        # Snaps whose info has been fetched from the store (successfully
+        # or not), as opposed to just loaded from the cache.
+        self.fetched = set()
 
     def start(self):
         log.debug("loading list of snaps")
@@ -57,29 +90,126 @@ class SnapdSnapInfoLoader:
         with self.context:
             task = self.tasks[None] = schedule_task(self._load_list())
             await task
-            self.pending_snaps = self.model.get_snap_list()
-            log.debug("fetched list of %s snaps", len(self.pending_snaps))
-            while self.pending_snaps:
-                snap = self.pending_snaps.pop(0)
-                task = self.tasks[snap] = schedule_task(
-                    self._fetch_info_for_snap(snap))
-                await task
+            snaps = self.model.get_snap_list()
+            log.debug("fetched list of %s snaps", len(snaps))
+            self._enqueue_new_snaps()
+            workers = [
+                schedule_task(self._worker())
+                for i in range(self.concurrency)
+                ]
+            try:
+                # Refreshing the list can add snaps to the queue.
+                if self.list_refresh_task is not None:
+                    await self.list_refresh_task
+                await self.queue.join()
+            finally:
+                for worker in workers:
+                    worker.cancel()
+            if self.cache is not None:
+                await self.cache.save()
+
+    def _enqueue_new_snaps(self):
+        for snap in self.model.get_snap_list():
+            if snap in self.tasks:
+                continue
+            if not self._load_cached_info(snap):
+                self._enqueue(snap, PRIORITY_BACKGROUND)
+
+    def _info_future(self, snap):
+        if snap not in self.tasks:
+            self.tasks[snap] = asyncio.get_event_loop().create_future()
+        return self.tasks[snap]
+
+    def _load_cached_info(self, snap):
+        # Returns True if the cached info is fresh enough to not need
+        # fetching again.
+        if self.cache is None:
+            return False
+        data, expired = self.cache.get('v2/find', name=snap.name)
+        if data is None:
+            return False
+        self.model.load_info_data(data)
+        fut = self._info_future(snap)
+        if not fut.done():
+            fut.set_result(None)
+        return not expired
+
+    def _enqueue(self, snap, priority):
+        self._info_future(snap)
+        # A snap can be queued more than once if the user asks for it
+        # while it is still waiting in the background: whichever entry
+        # comes out of the queue first does the fetching.
+        self.queue.put_nowait((priority, next(self.queue_counter), snap))
+
+    async def _worker(self):
+        while True:
+            priority, count, snap = await self.queue.get()
+            try:
+                fut = self.tasks[snap]
+                if snap in self.fetched or snap in self.fetching:
+                    continue
+                self.fetching.add(snap)
+                try:
+                    await self._fetch_info_for_snap(snap)
+                except Exception as exc:
+                    # Keep going: if the workers died, nothing else in the
+                    # queue would ever be fetched.
+                    log.exception("loading info for %s failed", snap.name)
+                    if not fut.done():
+                        fut.set_exception(exc)
+                        # Already logged, whether or not anyone is
+                        # waiting for this snap's info.
+                        fut.exception()
+                    continue
+                finally:
+                    self.fetching.discard(snap)
+                    self.fetched.add(snap)
+                if not fut.done():
+                    fut.set_result(None)
+            finally:
+                self.queue.task_done()
 
     async def _load_list(self):
+        if self.cache is not None:
+            data, expired = self.cache.get(
+                'v2/find', section=self.store_section)
+            if data is not None:
+                log.debug("loaded list of snaps from cache")
+                self.model.load_find_data(data)
+                self.snap_list_fetched = True
+                if expired:
+                    self.list_refresh_task = schedule_task(
+                        self._fetch_list(refresh=True))
+                return
+        await self._fetch_list()
+
+    async def _fetch_list(self, refresh=False):
         with self.context.child("list"):
             try:
                 result = await self.snapd.get(
                     'v2/find', section=self.store_section)
             except requests.exceptions.RequestException:
                 log.exception("loading list of snaps failed")
-                self.failed = True
+                if not refresh:
+                    self.failed = True
                 return
             self.model.load_find_data(result)
             self.snap_list_fetched = True
+            if self.cache is not None:
+                self.cache.put(result, 'v2/find', section=self.store_section)
+            if refresh:
+                self._enqueue_new_snaps()
+                if self.list_refreshed is not None:
+                    self.list_refreshed()
 
     def stop(self):
         if self.main_task is not None:
             self.main_task.cancel()
+        if self.list_refresh_task is not None:
+            self.list_refresh_task.cancel()
+        for snap, fut in self.tasks.items():
+            if snap is not None:
+                fut.cancel()
 
     async def _fetch_info_for_snap(self, snap):
         with self.context.child("fetch").child(snap.name):
@@ -90,15 +220,15 @@ class SnapdSnapInfoLoader:
                 # XXX something better here?
                 return
             self.model.load_info_data(data)
+            if self.cache is not None:
+                self.cache.put(data, 'v2/find', name=snap.name)
 
     def get_snap_list_task(self):
         return self.tasks[None]
 
     def get_snap_info_task(self, snap):
-        if snap not in self.tasks:
-            if snap in self.pending_snaps:
-                self.pending_snaps.remove(snap)
-            self.tasks[snap] = schedule_task(self._fetch_info_for_snap(snap))
+        if snap not in self.tasks or not self.tasks[snap].done():
+            self._enqueue(snap, PRIORITY_USER)
         return self.tasks[snap]
 
 
@@ -125,9 +255,13 @@ class SnapListController(SubiquityController):
     ]
 
     def _make_loader(self):
+        cache = SnapdResponseCache(
+            os.path.join(self.app.state_dir, 'snap-cache.json'),
+            SNAP_CACHE_TTL, SNAP_CACHE_SEED)
         return SnapdSnapInfoLoader(
             self.model, self.app.snapd, self.opts.snap_section,
-            self.context.child("loader"))
+            self.context.child("loader"), cache=cache,
+            list_refreshed=self._snap_list_refreshed)
 
     def __init__(self, app):
         super().__init__(app)
@@ -167,6 +301,10 @@ class SnapListController(SubiquityController):
             return
         self.ui.set_body(SnapListView(self.model, self))
 
+    def _snap_list_refreshed(self):
+        if isinstance(self.ui.body, SnapListView):
+            self.ui.body.snap_list_refreshed()
+
     def get_snap_list_task(self):
         return self.loader.get_snap_list_task()
 
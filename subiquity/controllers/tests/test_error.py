@@ -0,0 +1,92 @@
+# Copyright 2020 Canonical, Ltd.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import asyncio
+import json
+import os
+import unittest
+
+from subiquitycore.context import Context
+from subiquitycore.tests import SubiTestCase
+
+from subiquity.controllers.error import (
+    ErrorReport,
+    ErrorReportKind,
+    ErrorReportState,
+    log_tail,
+    )
+
+
+class MiniController:
+    project = "mini"
+
+    def __init__(self, crash_directory):
+        self.crash_directory = crash_directory
+        self.context = Context.new(self)
+
+    def report_start_event(*args): pass
+    def report_finish_event(*args): pass
+
+
+class TestLogTail(unittest.TestCase):
+
+    def test_short(self):
+        self.assertEqual(log_tail("a\n  b  \nc\n", 100), "a\nb\nc")
+
+    def test_budget(self):
+        text = "".join("line {}\n".format(i) for i in range(1000))
+        self.assertEqual(log_tail(text, 24), "line 997\nline 998\nline 999")
+
+    def test_long_last_line(self):
+        self.assertEqual(log_tail("a\n" + "x" * 100, 50), "")
+
+    def test_bytes(self):
+        self.assertEqual(log_tail(b"a\nb\n", 1), "b")
+
+
+class TestErrorReportFromFile(SubiTestCase):
+
+    def make_report(self, meta=None):
+        crash_dir = self.tmp_dir()
+        path = os.path.join(crash_dir, '1.ui.crash')
+        with open(path, 'w') as fp:
+            fp.write("ProblemType: Bug\n")
+        if meta is not None:
+            with open(os.path.join(crash_dir, '1.ui.meta'), 'w') as fp:
+                json.dump(meta, fp)
+        return ErrorReport.from_file(MiniController(crash_dir), path)
+
+    def test_index_from_meta(self):
+        report = self.make_report({'kind': 'UI', 'date': 'then'})
+        self.assertEqual(report.state, ErrorReportState.LOADING)
+        self.assertIsNone(report._file)
+        self.assertEqual(report.kind, ErrorReportKind.UI)
+        self.assertEqual(report.date, 'then')
+
+    def test_date_from_stat(self):
+        report = self.make_report()
+        self.assertNotEqual(report.date, '???')
+
+    def test_ensure_loaded(self):
+        report = self.make_report({'kind': 'UI'})
+
+        async def run():
+            task = report.ensure_loaded()
+            self.assertIs(report.ensure_loaded(), task)
+            await task
+        asyncio.run(run())
+        self.assertEqual(report.state, ErrorReportState.DONE)
+        self.assertIsNone(report._file)
+        self.assertIsNone(report.ensure_loaded())
@@ -13,7 +13,9 @@
 # You should have received a copy of the GNU Affero General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
+import asyncio
 import unittest
+from unittest import mock
 
 from subiquitycore.context import Context
 from subiquity.controllers.filesystem import (
@@ -42,10 +44,47 @@ class MiniApplication:
     opts = Thing()
     opts.dry_run = True
     opts.bootloader = None
+    prober = Thing()
+    prober.saved_config = {}
     def report_start_event(*args): pass
     def report_finish_event(*args): pass
 
 
+class FakeTimer:
+
+    def __init__(self, when, callback):
+        self.when = when
+        self.callback = callback
+        self.cancelled = False
+
+    def cancel(self):
+        self.cancelled = True
+
+
+class FakeTimerLoop:
+    # Runs call_at timers when advance() moves its clock past them.
+
+    def __init__(self):
+        self.now = 0.0
+        self.timers = []
+
+    def time(self):
+        return self.now
+
+    def call_at(self, when, callback):
+        timer = FakeTimer(when, callback)
+        self.timers.append(timer)
+        return timer
+
+    def advance(self, seconds):
+        self.now += seconds
+        for timer in sorted(self.timers, key=lambda t: t.when):
+            if timer.when <= self.now:
+                self.timers.remove(timer)
+                if not timer.cancelled:
+                    timer.callback()
+
+
 def make_controller(bootloader=None):
     app = MiniApplication()
     app.base_model = bm = Thing()
@@ -63,6 +102,68 @@ def make_controller_and_disk(bootloader=None):
 
 class TestFilesystemController(unittest.TestCase):
 
+    @mock.patch(
+        'subiquity.controllers.filesystem.block_device_fingerprints',
+        lambda: {'/dev/sda': {}})
+    def test_probe_cache_only_used_when_asked(self):
+        controller = make_controller()
+        controller._probe_cache = cache = mock.Mock()
+        cache.load.return_value = {'cached': True}
+        controller.app.prober = prober = mock.Mock()
+        prober.get_storage_by_type.return_value = ({'fresh': True}, {})
+
+        storage, failures = asyncio.run(
+            controller._get_storage_by_type(use_cache=True))
+        self.assertEqual(storage, {'cached': True})
+        prober.get_storage_by_type.assert_not_called()
+
+        # A re-probe after a udev event must probe again, even if the
+        # fingerprints have not changed, and updates the cache.
+        cache.load.reset_mock()
+        storage, failures = asyncio.run(
+            controller._get_storage_by_type(use_cache=False))
+        self.assertEqual(storage, {'fresh': True})
+        cache.load.assert_not_called()
+        cache.save.assert_called_once_with({'/dev/sda': {}}, {'fresh': True})
+
+    def make_reprobing_controller(self):
+        controller = make_controller()
+        controller._probe_task = mock.Mock()
+        loop = FakeTimerLoop()
+        p = mock.patch(
+            'subiquity.controllers.filesystem.asyncio.get_event_loop',
+            return_value=loop)
+        p.start()
+        self.addCleanup(p.stop)
+        return controller, loop
+
+    def test_udev_burst_probes_once(self):
+        controller, loop = self.make_reprobing_controller()
+        for i in range(4):
+            controller._schedule_reprobe()
+            loop.advance(0.5)
+        controller._probe_task.start_sync.assert_not_called()
+        loop.advance(0.5)
+        controller._probe_task.start_sync.assert_called_once_with()
+
+    def test_long_udev_burst_probes_after_max_delay(self):
+        controller, loop = self.make_reprobing_controller()
+        for i in range(12):
+            controller._schedule_reprobe()
+            loop.advance(0.5)
+        # 5s after the first event, and then once the rest are over.
+        self.assertEqual(controller._probe_task.start_sync.call_count, 1)
+        loop.advance(1)
+        self.assertEqual(controller._probe_task.start_sync.call_count, 2)
+
+    def test_start_ui_flushes_pending_reprobe(self):
+        controller, loop = self.make_reprobing_controller()
+        controller._schedule_reprobe()
+        controller._flush_reprobe()
+        controller._probe_task.start_sync.assert_called_once_with()
+        loop.advance(10)
+        controller._probe_task.start_sync.assert_called_once_with()
+
     def test_delete_encrypted_vg(self):
         controller, disk = make_controller_and_disk()
         spec = {
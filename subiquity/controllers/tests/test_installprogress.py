@@ -0,0 +1,338 @@
+# Copyright 2020 Canonical, Ltd.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import asyncio
+import unittest
+from unittest import mock
+
+from subiquitycore.context import Context, Status
+
+from subiquity.controllers.installprogress import (
+    APT_SETTING_UP,
+    CurtinEventContexts,
+    InstallProgressController,
+    InstallStages,
+    TracebackExtractor,
+    )
+
+
+class Thing:
+    # Just something to hang attributes off
+    pass
+
+
+class MiniApplication:
+    ui = signal = loop = base_model = None
+    project = "mini"
+    autoinstall_config = {}
+    answers = {}
+    opts = Thing()
+    opts.dry_run = True
+    scale_factor = 1000
+    log_dir = '/nonexistent'
+
+    def __init__(self):
+        self.finished = []
+        self.context = Context.new(self)
+
+    def report_start_event(*args): pass
+
+    def report_finish_event(self, context, description, result):
+        self.finished.append((context.name, result))
+
+
+class TestCurtinEventContexts(unittest.TestCase):
+
+    def test_closest(self):
+        contexts = CurtinEventContexts()
+        self.assertEqual(contexts.closest('a/b'), (None, None))
+        contexts.add('', 'root')
+        contexts.add('a', 'a')
+        self.assertEqual(contexts.closest('a/b/c'), ('a', 'b/c'))
+        self.assertEqual(contexts.closest('x/y'), ('root', 'x/y'))
+        contexts.add('a/b/c', 'c')
+        self.assertEqual(contexts.closest('a/b/c/d'), ('c', 'd'))
+        self.assertEqual(contexts.closest('a/b/e'), ('a', 'b/e'))
+
+    def test_pop(self):
+        contexts = CurtinEventContexts()
+        contexts.add('', 'root')
+        contexts.add('a/b', 'b')
+        contexts.add('a/b/c', 'c')
+        self.assertEqual(len(contexts), 3)
+        self.assertIs(contexts.pop('a'), None)
+        self.assertEqual(contexts.pop('a/b'), 'b')
+        self.assertEqual(contexts.closest('a/b/d'), ('root', 'a/b/d'))
+        self.assertEqual(contexts.closest('a/b/c/d'), ('c', 'd'))
+        self.assertEqual(contexts.live_names(), ['', 'a/b/c'])
+        self.assertEqual(contexts.pop('a/b/c'), 'c')
+        self.assertEqual(contexts._root.children, {})
+        self.assertEqual(len(contexts), 1)
+        self.assertEqual(
+            (contexts.started, contexts.finished, contexts.unmatched),
+            (2, 2, 1))
+        # The root is not a curtin event.
+        self.assertEqual(contexts.pop(''), 'root')
+        self.assertIs(contexts.pop(''), None)
+        self.assertEqual(len(contexts), 0)
+        self.assertEqual(
+            (contexts.started, contexts.finished, contexts.unmatched),
+            (2, 2, 1))
+
+    def test_wait_drained(self):
+        async def run():
+            contexts = CurtinEventContexts()
+            contexts.add('', 'root')
+            contexts.add('a', 'a')
+            contexts.add('a/b', 'b')
+            waiter = asyncio.ensure_future(contexts.wait_drained())
+            await asyncio.sleep(0)
+            contexts.pop('a/b')
+            await asyncio.sleep(0)
+            self.assertFalse(waiter.done())
+            contexts.pop('a')
+            await asyncio.sleep(0)
+            self.assertTrue(waiter.done())
+            self.assertTrue(contexts.drained())
+        asyncio.run(run())
+
+
+class TestDrainCurtinEvents(unittest.TestCase):
+
+    def test_timeout(self):
+        async def run():
+            app = MiniApplication()
+            app.aio_loop = asyncio.get_running_loop()
+            controller = InstallProgressController(app)
+            contexts = controller.curtin_event_contexts
+            contexts.add('', app.context)
+            contexts.add('a', app.context.child('a'))
+            with self.assertLogs(
+                    'subiquitycore.controller.installprogress') as cm:
+                await controller.drain_curtin_events(
+                    app.context, timeout=0.01)
+            return cm.output
+        output = asyncio.run(run())
+        self.assertIn(
+            "curtin events started but never finished: ['a']",
+            output[-1])
+
+
+class FakeProc:
+    # Stands in for the process astart_command starts. Its output is
+    # lines, then it blocks until killed if hang is true.
+
+    def __init__(self, lines, hang=False):
+        self.stdout = self
+        self.lines = [line.encode('utf-8') + b'\n' for line in lines]
+        self.hang = hang
+        self.killed = asyncio.Event()
+        self.returncode = None
+        self.on_wait = None
+
+    async def readline(self):
+        if self.lines:
+            return self.lines.pop(0)
+        if self.hang:
+            await self.killed.wait()
+        return b''
+
+    def kill(self):
+        self.returncode = -9
+        self.killed.set()
+
+    async def wait(self):
+        if self.on_wait is not None:
+            self.on_wait()
+        if self.returncode is None:
+            self.returncode = 0
+        return self.returncode
+
+
+class TestInstallPackages(unittest.TestCase):
+
+    def test_setting_up(self):
+        m = APT_SETTING_UP.match("Setting up libc6:amd64 (2.31-0ubuntu9) ...")
+        self.assertEqual(m.group(1), "libc6")
+        self.assertIsNone(APT_SETTING_UP.match("Unpacking vim (2:8.1) ..."))
+
+    def test_install_packages(self):
+        async def run():
+            app = MiniApplication()
+            app.aio_loop = asyncio.get_running_loop()
+            controller = InstallProgressController(app)
+            context = app.context.child("postinstall")
+            await controller.install_packages(
+                context, ['openssh-server', 'vim=2:8.1'])
+            return app, controller
+        app, controller = asyncio.run(run())
+        self.assertEqual(app.finished, [
+            ('install_openssh-server', Status.SUCCESS),
+            ('install_vim=2:8.1', Status.SUCCESS),
+            ])
+        self.assertEqual(controller.progress_view.ongoing, {})
+
+    def test_install_packages_same_name(self):
+        async def run():
+            app = MiniApplication()
+            app.aio_loop = asyncio.get_running_loop()
+            controller = InstallProgressController(app)
+            context = app.context.child("postinstall")
+            await controller.install_packages(context, ['vim', 'vim=2:8.1'])
+            return app, controller
+        app, controller = asyncio.run(run())
+        self.assertEqual(app.finished, [('install_vim', Status.SUCCESS)])
+        self.assertEqual(controller.progress_view.ongoing, {})
+
+    def test_install_packages_arch(self):
+        proc = FakeProc(["Setting up libc6:i386 (2.31-0ubuntu9) ..."])
+
+        async def run():
+            app = MiniApplication()
+            app.aio_loop = asyncio.get_running_loop()
+            controller = InstallProgressController(app)
+            context = app.context.child("postinstall")
+            # The package has to be finished by the time apt exits.
+            proc.on_wait = lambda: finished_at_exit.extend(app.finished)
+            with mock.patch(
+                    'subiquity.controllers.installprogress.astart_command',
+                    return_value=proc):
+                await controller.install_packages(context, ['libc6:i386'])
+        finished_at_exit = []
+        asyncio.run(run())
+        self.assertEqual(
+            finished_at_exit, [('install_libc6:i386', Status.SUCCESS)])
+
+    def test_install_packages_cancelled(self):
+        proc = FakeProc([], hang=True)
+
+        async def run():
+            app = MiniApplication()
+            app.aio_loop = asyncio.get_running_loop()
+            controller = InstallProgressController(app)
+            context = app.context.child("postinstall")
+            with mock.patch(
+                    'subiquity.controllers.installprogress.astart_command',
+                    return_value=proc):
+                task = asyncio.ensure_future(
+                    controller.install_packages(context, ['vim']))
+                await asyncio.sleep(0)
+                task.cancel()
+                with self.assertRaises(asyncio.CancelledError):
+                    await task
+            return app
+        app = asyncio.run(run())
+        self.assertTrue(proc.killed.is_set())
+        self.assertEqual(app.finished, [('install_vim', Status.FAIL)])
+
+    def test_install_packages_failure(self):
+        async def run():
+            app = MiniApplication()
+            app.aio_loop = asyncio.get_running_loop()
+            controller = InstallProgressController(app)
+            context = app.context.child("postinstall")
+            with mock.patch(
+                    'subiquity.controllers.installprogress.astart_command',
+                    side_effect=OSError("no apt")):
+                with self.assertRaises(OSError):
+                    await controller.install_packages(context, ['vim'])
+            return app, controller
+        app, controller = asyncio.run(run())
+        self.assertEqual(app.finished, [('install_vim', Status.FAIL)])
+        self.assertEqual(controller.progress_view.ongoing, {})
+
+
+class TestInstallStages(unittest.TestCase):
+
+    def test_order(self):
+        log = []
+
+        def stage(name, delay=0):
+            async def run():
+                log.append(('start', name))
+                await asyncio.sleep(delay)
+                log.append(('end', name))
+            return run
+
+        stages = InstallStages()
+        stages.add('a', stage('a'))
+        stages.add('slow', stage('slow', 0.05), ['a'])
+        stages.add('fast', stage('fast'), ['a'])
+        stages.add('last', stage('last'), ['slow', 'fast'])
+        asyncio.run(stages.run())
+        self.assertEqual(log, [
+            ('start', 'a'), ('end', 'a'),
+            ('start', 'slow'), ('start', 'fast'), ('end', 'fast'),
+            ('end', 'slow'),
+            ('start', 'last'), ('end', 'last'),
+            ])
+        self.assertEqual(set(stages.timings), {'a', 'slow', 'fast', 'last'})
+        self.assertGreaterEqual(stages.timings['slow'], 0.05)
+
+    def test_failure(self):
+        ran = []
+
+        async def fail():
+            raise Exception("boom")
+
+        async def after():
+            ran.append('after')
+
+        stages = InstallStages()
+        stages.add('fail', fail)
+        stages.add('after', after, ['fail'])
+        with self.assertRaisesRegex(Exception, "boom"):
+            asyncio.run(stages.run())
+        self.assertEqual(ran, [])
+
+    def test_unknown_dependency(self):
+        stages = InstallStages()
+        with self.assertRaises(Exception):
+            stages.add('a', None, ['b'])
+
+
+class TestTracebackExtractor(unittest.TestCase):
+
+    def feed(self, extractor, lines):
+        for line in lines:
+            extractor.feed(line)
+
+    def test_extract(self):
+        extractor = TracebackExtractor()
+        self.feed(extractor, [
+            "some output",
+            "Traceback (most recent call last):",
+            "  File \"x.py\", line 1, in <module>",
+            "Exception: boom",
+            "more output",
+            "Traceback (most recent call last):",
+            ])
+        self.assertEqual(extractor.traceback, [
+            "Traceback (most recent call last):",
+            "  File \"x.py\", line 1, in <module>",
+            "Exception: boom",
+            ])
+
+    def test_max_len(self):
+        extractor = TracebackExtractor(max_len=30)
+        self.feed(extractor, ["Traceback (most recent call last):"])
+        self.feed(extractor, ["  frame {}".format(i) for i in range(100)])
+        self.feed(extractor, ["Exception: boom"])
+        self.assertEqual(extractor.traceback, [
+            "Traceback (most recent call last):",
+            "  ... 99 lines omitted ...",
+            "  frame 99",
+            "Exception: boom",
+            ])
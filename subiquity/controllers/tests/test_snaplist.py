@@ -0,0 +1,210 @@
+# Copyright 2020 Canonical, Ltd.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import asyncio
+import os
+import time
+import unittest
+
+from subiquitycore.context import Context
+from subiquitycore.tests import SubiTestCase
+
+from subiquity.controllers.snaplist import SnapdSnapInfoLoader
+from subiquity.models.snaplist import SnapInfo
+from subiquity.snapd import SnapdResponseCache
+
+
+class MiniApplication:
+    project = "mini"
+    def report_start_event(*args): pass
+    def report_finish_event(*args): pass
+
+
+class FakeModel:
+
+    def __init__(self):
+        self.snaps = []
+        self.info_loaded = []
+
+    def load_find_data(self, data):
+        self.snaps = [SnapInfo(name=name) for name in data]
+
+    def load_info_data(self, data):
+        self.info_loaded.append(data['name'])
+
+    def get_snap_list(self):
+        return self.snaps[:]
+
+
+class FakeSnapd:
+
+    def __init__(self, names):
+        self.names = names
+        self.fetched = []
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    async def get(self, path, **args):
+        if 'section' in args:
+            return self.names
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        await asyncio.sleep(0.01)
+        self.in_flight -= 1
+        self.fetched.append(args['name'])
+        return {'name': args['name']}
+
+
+class BrokenSnapd(FakeSnapd):
+
+    async def get(self, path, **args):
+        if args.get('name', '').startswith('broken'):
+            raise ValueError("bad response")
+        return await super().get(path, **args)
+
+
+def make_loader(names, concurrency, cache=None, snapd_class=FakeSnapd):
+    snapd = snapd_class(names)
+    app = MiniApplication()
+    loader = SnapdSnapInfoLoader(
+        FakeModel(), snapd, 'server', Context.new(app),
+        concurrency=concurrency, cache=cache)
+    return loader, snapd
+
+
+class TestSnapdSnapInfoLoader(unittest.TestCase):
+
+    def test_concurrency(self):
+        async def run():
+            loader, snapd = make_loader(
+                ['s{}'.format(i) for i in range(10)], 3)
+            loader.start()
+            await asyncio.sleep(0)
+            await loader.main_task
+            return snapd
+        snapd = asyncio.run(run())
+        self.assertEqual(len(snapd.fetched), 10)
+        self.assertEqual(snapd.max_in_flight, 3)
+
+    def test_user_request_jumps_queue(self):
+        async def run():
+            loader, snapd = make_loader(
+                ['s{}'.format(i) for i in range(10)], 1)
+            loader.start()
+            await asyncio.sleep(0)
+            await loader.get_snap_list_task()
+            snap = loader.model.get_snap_list()[-1]
+            await loader.get_snap_info_task(snap)
+            await loader.main_task
+            return snapd
+        snapd = asyncio.run(run())
+        self.assertLess(snapd.fetched.index('s9'), 3)
+        self.assertEqual(len(snapd.fetched), 10)
+
+    def test_unexpected_error_does_not_stop_workers(self):
+        async def run():
+            loader, snapd = make_loader(
+                ['broken1', 'broken2', 's1', 's2'], 2,
+                snapd_class=BrokenSnapd)
+            loader.start()
+            await asyncio.sleep(0)
+            await loader.get_snap_list_task()
+            snaps = loader.model.get_snap_list()
+            await asyncio.wait_for(loader.main_task, 5)
+            with self.assertRaises(ValueError):
+                await loader.get_snap_info_task(snaps[0])
+            await loader.get_snap_info_task(snaps[-1])
+            return snapd
+        snapd = asyncio.run(run())
+        self.assertEqual(snapd.fetched, ['s1', 's2'])
+
+
+class TestSnapdResponseCache(SubiTestCase):
+
+    def test_get_put(self):
+        path = self.tmp_path('cache.json')
+        cache = SnapdResponseCache(path, 60)
+        self.assertEqual(cache.get('v2/find', name='a'), (None, True))
+        cache.put({'a': 1}, 'v2/find', name='a')
+        self.assertEqual(cache.get('v2/find', name='a'), ({'a': 1}, False))
+        self.assertFalse(os.path.exists(path))
+        asyncio.run(cache.save())
+        cache = SnapdResponseCache(path, 60)
+        self.assertEqual(cache.get('v2/find', name='a'), ({'a': 1}, False))
+        self.assertEqual(cache.get('v2/find', name='b'), (None, True))
+
+    def test_expiry(self):
+        cache = SnapdResponseCache(self.tmp_path('cache.json'), 60)
+        cache.put({'a': 1}, 'v2/find', name='a')
+        cache.entries['v2/find?name=a']['time'] -= 120
+        self.assertEqual(cache.get('v2/find', name='a'), ({'a': 1}, True))
+
+    def test_seed(self):
+        seed = self.tmp_path('seed.json')
+        seed_cache = SnapdResponseCache(seed, 60)
+        seed_cache.put({'a': 1}, 'v2/find', name='a')
+        asyncio.run(seed_cache.save())
+        path = self.tmp_path('cache.json')
+        cache = SnapdResponseCache(path, 60, seed)
+        self.assertEqual(cache.get('v2/find', name='a'), ({'a': 1}, False))
+        cache.put({'b': 1}, 'v2/find', name='b')
+        asyncio.run(cache.save())
+        self.assertTrue(os.path.exists(path))
+
+    def test_cached_loader(self):
+        cache = SnapdResponseCache(self.tmp_path('cache.json'), 60)
+        cache.put(['fresh', 'stale'], 'v2/find', section='server')
+        cache.put({'name': 'fresh'}, 'v2/find', name='fresh')
+        cache.put({'name': 'stale'}, 'v2/find', name='stale')
+        cache.entries['v2/find?name=stale']['time'] = time.time() - 120
+
+        async def run():
+            loader, snapd = make_loader(['new'], 2, cache)
+            loader.start()
+            await asyncio.sleep(0)
+            list_task = loader.get_snap_list_task()
+            await list_task
+            await loader.main_task
+            return loader, snapd
+        loader, snapd = asyncio.run(run())
+        self.assertEqual(snapd.fetched, ['stale'])
+        self.assertEqual(
+            loader.model.info_loaded, ['fresh', 'stale', 'stale'])
+        self.assertEqual(
+            cache.get('v2/find', name='stale'), ({'name': 'stale'}, False))
+        saved = SnapdResponseCache(cache.path, 60)
+        self.assertEqual(
+            saved.get('v2/find', name='stale'), ({'name': 'stale'}, False))
+
+    def test_refreshed_list(self):
+        cache = SnapdResponseCache(self.tmp_path('cache.json'), 60)
+        cache.put(['old'], 'v2/find', section='server')
+        cache.put({'name': 'old'}, 'v2/find', name='old')
+        cache.entries['v2/find?section=server']['time'] = time.time() - 120
+        refreshed = []
+
+        async def run():
+            loader, snapd = make_loader(['old', 'new'], 2, cache)
+            loader.list_refreshed = lambda: refreshed.append(
+                [s.name for s in loader.model.get_snap_list()])
+            loader.start()
+            await asyncio.sleep(0)
+            await loader.main_task
+            return loader, snapd
+        loader, snapd = asyncio.run(run())
+        self.assertEqual(refreshed, [['old', 'new']])
+        self.assertEqual(snapd.fetched, ['new'])
+        self.assertEqual(
+            cache.get('v2/find', name='new'), ({'name': 'new'}, False))
@@ -13,6 +13,7 @@
 # You should have received a copy of the GNU Affero General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
+import asyncio
 import logging
 import os
 import platform
@@ -23,8 +24,6 @@ import traceback
 import time
 import urwid
 
-import apport.hookutils
-
 import jsonschema
 
 import yaml
@@ -35,8 +34,13 @@ from subiquitycore.async_helpers import (
     )
 from subiquitycore.controller import Skip
 from subiquitycore.core import Application
-from subiquitycore.utils import run_command
+from subiquitycore.utils import arun_command, run_command
 
+from subiquity.cloudinit import (
+    AUTOINSTALL_PATH,
+    parse_cloud_init_status,
+    write_autoinstall_from_cloud_config,
+    )
 from subiquity.context import SubiquityContext
 from subiquity.controllers.error import (
     ErrorReportKind,
@@ -44,10 +48,11 @@ from subiquity.controllers.error import (
 from subiquity.models.subiquity import SubiquityModel
 from subiquity.snapd import (
     AsyncSnapd,
+    AsyncSnapdConnection,
     FakeSnapdConnection,
-    SnapdConnection,
     )
 from subiquity.ui.frame import SubiquityUI
+from subiquity.ui.views.cloudinit import WaitingForCloudInit
 from subiquity.ui.views.error import ErrorReportStretchy
 
 
@@ -127,6 +132,7 @@ class Subiquity(Application):
 
         super().__init__(opts)
         self.block_log_dir = block_log_dir
+        self.log_dir = os.path.dirname(block_log_dir)
         self.kernel_cmdline = shlex.split(opts.kernel_cmdline)
         if opts.snaps_from_examples:
             connection = FakeSnapdConnection(
@@ -136,7 +142,8 @@ class Subiquity(Application):
                     "examples", "snaps"),
                 self.scale_factor)
         else:
-            connection = SnapdConnection(self.root, self.snapd_socket_path)
+            connection = AsyncSnapdConnection(
+                self.root, self.snapd_socket_path)
         self.snapd = AsyncSnapd(connection)
         self.signal.connect_signals([
             ('network-proxy-set', lambda: schedule_task(self._proxy_set())),
@@ -146,6 +153,8 @@ class Subiquity(Application):
         self._apport_files = []
 
         self.autoinstall_config = {}
+        self.cloud_init_task = None
+        self._cloud_init_gate = None
         self.report_to_show = None
         self.show_progress_handle = None
         self.progress_shown_time = self.aio_loop.time()
@@ -179,6 +188,7 @@ class Subiquity(Application):
             s = urwid.raw_display.Screen(
                 input=os.fdopen(r), output=open('/dev/null', 'w'))
             s.get_cols_rows = lambda: (80, 24)
+            s.output_discarded = True
             return s
 
     def get_primary_tty(self):
@@ -234,6 +244,9 @@ class Subiquity(Application):
                 self.load_autoinstall_config()
                 if not self.interactive() and not self.opts.dry_run:
                     open('/run/casper-no-prompt', 'w').close()
+            if self.opts.cloud_init_pending:
+                self.cloud_init_task = schedule_task(
+                    self._wait_for_cloud_init())
             super().run()
             if self.controllers.Late.cmds:
                 self.new_event_loop()
@@ -259,7 +272,52 @@ class Subiquity(Application):
                 traceback.print_exc()
                 signal.pause()
 
+    async def _wait_for_cloud_init(self):
+        # Started instead of waiting in main() when --async-cloud-init is
+        # passed and cloud-init had not finished. If cloud-init turns out
+        # to provide an autoinstall config, restart to act on it.
+        found = False
+        with self.context.child("wait_for_cloud_init") as context:
+            try:
+                cp = await arun_command(["cloud-init", "status", "--wait"])
+                status = parse_cloud_init_status(cp.stdout)
+                context.description = status
+                if status == "done":
+                    found = await run_in_thread(
+                        write_autoinstall_from_cloud_config, AUTOINSTALL_PATH)
+                else:
+                    log.debug(
+                        "cloud-init status: %r, assumed disabled", status)
+            except Exception:
+                log.exception("waiting for cloud-init failed")
+        if found:
+            log.debug("cloud-init provided autoinstall config, restarting")
+            self.restart(remove_last_screen=False)
+
+    def _gate_on_cloud_init(self):
+        # Every screen after the first depends on whether there is an
+        # autoinstall config, so they wait for cloud-init to finish.
+        view = WaitingForCloudInit(self, self._cancel_cloud_init_gate)
+        self.ui.set_body(view)
+        self._cloud_init_gate = schedule_task(
+            self._next_screen_after_cloud_init(view))
+
+    async def _next_screen_after_cloud_init(self, view):
+        await asyncio.shield(self.cloud_init_task)
+        view.spinner.stop()
+        self._cloud_init_gate = None
+        self.next_screen()
+
+    def _cancel_cloud_init_gate(self):
+        if self._cloud_init_gate is not None:
+            self._cloud_init_gate.cancel()
+            self._cloud_init_gate = None
+        self.controllers.cur.start_ui()
+
     def report_start_event(self, context, description):
+        if self.benchmark is not None and context.controller is not None:
+            self.benchmark.controller_context_entered(
+                context.controller.name)
         # report_start_event gets called when the Reporting controller
         # is being loaded...
         Reporting = getattr(self.controllers, "Reporting", None)
@@ -276,6 +334,9 @@ class Subiquity(Application):
                     context, msg)
 
     def report_finish_event(self, context, description, status):
+        if self.benchmark is not None and context.controller is not None:
+            self.benchmark.controller_context_exited(
+                context.controller.name)
         Reporting = getattr(self.controllers, "Reporting", None)
         if Reporting is not None:
             Reporting.report_finish_event(
@@ -291,6 +352,13 @@ class Subiquity(Application):
         self.controllers.InstallProgress.confirmation.set()
 
     def next_screen(self):
+        waiting = (
+            self.cloud_init_task is not None
+            and not self.cloud_init_task.done())
+        if waiting and self.controllers.cur is not None:
+            if self._cloud_init_gate is None:
+                self._gate_on_cloud_init()
+            return
         can_install = all(e.is_set() for e in self.base_model.install_events)
         if can_install and not self.install_confirmed:
             if self.interactive():
@@ -437,8 +505,12 @@ class Subiquity(Application):
 
         apport_files = self._apport_files[:]
         apport_data = self._apport_data.copy()
+        if self.loop_monitor is not None:
+            apport_data.append(
+                ("EventLoopMonitor", self.loop_monitor.report()))
 
         def _bg_attach_hook():
+            import apport.hookutils
             # Attach any stuff other parts of the code think we should know
             # about.
             for key, path in apport_files:
@@ -18,6 +18,7 @@ import attr
 import collections
 import enum
 import fnmatch
+import heapq
 import itertools
 import logging
 import math
@@ -135,6 +136,61 @@ def reverse_dependencies(obj):
             yield v
 
 
+def _cycles(nodes, edges):
+    """Find the cycles in a graph.
+
+    `nodes` is a list of node indices and edges[i] the list of nodes that
+    node i has an edge to (edges to nodes not in `nodes` are ignored).
+    Returns the strongly connected components of the subgraph that contain
+    a cycle, i.e. every node that is part of a cycle exactly once.
+    """
+    # This is Tarjan's algorithm, made iterative so that large models do not
+    # hit the recursion limit.
+    nodes = set(nodes)
+    counter = itertools.count()
+    order = {}
+    lowlink = {}
+    stack = []
+    on_stack = set()
+    result = []
+    for root in sorted(nodes):
+        if root in order:
+            continue
+        order[root] = lowlink[root] = next(counter)
+        stack.append(root)
+        on_stack.add(root)
+        work = [(root, iter(edges[root]))]
+        while work:
+            node, children = work[-1]
+            for child in children:
+                if child not in nodes:
+                    continue
+                if child not in order:
+                    order[child] = lowlink[child] = next(counter)
+                    stack.append(child)
+                    on_stack.add(child)
+                    work.append((child, iter(edges[child])))
+                    break
+                elif child in on_stack:
+                    lowlink[node] = min(lowlink[node], order[child])
+            else:
+                work.pop()
+                if work:
+                    parent = work[-1][0]
+                    lowlink[parent] = min(lowlink[parent], lowlink[node])
+                if lowlink[node] == order[node]:
+                    component = []
+                    while True:
+                        member = stack.pop()
+                        on_stack.remove(member)
+                        component.append(member)
+                        if member == node:
+                            break
+                    if len(component) > 1 or node in edges[node]:
+                        result.append(sorted(component))
+    return result
+
+
 @attr.s(cmp=False)
 class RaidLevel:
     name = attr.ib()
@@ -1236,6 +1292,15 @@ class FilesystemModel(object):
 
     target = None
 
+    # The attributes, by action type, that _one and _all can look actions
+    # up by without scanning every action of that type. These attributes
+    # must not change once the action has been added to the model.
+    _indexed_attrs = {
+        'dasd': ('device_id',),
+        'disk': ('path', 'serial'),
+        'mount': ('path',),
+        }
+
     @classmethod
     def is_mounted_filesystem(self, fstype):
         if fstype in [None, 'swap']:
@@ -1260,6 +1325,55 @@ class FilesystemModel(object):
         self._probe_data = None
         self.reset()
 
+    # _actions is the list of all actions in the model. It must only be
+    # modified through _add_action and _remove_action (or by assigning a
+    # whole new list) so that the indexes used by _one and _all stay in
+    # sync with it.
+
+    @property
+    def _actions(self):
+        return self._action_list
+
+    @_actions.setter
+    def _actions(self, actions):
+        self._action_list = actions
+        # These dicts are used as ordered sets, so that lookups return
+        # actions in the order they appear in _actions.
+        self._actions_by_type = collections.defaultdict(dict)
+        self._actions_by_attr = collections.defaultdict(dict)
+        self._actions_by_id = {}
+        self._compound_devices = {}
+        for obj in actions:
+            self._index_action(obj)
+
+    def _index_action(self, obj):
+        self._actions_by_type[obj.type][obj] = None
+        self._actions_by_id[obj.id] = obj
+        for name in self._indexed_attrs.get(obj.type, ()):
+            key = obj.type, name, getattr(obj, name)
+            self._actions_by_attr[key][obj] = None
+        if isinstance(obj, _Device) and obj.type != 'disk':
+            self._compound_devices[obj] = None
+
+    def _unindex_action(self, obj):
+        del self._actions_by_type[obj.type][obj]
+        if self._actions_by_id.get(obj.id) is obj:
+            del self._actions_by_id[obj.id]
+        for name in self._indexed_attrs.get(obj.type, ()):
+            key = obj.type, name, getattr(obj, name)
+            del self._actions_by_attr[key][obj]
+            if not self._actions_by_attr[key]:
+                del self._actions_by_attr[key]
+        self._compound_devices.pop(obj, None)
+
+    def _add_action(self, obj):
+        self._action_list.append(obj)
+        self._index_action(obj)
+
+    def _remove_action(self, obj):
+        self._action_list.remove(obj)
+        self._unindex_action(obj)
+
     def reset(self):
         if self._probe_data is not None:
             self._orig_config = storage_config.extract_storage_config(
@@ -1455,13 +1569,19 @@ class FilesystemModel(object):
     def _render_actions(self):
         # The curtin storage config has the constraint that an action must be
         # preceded by all the things that it depends on.  We handle this by
-        # repeatedly iterating over all actions and checking if we can emit
-        # each action by checking if all of the actions it depends on have been
-        # emitted.  Eventually this will either emit all actions or stop making
-        # progress -- which means there is a cycle in the definitions,
-        # something the UI should have prevented <wink>.
+        # building the "must be emitted before" graph once -- edges come from
+        # dependencies() and from the mount of each parent directory of a
+        # mount point -- and then emitting actions in topological order
+        # (Kahn's algorithm).  Among the actions that can be emitted we always
+        # pick the one that comes first in _actions, so the output is stable
+        # and matches _actions when that is already correctly ordered.  If
+        # this does not emit every action there is a cycle in the
+        # definitions, something the UI should have prevented <wink>.
         r = []
-        emitted_ids = set()
+        actions = self._actions
+        index = {obj.id: i for i, obj in enumerate(actions)}
+        mountpoints = {m.path: m.id for m in self.all_mounts()}
+        log.debug('mountpoints %s', mountpoints)
 
         def emit(obj):
             if isinstance(obj, Raid):
@@ -1469,43 +1589,54 @@ class FilesystemModel(object):
                     "FilesystemModel: estimated size of %s %s is %s",
                     obj.raidlevel, obj.name, obj.size)
             r.append(asdict(obj))
-            emitted_ids.add(obj.id)
 
-        def can_emit(obj):
+        def deps(obj):
             for dep in dependencies(obj):
-                if dep.id not in emitted_ids:
-                    return False
+                yield dep.id
             if isinstance(obj, Mount):
                 # Any mount actions for a parent of this one have to be emitted
                 # first.
                 for parent in pathlib.Path(obj.path).parents:
                     parent = str(parent)
                     if parent in mountpoints:
-                        if mountpoints[parent] not in emitted_ids:
-                            log.debug(
-                                "cannot emit action to mount %s until that "
-                                "for %s is emitted", obj.path, parent)
-                            return False
-            return True
-
-        mountpoints = {m.path: m.id for m in self.all_mounts()}
-        log.debug('mountpoints %s', mountpoints)
-
-        work = self._actions[:]
-
-        while work:
-            next_work = []
-            for obj in work:
-                if can_emit(obj):
-                    emit(obj)
+                        yield mountpoints[parent]
+
+        # waiting_on[i] is the number of unemitted actions action i depends on
+        # and unblocks[i] is the actions that depend on action i.
+        waiting_on = [0] * len(actions)
+        unblocks = [[] for _ in actions]
+        missing = {}
+        for i, obj in enumerate(actions):
+            for dep_id in deps(obj):
+                waiting_on[i] += 1
+                j = index.get(dep_id)
+                if j is None:
+                    missing.setdefault(i, []).append(dep_id)
                 else:
-                    next_work.append(obj)
-            if len(next_work) == len(work):
-                msg = ["rendering block devices made no progress processing:"]
-                for w in work:
-                    msg.append(" - " + str(w))
-                raise Exception("\n".join(msg))
-            work = next_work
+                    unblocks[j].append(i)
+
+        ready = [i for i, count in enumerate(waiting_on) if count == 0]
+        while ready:
+            i = heapq.heappop(ready)
+            emit(actions[i])
+            for j in unblocks[i]:
+                waiting_on[j] -= 1
+                if waiting_on[j] == 0:
+                    heapq.heappush(ready, j)
+
+        if len(r) != len(actions):
+            stuck = [i for i, count in enumerate(waiting_on) if count > 0]
+            msg = ["rendering block devices made no progress processing:"]
+            for i in stuck:
+                msg.append(" - " + str(actions[i]))
+            for cycle in _cycles(stuck, unblocks):
+                msg.append("cycle:")
+                for i in cycle:
+                    msg.append(" - " + str(actions[i]))
+            for i, dep_ids in sorted(missing.items()):
+                msg.append("{} depends on unknown actions {}".format(
+                    actions[i].id, ", ".join(dep_ids)))
+            raise Exception("\n".join(msg))
 
         return r
 
@@ -1534,9 +1665,17 @@ class FilesystemModel(object):
         self.reset()
 
     def _matcher(self, type, kw):
-        for a in self._actions:
-            if a.type != type:
-                continue
+        if 'id' in kw:
+            a = self._actions_by_id.get(kw['id'])
+            candidates = [a] if a is not None and a.type == type else []
+        else:
+            candidates = self._actions_by_type.get(type, {})
+            for name in self._indexed_attrs.get(type, ()):
+                if name in kw:
+                    candidates = self._actions_by_attr.get(
+                        (type, name, kw[name]), {})
+                    break
+        for a in candidates:
             for k, v in kw.items():
                 if getattr(a, k) != v:
                     break
@@ -1559,16 +1698,9 @@ class FilesystemModel(object):
         # return:
         #  compound devices, newest first
         #  disk devices, sorted by label
-        disks = []
-        compounds = []
-        for a in self._actions:
-            if a.type == 'disk':
-                disks.append(a)
-            elif isinstance(a, _Device):
-                compounds.append(a)
+        compounds = list(self._compound_devices)
         compounds.reverse()
-        disks.sort(key=lambda x: x.label)
-        return compounds + disks
+        return compounds + self.all_disks()
 
     def all_disks(self):
         return sorted(self._all(type='disk'), key=lambda x: x.label)
@@ -1595,14 +1727,14 @@ class FilesystemModel(object):
         if dasd is not None:
             dasd.device_layout = 'cdl'
             dasd.preserve = False
-        self._actions.append(p)
+        self._add_action(p)
         return p
 
     def remove_partition(self, part):
         if part._fs or part._constructed_device:
             raise Exception("can only remove empty partition")
         _remove_backlinks(part)
-        self._actions.remove(part)
+        self._remove_action(part)
         if len(part.device._partitions) == 0:
             part.device.ptable = None
 
@@ -1613,47 +1745,47 @@ class FilesystemModel(object):
             raidlevel=raidlevel,
             devices=devices,
             spare_devices=spare_devices)
-        self._actions.append(r)
+        self._add_action(r)
         return r
 
     def remove_raid(self, raid):
         if raid._fs or raid._constructed_device or len(raid.partitions()):
             raise Exception("can only remove empty RAID")
         _remove_backlinks(raid)
-        self._actions.remove(raid)
+        self._remove_action(raid)
 
     def add_volgroup(self, name, devices):
         vg = LVM_VolGroup(m=self, name=name, devices=devices)
-        self._actions.append(vg)
+        self._add_action(vg)
         return vg
 
     def remove_volgroup(self, vg):
         if len(vg._partitions):
             raise Exception("can only remove empty VG")
         _remove_backlinks(vg)
-        self._actions.remove(vg)
+        self._remove_action(vg)
 
     def add_logical_volume(self, vg, name, size):
         lv = LVM_LogicalVolume(m=self, volgroup=vg, name=name, size=size)
-        self._actions.append(lv)
+        self._add_action(lv)
         return lv
 
     def remove_logical_volume(self, lv):
         if lv._fs:
             raise Exception("can only remove empty LV")
         _remove_backlinks(lv)
-        self._actions.remove(lv)
+        self._remove_action(lv)
 
     def add_dm_crypt(self, volume, key):
         if not volume.available:
             raise Exception("{} is not available".format(volume))
         dm_crypt = DM_Crypt(volume=volume, key=key)
-        self._actions.append(dm_crypt)
+        self._add_action(dm_crypt)
         return dm_crypt
 
     def remove_dm_crypt(self, dm_crypt):
         _remove_backlinks(dm_crypt)
-        self._actions.remove(dm_crypt)
+        self._remove_action(dm_crypt)
 
     def add_filesystem(self, volume, fstype, preserve=False):
         log.debug("adding %s to %s", fstype, volume)
@@ -1666,20 +1798,20 @@ class FilesystemModel(object):
             raise Exception("%s is already formatted")
         fs = Filesystem(
             m=self, volume=volume, fstype=fstype, preserve=preserve)
-        self._actions.append(fs)
+        self._add_action(fs)
         return fs
 
     def remove_filesystem(self, fs):
         if fs._mount:
             raise Exception("can only remove unmounted filesystem")
         _remove_backlinks(fs)
-        self._actions.remove(fs)
+        self._remove_action(fs)
 
     def add_mount(self, fs, path):
         if fs._mount is not None:
             raise Exception("%s is already mounted")
         m = Mount(m=self, device=fs, path=path)
-        self._actions.append(m)
+        self._add_action(m)
         # Adding a swap partition or mounting btrfs at / suppresses
         # the swapfile.
         if not self._should_add_swapfile():
@@ -1688,7 +1820,7 @@ class FilesystemModel(object):
 
     def remove_mount(self, mount):
         _remove_backlinks(mount)
-        self._actions.remove(mount)
+        self._remove_action(mount)
         # Removing a mount might make it ok to add a swapfile again.
         if self._should_add_swapfile():
             self.swap = None
@@ -142,11 +142,31 @@ standard_non_latin_layouts = set(
 )
 
 
+def read_kbdnames_index(fp):
+    """Read an index of kbdnames.txt.
+
+    Each line of the index is "<language> <offset> <length>", giving the
+    byte range of kbdnames.txt that holds the rows for that language (the
+    rows for each language are contiguous). The snap build generates this
+    alongside kbdnames.txt.
+    """
+    index = {}
+    for line in fp:
+        code, offset, length = line.split()
+        index[code] = (int(offset), int(length))
+    return index
+
+
 class KeyboardModel:
     def __init__(self, root):
         self.root = root
         self._kbnames_file = os.path.join(os.environ.get("SNAP", '.'),
                                           'kbdnames.txt')
+        self._kbnames_index_file = os.path.join(
+            os.environ.get("SNAP", '.'), 'kbdnames.index')
+        # {language: (offset, length)} of the rows in kbdnames.txt, read
+        # from kbdnames.index or built by the first scan of kbdnames.txt.
+        self._kbnames_index = None
         self._clear()
         if os.path.exists(self.config_path):
             self.setting = KeyboardSetting.from_config_file(self.config_path)
@@ -167,10 +187,62 @@ class KeyboardModel:
 
         self._clear()
 
-        with open(self._kbnames_file, encoding='utf-8') as kbdnames:
-            self._load_file(code, kbdnames)
+        with open(self._kbnames_file, 'rb') as kbdnames:
+            if self._kbnames_index is None:
+                self._read_index()
+            if self._kbnames_index is None or \
+               not self._load_indexed(code, kbdnames):
+                self._clear()
+                kbdnames.seek(0)
+                self._scan_file(code, kbdnames)
         self.current_lang = code
 
+    def _read_index(self):
+        try:
+            with open(self._kbnames_index_file, encoding='utf-8') as fp:
+                self._kbnames_index = read_kbdnames_index(fp)
+        except FileNotFoundError:
+            pass
+        except (OSError, ValueError):
+            log.exception("reading %s failed", self._kbnames_index_file)
+
+    def _load_indexed(self, code, kbdnames):
+        # Returns False if the index does not match the file.
+        if code not in self._kbnames_index:
+            return True
+        offset, length = self._kbnames_index[code]
+        start = max(offset - 1, 0)
+        kbdnames.seek(start)
+        data = kbdnames.read(offset + length - start)
+        if offset > 0:
+            if data[:1] != b'\n':
+                return False
+            data = data[1:]
+        if not data.endswith(b'\n'):
+            return False
+        lines = data.decode('utf-8').splitlines(True)
+        prefix = code + '*'
+        if not all(line.startswith(prefix) for line in lines):
+            return False
+        self._load_file(code, lines)
+        return True
+
+    def _scan_file(self, code, kbdnames):
+        # Read every row, loading the ones for code and building the
+        # index so later languages can be loaded with a single seek.
+        index = {}
+        lines = []
+        offset = 0
+        for line in kbdnames:
+            got_lang = line.split(b'*', 1)[0].decode('utf-8')
+            start, length = index.get(got_lang, (offset, 0))
+            index[got_lang] = (start, length + len(line))
+            offset += len(line)
+            if got_lang == code:
+                lines.append(line.decode('utf-8'))
+        self._kbnames_index = index
+        self._load_file(code, lines)
+
     def _clear(self):
         self.current_lang = None
         self.layouts = {}
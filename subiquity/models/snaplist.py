@@ -92,6 +92,9 @@ class SnapListModel:
             return
         if snap.partial:
             snap.update(info)
+        # Info may be loaded more than once (from the cache and then from
+        # the store), so replace the channels rather than adding to them.
+        snap.channels = []
         channel_map = info['channels']
         for track in info['tracks']:
             for risk in risks:
@@ -211,8 +211,10 @@ class SubiquityModel:
             ('etc/hosts', HOSTS_CONTENT.format(hostname=hostname), 0o644),
             ]
 
-    def configure_cloud_init(self):
-        for path, content, mode in self._cloud_init_files():
+    def configure_cloud_init(self, files=None):
+        if files is None:
+            files = self._cloud_init_files()
+        for path, content, mode in files:
             path = os.path.join(self.target, path)
             os.makedirs(os.path.dirname(path), exist_ok=True)
             write_file(path, content, mode, omode="w")
@@ -143,10 +143,8 @@ def make_disk(fs_model, **kw):
     if 'path' not in kw:
         kw['path'] = '/dev/thing'
     size = kw.pop('size', 100*(2**30))
-    fs_model._actions.append(Disk(
-        m=fs_model, info=FakeStorageInfo(size=size),
-        **kw))
-    disk = fs_model._actions[-1]
+    disk = Disk(m=fs_model, info=FakeStorageInfo(size=size), **kw)
+    fs_model._add_action(disk)
     return disk
 
 
@@ -161,7 +159,7 @@ def make_partition(model, device=None, *, size=None, **kw):
     if size is None:
         size = device.free_for_partitions//2
     partition = Partition(m=model, device=device, size=size, **kw)
-    model._actions.append(partition)
+    model._add_action(partition)
     return partition
 
 
@@ -787,6 +785,107 @@ class TestFilesystemModel(unittest.TestCase):
         self.assertActionNotSupported(lv, DeviceAction.MAKE_BOOT)
 
 
+class TestLookups(unittest.TestCase):
+
+    def test_one_by_indexed_attr(self):
+        model = make_model()
+        disk1 = make_disk(model, serial='s1', path='/dev/sda')
+        disk2 = make_disk(model, serial='s2', path='/dev/sdb')
+        self.assertIs(model._one(type='disk', serial='s2'), disk2)
+        self.assertIs(model._one(type='disk', path='/dev/sda'), disk1)
+        self.assertIs(
+            model._one(type='disk', path='/dev/sda', serial='s1'), disk1)
+        self.assertIsNone(
+            model._one(type='disk', path='/dev/sda', serial='s2'))
+        self.assertIs(model._one(type='disk', id=disk1.id), disk1)
+        self.assertIsNone(model._one(type='partition', id=disk1.id))
+
+    def test_all_after_remove(self):
+        model, disk = make_model_and_disk()
+        part1 = model.add_partition(disk, 10 << 20)
+        part2 = model.add_partition(disk, 10 << 20)
+        fs = model.add_filesystem(part1, 'ext4')
+        mount = model.add_mount(fs, '/')
+        self.assertEqual(model._all(type='partition'), [part1, part2])
+        self.assertIs(model._mount_for_path('/'), mount)
+        model.remove_mount(mount)
+        model.remove_filesystem(fs)
+        model.remove_partition(part1)
+        self.assertEqual(model._all(type='partition'), [part2])
+        self.assertEqual(model.all_mounts(), [])
+        self.assertIsNone(model._mount_for_path('/'))
+        self.assertIsNone(model._one(type='partition', id=part1.id))
+
+    def test_all_devices(self):
+        model = make_model()
+        disk1 = make_disk(model, serial='b')
+        disk2 = make_disk(model, serial='a')
+        raid = model.add_raid('md0', 'raid1', {disk1, disk2}, set())
+        vg = model.add_volgroup('vg0', {make_disk(model, serial='c')})
+        disk3 = model._one(type='disk', serial='c')
+        self.assertEqual(
+            model.all_devices(), [vg, raid, disk2, disk1, disk3])
+        model.remove_raid(raid)
+        self.assertEqual(model.all_devices(), [vg, disk2, disk1, disk3])
+
+    def test_assign_actions(self):
+        model, disk = make_model_and_disk()
+        model._actions = []
+        self.assertEqual(model.all_disks(), [])
+        model._actions = [disk]
+        self.assertEqual(model.all_disks(), [disk])
+
+
+class TestRenderActions(unittest.TestCase):
+
+    def test_ordered_actions_unchanged(self):
+        model, part = make_model_and_partition()
+        fs = model.add_filesystem(part, 'ext4')
+        model.add_mount(fs, '/')
+        self.assertEqual(
+            [a['id'] for a in model._render_actions()],
+            [a.id for a in model._actions])
+
+    def test_dependencies_first(self):
+        model, disk = make_model_and_disk()
+        part = make_partition(model, disk)
+        fs = model.add_filesystem(part, 'ext4')
+        model.add_mount(fs, '/')
+        model._actions = model._actions[::-1]
+        ids = [a['id'] for a in model._render_actions()]
+        for dep in disk, part, fs:
+            with self.subTest(dep=dep):
+                self.assertLess(
+                    ids.index(dep.id), ids.index(fs._mount.id))
+
+    def test_parent_mounts_first(self):
+        model, disk = make_model_and_disk()
+        mounts = {}
+        for path in '/srv/data', '/', '/srv':
+            part = make_partition(model, disk, size=10 << 20)
+            fs = model.add_filesystem(part, 'ext4')
+            mounts[path] = model.add_mount(fs, path)
+        ids = [a['id'] for a in model._render_actions()]
+        self.assertLess(
+            ids.index(mounts['/'].id), ids.index(mounts['/srv'].id))
+        self.assertLess(
+            ids.index(mounts['/srv'].id), ids.index(mounts['/srv/data'].id))
+
+    def test_cycle_reported(self):
+        model, raid = make_model_and_raid()
+        part = make_partition(model, raid)
+        fs = model.add_filesystem(part, 'ext4')
+        raid.devices.add(part)
+        with self.assertRaises(Exception) as cm:
+            model._render_actions()
+        msg = str(cm.exception)
+        cycle = msg[msg.index("cycle:"):]
+        self.assertIn(raid.id, cycle)
+        self.assertIn(part.id, cycle)
+        self.assertNotIn(fs.id, cycle)
+        self.assertIn(fs.id, msg)
+
+
 def fake_up_blockdata(model):
     bd = {}
     for disk in model.all_disks():
@@ -18,11 +18,22 @@ import os
 import tempfile
 import unittest
 
+from subiquitycore.tests import SubiTestCase
+
 from subiquity.models.keyboard import (
     KeyboardModel,
     KeyboardSetting,
     )
 
+KBDNAMES = """\
+C*layout*us*English (US)
+C*variant*us*intl*English (US) - intl.
+de*layout*us*Englisch (US)
+de*layout*de*Deutsch
+de*variant*de*nodeadkeys*Deutsch - ohne Tottasten
+fr*layout*fr*Français
+"""
+
 
 class TestSubiquityModel(unittest.TestCase):
 
@@ -44,3 +55,46 @@ class TestSubiquityModel(unittest.TestCase):
                 self.assertEqual(new_setting, read_setting)
         loop.run_until_complete(t())
         loop.close()
+
+
+class TestKbdnamesIndex(SubiTestCase):
+
+    def make_model(self, index=None):
+        tmpdir = self.tmp_dir()
+        with open(os.path.join(tmpdir, 'kbdnames.txt'), 'w') as fp:
+            fp.write(KBDNAMES)
+        if index is not None:
+            with open(os.path.join(tmpdir, 'kbdnames.index'), 'w') as fp:
+                fp.write(index)
+        model = KeyboardModel(tmpdir)
+        model._kbnames_file = os.path.join(tmpdir, 'kbdnames.txt')
+        model._kbnames_index_file = os.path.join(tmpdir, 'kbdnames.index')
+        return model
+
+    def assertLoadsLanguages(self, model):
+        model.load_language('de')
+        self.assertEqual(
+            model.layouts, {'us': 'Englisch (US)', 'de': 'Deutsch'})
+        self.assertEqual(
+            model.variants, {'de': {'nodeadkeys': 'Deutsch - ohne Tottasten'}})
+        model.load_language('fr')
+        self.assertEqual(model.layouts, {'fr': 'Français'})
+        self.assertFalse(model.has_language('es'))
+        self.assertTrue(model.has_language('C'))
+        self.assertEqual(model.lookup('us:intl'), (
+            'English (US)', 'English (US) - intl.'))
+
+    def test_index_built_on_first_use(self):
+        model = self.make_model()
+        self.assertLoadsLanguages(model)
+        self.assertEqual(
+            model._kbnames_index,
+            {'C': (0, 64), 'de': (64, 98), 'fr': (162, 23)})
+
+    def test_index_file(self):
+        model = self.make_model("C 0 64\nde 64 98\nfr 162 23\n")
+        self.assertLoadsLanguages(model)
+
+    def test_stale_index_file(self):
+        model = self.make_model("C 0 60\nde 60 98\nfr 160 23\n")
+        self.assertLoadsLanguages(model)
@@ -28,16 +28,18 @@ from urllib.parse import (
 from subiquitycore.async_helpers import run_in_thread
 from subiquitycore.utils import run_command
 
-import requests_unixsocket
+import requests.exceptions
 
 
 log = logging.getLogger('subiquity.snapd')
 
-# Every method in this module blocks. Do not call them from the main thread!
+# Apart from those of AsyncSnapdConnection and AsyncSnapd, every method in
+# this module blocks. Do not call them from the main thread!
 
 
 class SnapdConnection:
     def __init__(self, root, sock):
+        import requests_unixsocket
         self.root = root
         self.url_base = "http+unix://{}/".format(quote_plus(sock))
         self.session = requests_unixsocket.Session()
@@ -55,21 +57,159 @@ class SnapdConnection:
             timeout=60)
 
     def configure_proxy(self, proxy):
-        log.debug("restarting snapd to pick up proxy config")
-        dropin_dir = os.path.join(
-            self.root, 'etc/systemd/system/snapd.service.d')
-        os.makedirs(dropin_dir, exist_ok=True)
-        with open(os.path.join(dropin_dir, 'snap_proxy.conf'), 'w') as fp:
-            fp.write(proxy.proxy_systemd_dropin())
-        if self.root == '/':
-            cmds = [
-                ['systemctl', 'daemon-reload'],
-                ['systemctl', 'restart', 'snapd.service'],
-                ]
+        configure_snapd_proxy(self.root, proxy)
+
+
+def configure_snapd_proxy(root, proxy):
+    log.debug("restarting snapd to pick up proxy config")
+    dropin_dir = os.path.join(
+        root, 'etc/systemd/system/snapd.service.d')
+    os.makedirs(dropin_dir, exist_ok=True)
+    with open(os.path.join(dropin_dir, 'snap_proxy.conf'), 'w') as fp:
+        fp.write(proxy.proxy_systemd_dropin())
+    if root == '/':
+        cmds = [
+            ['systemctl', 'daemon-reload'],
+            ['systemctl', 'restart', 'snapd.service'],
+            ]
+    else:
+        cmds = [['sleep', '2']]
+    for cmd in cmds:
+        run_command(cmd)
+
+
+class _AsyncResponse:
+
+    def __init__(self, path, status, reason, headers, body):
+        self.path = path
+        self.status_code = status
+        self.reason = reason
+        self.headers = headers
+        self.content = body
+
+    def raise_for_status(self):
+        if 400 <= self.status_code < 600:
+            raise requests.exceptions.HTTPError(
+                "{} {} for {}".format(
+                    self.status_code, self.reason, self.path),
+                response=self)
+
+    def json(self):
+        return json.loads(self.content.decode('utf-8'))
+
+
+class AsyncSnapdConnection:
+    """Talk HTTP/1.1 to snapd over its unix socket using asyncio streams.
+
+    Connections are kept open after a request completes and reused by
+    later requests, up to pool_size idle connections. Errors are raised
+    as the same requests exceptions SnapdConnection would raise, so
+    callers do not need to care which connection they have.
+    """
+
+    def __init__(self, root, sock, pool_size=4, timeout=60):
+        self.root = root
+        self.sock = sock
+        self.pool_size = pool_size
+        self.timeout = timeout
+        self._idle = []  # [(reader, writer)]
+
+    def configure_proxy(self, proxy):
+        configure_snapd_proxy(self.root, proxy)
+
+    async def get(self, path, **args):
+        return await self.request('GET', path, None, **args)
+
+    async def post(self, path, body, **args):
+        return await self.request(
+            'POST', path, json.dumps(body).encode('utf-8'), **args)
+
+    async def request(self, method, path, body, **args):
+        if args:
+            path += '?' + urlencode(args)
+        try:
+            return await asyncio.wait_for(
+                self._request(method, path, body), self.timeout)
+        except asyncio.TimeoutError:
+            raise requests.exceptions.Timeout(
+                "{} {} timed out".format(method, path))
+
+    async def _request(self, method, path, body):
+        while self._idle:
+            conn = self._idle.pop()
+            try:
+                return await self._request_on(conn, method, path, body)
+            except asyncio.IncompleteReadError as e:
+                if e.partial:
+                    raise requests.exceptions.ConnectionError(e)
+                # snapd closed the connection while it was idle (e.g. it
+                # was restarted) without reading the request. Try again
+                # on another one.
+            except ConnectionError:
+                pass
+        try:
+            conn = await asyncio.open_unix_connection(self.sock)
+        except OSError as e:
+            raise requests.exceptions.ConnectionError(e)
+        try:
+            return await self._request_on(conn, method, path, body)
+        except (OSError, asyncio.IncompleteReadError, ValueError) as e:
+            raise requests.exceptions.ConnectionError(e)
+
+    async def _request_on(self, conn, method, path, body):
+        try:
+            response, keep_alive = await self._exchange(
+                conn, method, path, body)
+        except BaseException:
+            conn[1].close()
+            raise
+        if keep_alive and len(self._idle) < self.pool_size:
+            self._idle.append(conn)
+        else:
+            conn[1].close()
+        return response
+
+    async def _exchange(self, conn, method, path, body):
+        reader, writer = conn
+        lines = [
+            '{} /{} HTTP/1.1'.format(method, path),
+            'Host: snapd',
+            ]
+        if body is not None:
+            lines.append('Content-Type: application/json')
+            lines.append('Content-Length: {}'.format(len(body)))
+        request = ('\r\n'.join(lines) + '\r\n\r\n').encode('ascii')
+        if body is not None:
+            request += body
+        writer.write(request)
+        await writer.drain()
+
+        status_line = await reader.readuntil(b'\r\n')
+        version, status, reason = status_line.decode('latin-1').split(' ', 2)
+        headers = {}
+        while True:
+            line = await reader.readuntil(b'\r\n')
+            if line == b'\r\n':
+                break
+            k, v = line.decode('latin-1').split(':', 1)
+            headers[k.strip().lower()] = v.strip()
+        if headers.get('transfer-encoding', '').lower() == 'chunked':
+            chunks = []
+            while True:
+                size_line = await reader.readuntil(b'\r\n')
+                size = int(size_line.split(b';', 1)[0], 16)
+                chunk = await reader.readexactly(size + 2)
+                if size == 0:
+                    break
+                chunks.append(chunk[:-2])
+            content = b''.join(chunks)
         else:
-            cmds = [['sleep', '2']]
-        for cmd in cmds:
-            run_command(cmd)
+            content = await reader.readexactly(
+                int(headers.get('content-length', 0)))
+
+        response = _AsyncResponse(
+            path, int(status), reason.strip(), headers, content)
+        return response, headers.get('connection', '').lower() != 'close'
 
 
 class _FakeFileResponse:
@@ -164,28 +304,116 @@ class FakeSnapdConnection:
             "Don't know how to fake GET response to {}".format((path, args)))
 
 
+class SnapdResponseCache:
+    """JSON responses from snapd, saved along with when they were fetched.
+
+    Responses older than ttl seconds are still returned but flagged as
+    expired, so callers can show them straight away and refresh them in
+    the background. If nothing has been saved yet, the responses in
+    seed_path (if it exists) are used to start with. Responses that are
+    put are only written to path when save() is called.
+    """
+
+    version = 1
+
+    def __init__(self, path, ttl, seed_path=None):
+        self.path = path
+        self.ttl = ttl
+        self.entries = self._load(path)
+        if self.entries is None and seed_path is not None:
+            self.entries = self._load(seed_path)
+            if self.entries is not None:
+                log.debug("seeded snapd response cache from %s", seed_path)
+        if self.entries is None:
+            self.entries = {}
+        self.dirty = False
+
+    def _load(self, path):
+        try:
+            with open(path) as fp:
+                cached = json.load(fp)
+        except (OSError, ValueError):
+            return None
+        if cached.get('version') != self.version:
+            return None
+        return cached['entries']
+
+    def _key(self, path, args):
+        if args:
+            path += '?' + urlencode(sorted(args.items()))
+        return path
+
+    def get(self, path, **args):
+        """Return (response, expired), or (None, True) if not cached."""
+        entry = self.entries.get(self._key(path, args))
+        if entry is None:
+            return None, True
+        return entry['data'], time.time() - entry['time'] > self.ttl
+
+    def put(self, data, path, **args):
+        self.entries[self._key(path, args)] = {
+            'time': time.time(),
+            'data': data,
+            }
+        self.dirty = True
+
+    def _write(self, content):
+        tmp = self.path + '.tmp'
+        try:
+            with open(tmp, 'w') as fp:
+                json.dump(content, fp)
+            os.rename(tmp, self.path)
+        except OSError:
+            log.exception("saving snapd response cache failed")
+
+    async def save(self):
+        """Write the cache to disk in a thread, if anything has changed."""
+        if not self.dirty:
+            return
+        self.dirty = False
+        # Entries are replaced rather than modified, so a shallow copy
+        # is safe to serialize while more responses are put.
+        await run_in_thread(self._write, {
+            'version': self.version,
+            'entries': dict(self.entries),
+            })
+
+
 class AsyncSnapd:
 
+    # When waiting for a change, poll it after this many seconds, backing
+    # off by change_poll_backoff each time up to change_poll_max.
+    change_poll_initial = 0.1
+    change_poll_backoff = 1.5
+    change_poll_max = 2.0
+
     def __init__(self, connection):
         self.connection = connection
 
+    async def _call(self, meth, *args, **kw):
+        # AsyncSnapdConnection is used directly; blocking connections
+        # (SnapdConnection, FakeSnapdConnection) are run in a thread.
+        if asyncio.iscoroutinefunction(meth):
+            return await meth(*args, **kw)
+        return await run_in_thread(partial(meth, *args, **kw))
+
     async def get(self, path, **args):
-        response = await run_in_thread(
-            partial(self.connection.get, path, **args))
+        response = await self._call(self.connection.get, path, **args)
         response.raise_for_status()
         return response.json()
 
     async def post(self, path, body, **args):
-        response = await run_in_thread(
-            partial(self.connection.post, path, body, **args))
+        response = await self._call(self.connection.post, path, body, **args)
         response.raise_for_status()
         return response.json()['change']
 
     async def post_and_wait(self, path, body, **args):
         change = await self.post(path, body, **args)
         change_path = 'v2/changes/{}'.format(change)
+        delay = self.change_poll_initial
         while True:
             result = await self.get(change_path)
             if result["result"]["status"] == "Done":
                 break
-            await asyncio.sleep(0.1)
+            await asyncio.sleep(delay)
+            delay = min(delay * self.change_poll_backoff, self.change_poll_max)
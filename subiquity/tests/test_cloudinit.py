@@ -0,0 +1,38 @@
+# Copyright 2020 Canonical, Ltd.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import unittest
+
+from subiquity.cloudinit import (
+    CLOUD_INIT_PENDING,
+    parse_cloud_init_status,
+    )
+
+
+class TestParseCloudInitStatus(unittest.TestCase):
+
+    def test_done(self):
+        self.assertEqual(parse_cloud_init_status("status: done\n"), "done")
+
+    def test_running(self):
+        status = parse_cloud_init_status("\nstatus: running\n")
+        self.assertIn(status, CLOUD_INIT_PENDING)
+
+    def test_not_run(self):
+        status = parse_cloud_init_status("status: not run\n")
+        self.assertIn(status, CLOUD_INIT_PENDING)
+
+    def test_garbage(self):
+        self.assertIsNone(parse_cloud_init_status("bzzt"))
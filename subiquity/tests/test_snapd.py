@@ -0,0 +1,157 @@
+# Copyright 2020 Canonical, Ltd.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import asyncio
+import json
+
+import requests.exceptions
+
+from subiquitycore.tests import SubiTestCase
+
+from subiquity.snapd import (
+    AsyncSnapd,
+    AsyncSnapdConnection,
+    )
+
+
+class FakeSnapdServer:
+
+    def __init__(self, path):
+        self.path = path
+        self.connections = 0
+        self.requests = []
+        self.close_after_response = False
+        self.changes = {}
+
+    async def start(self):
+        self.server = await asyncio.start_unix_server(self.handle, self.path)
+
+    async def handle(self, reader, writer):
+        self.connections += 1
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    return
+                method, path, version = request_line.decode().split()
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line == b'\r\n':
+                        break
+                    k, v = line.decode().split(':', 1)
+                    headers[k.lower()] = v.strip()
+                body = await reader.readexactly(
+                    int(headers.get('content-length', 0)))
+                self.requests.append((method, path, body))
+                self.respond(writer, path)
+                await writer.drain()
+                if self.close_after_response:
+                    return
+        finally:
+            writer.close()
+
+    def respond(self, writer, path):
+        if path == '/missing':
+            status = b'404 Not Found'
+            content = b'{}'
+        elif path.startswith('/v2/changes/'):
+            n = self.changes.setdefault(path, 0)
+            self.changes[path] += 1
+            status = b'200 OK'
+            content = json.dumps({'result': {
+                'status': 'Done' if n >= 2 else 'Doing'}}).encode()
+        elif path == '/v2/snaps/x':
+            status = b'202 Accepted'
+            content = json.dumps({'change': '7'}).encode()
+        else:
+            status = b'200 OK'
+            content = json.dumps({'path': path}).encode()
+        if path == '/chunked':
+            writer.write(
+                b'HTTP/1.1 ' + status + b'\r\n'
+                b'Transfer-Encoding: chunked\r\n\r\n')
+            for i in range(0, len(content), 5):
+                chunk = content[i:i+5]
+                writer.write(b'%x\r\n%s\r\n' % (len(chunk), chunk))
+            writer.write(b'0\r\n\r\n')
+        else:
+            writer.write(
+                b'HTTP/1.1 ' + status + b'\r\n'
+                b'Content-Length: %d\r\n\r\n' % len(content) + content)
+
+
+class TestAsyncSnapdConnection(SubiTestCase):
+
+    def run_with_server(self, test):
+        async def run():
+            server = FakeSnapdServer(self.tmp_path('snapd.socket'))
+            await server.start()
+            connection = AsyncSnapdConnection('/', server.path)
+            try:
+                await test(server, AsyncSnapd(connection))
+            finally:
+                server.server.close()
+        asyncio.run(run())
+
+    def test_keep_alive(self):
+        async def test(server, snapd):
+            for i in range(3):
+                self.assertEqual(
+                    await snapd.get('v2/find', name='a'),
+                    {'path': '/v2/find?name=a'})
+            self.assertEqual(server.connections, 1)
+        self.run_with_server(test)
+
+    def test_chunked(self):
+        async def test(server, snapd):
+            self.assertEqual(await snapd.get('chunked'), {'path': '/chunked'})
+            self.assertEqual(await snapd.get('other'), {'path': '/other'})
+            self.assertEqual(server.connections, 1)
+        self.run_with_server(test)
+
+    def test_reconnect(self):
+        async def test(server, snapd):
+            server.close_after_response = True
+            await snapd.get('a')
+            await asyncio.sleep(0)
+            self.assertEqual(await snapd.get('b'), {'path': '/b'})
+            self.assertEqual(server.connections, 2)
+        self.run_with_server(test)
+
+    def test_errors(self):
+        async def test(server, snapd):
+            with self.assertRaises(requests.exceptions.HTTPError):
+                await snapd.get('missing')
+            snapd.connection.sock = self.tmp_path('nothing-here')
+            snapd.connection._idle = []
+            with self.assertRaises(requests.exceptions.ConnectionError):
+                await snapd.get('a')
+        self.run_with_server(test)
+
+    def test_post_and_wait(self):
+        async def test(server, snapd):
+            snapd.change_poll_initial = 0.01
+            await snapd.post_and_wait('v2/snaps/x', {'action': 'refresh'})
+            self.assertEqual(
+                [(m, p) for m, p, b in server.requests], [
+                    ('POST', '/v2/snaps/x'),
+                    ('GET', '/v2/changes/7'),
+                    ('GET', '/v2/changes/7'),
+                    ('GET', '/v2/changes/7'),
+                    ])
+            self.assertEqual(
+                json.loads(server.requests[0][2]), {'action': 'refresh'})
+        self.run_with_server(test)
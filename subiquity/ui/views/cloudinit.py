@@ -0,0 +1,57 @@
+# Copyright 2020 Canonical, Ltd.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import logging
+
+from urwid import (
+    Text,
+    )
+
+from subiquitycore.ui.buttons import (
+    other_btn,
+    )
+from subiquitycore.ui.spinner import (
+    Spinner,
+    )
+from subiquitycore.ui.utils import (
+    screen,
+    )
+from subiquitycore.view import BaseView
+
+
+log = logging.getLogger("subiquity.ui.views.cloudinit")
+
+
+class WaitingForCloudInit(BaseView):
+
+    title = _("Waiting for cloud-init to complete")
+
+    def __init__(self, app, cancel_cb):
+        self.cancel_cb = cancel_cb
+        self.spinner = Spinner(aio_loop=app.aio_loop, style="dots")
+        self.spinner.start()
+        super().__init__(screen(
+            [
+                Text(_("The installer is waiting for cloud-init to finish "
+                       "configuring the system before continuing.")),
+                Text(""),
+                self.spinner,
+            ],
+            [other_btn(_("Back"), on_press=self.cancel)]
+            ))
+
+    def cancel(self, result=None):
+        self.spinner.stop()
+        self.cancel_cb()
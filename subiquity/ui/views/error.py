@@ -266,6 +266,7 @@ class ErrorReportStretchy(Stretchy):
     def opened(self):
         self.report.mark_seen()
         connect_signal(self.report, 'changed', self._report_changed)
+        self.report.ensure_loaded()
 
     def closed(self):
         disconnect_signal(self.report, 'changed', self._report_changed)
@@ -309,7 +310,7 @@ class ErrorReportListStretchy(Stretchy):
         return _("UNVIEWED")
 
     def cells_for_report(self, report):
-        date = report.pr.get("Date", "???")
+        date = report.date
         icon = ClickableIcon(date)
         connect_signal(icon, 'click', self.open_report, report)
         return [
@@ -117,6 +117,61 @@ class MountInfo:
         return i >= len(other.split_path)
 
 
+class RowCache:
+    """The rows made by one refresh of a table, for reuse by the next.
+
+    Each row is identified by a key and described by a signature, a
+    value that changes whenever the row would look different. A row is
+    only made again if there was no row with the same key last time or
+    its signature has changed, so refreshing a table after a small
+    change to the model does not remake every row, action menu and
+    widget in it.
+    """
+
+    def __init__(self):
+        self.keys = []
+        self._rows = {}  # key -> (signature, row)
+        self._new_keys = []
+        self._new_rows = {}
+
+    def row(self, key, signature, make_row):
+        cached = self._rows.get(key)
+        if cached is not None and cached[0] == signature:
+            row = cached[1]
+        else:
+            row = make_row()
+        self._new_keys.append(key)
+        self._new_rows[key] = signature, row
+        return row
+
+    def set_table_contents(self, table, count=None):
+        """Show the rows asked for since the last call in table.
+
+        If count is not None, only the first count rows are shown. The
+        row that had the focus keeps it if it is still shown.
+        """
+        focus_key = None
+        if self.keys and table._w.contents:
+            focus_key = self.keys[table._w.focus_position]
+        self.keys, self._new_keys = self._new_keys[:count], []
+        self._rows, self._new_rows = self._new_rows, {}
+        table.set_contents([self._rows[key][1] for key in self.keys])
+        if focus_key in self.keys:
+            i = self.keys.index(focus_key)
+            if table._w.contents[i][0].selectable():
+                table._w.focus_position = i
+
+
+def _cells_signature(cells):
+    signature = []
+    for cell in cells:
+        colspan = 1
+        if isinstance(cell, tuple):
+            colspan, cell = cell
+        signature.append((colspan, cell.base_widget.get_text()))
+    return signature
+
+
 class MountList(WidgetWrap):
 
     def __init__(self, parent):
@@ -130,6 +185,7 @@ class MountList(WidgetWrap):
         })
         self._no_mounts_content = Color.info_minor(
             Text(_("No disks or partitions mounted.")))
+        self._row_cache = RowCache()
         super().__init__(self.table)
 
     def _mount_action(self, sender, action, mount):
@@ -146,12 +202,12 @@ class MountList(WidgetWrap):
                 key=lambda m: (m.path == "", m.path))
         ]
         if len(mountinfos) == 0:
-            self.table.set_contents([])
+            self._row_cache.set_table_contents(self.table)
             self._w = Padding.push_2(self._no_mounts_content)
             return
         self._w = self.table
 
-        rows = [TableRow([
+        self._row_cache.row('header', None, lambda: TableRow([
             Color.info_minor(heading) for heading in [
                 Text(" "),
                 Text(_("MOUNT POINT")),
@@ -160,7 +216,7 @@ class MountList(WidgetWrap):
                 Text(_("DEVICE TYPE")),
                 Text(" "),
                 Text(" "),
-            ]])]
+            ]]))
 
         for i, mi in enumerate(mountinfos):
             path_markup = mi.path
@@ -180,31 +236,39 @@ class MountList(WidgetWrap):
                             ('info_minor', "/"),
                             "/".join(mi.split_path[1:]),
                             ]
-            actions = [(_("Unmount"), mi.mount.can_delete(), 'unmount')]
-            menu = ActionMenu(actions)
-            connect_signal(menu, 'action', self._mount_action, mi.mount)
-            cells = [
-                Text("["),
-                Text(path_markup),
-                Text(mi.size, align='right'),
-                Text(mi.fstype),
-                Text(mi.desc),
-                menu,
-                Text("]"),
-            ]
-            row = make_action_menu_row(
-                cells,
-                menu,
-                attr_map='menu_button',
-                focus_map={
-                    None: 'menu_button focus',
-                    'info_minor': 'menu_button focus',
-                })
-            rows.append(row)
-        self.table.set_contents(rows)
+            signature = (
+                path_markup, mi.size, mi.fstype, mi.desc,
+                mi.mount.can_delete())
+            self._row_cache.row(
+                id(mi.mount), signature,
+                lambda: self._make_mount_row(mi, path_markup))
+        self._row_cache.set_table_contents(self.table)
+        rows = self.table.table_rows
         if self.table._w.focus_position >= len(rows):
             self.table._w.focus_position = len(rows) - 1
 
+    def _make_mount_row(self, mi, path_markup):
+        actions = [(_("Unmount"), mi.mount.can_delete(), 'unmount')]
+        menu = ActionMenu(actions)
+        connect_signal(menu, 'action', self._mount_action, mi.mount)
+        cells = [
+            Text("["),
+            Text(path_markup),
+            Text(mi.size, align='right'),
+            Text(mi.fstype),
+            Text(mi.desc),
+            menu,
+            Text("]"),
+        ]
+        return make_action_menu_row(
+            cells,
+            menu,
+            attr_map='menu_button',
+            focus_map={
+                None: 'menu_button focus',
+                'info_minor': 'menu_button focus',
+            })
+
 
 def _stretchy_shower(cls):
     def impl(self, device):
@@ -258,6 +322,7 @@ class DeviceList(WidgetWrap):
         else:
             text = _("No used devices")
         self._no_devices_content = Color.info_minor(Text(text))
+        self._row_cache = RowCache()
         super().__init__(self.table)
 
     _disk_INFO = _stretchy_shower(DiskInfoStretchy)
@@ -311,7 +376,8 @@ class DeviceList(WidgetWrap):
         log.debug('_action %s %s', action, device.id)
         meth(device)
 
-    def _action_menu_for_device(self, device):
+    def _device_actions(self, device):
+        """Return [(action, label, enabled, whynot)] for device."""
         device_actions = []
         for action in device.supported_actions:
             label = _(action.value)
@@ -322,6 +388,12 @@ class DeviceList(WidgetWrap):
                 label = _("Add {} Partition").format(
                     device.ptable_for_new_partition().upper())
             enabled, whynot = device.action_possible(action)
+            device_actions.append((action, label, enabled, whynot))
+        return device_actions
+
+    def _action_menu_for_device(self, device, actions):
+        device_actions = []
+        for action, label, enabled, whynot in actions:
             if whynot:
                 assert not enabled
                 enabled = True
@@ -350,12 +422,11 @@ class DeviceList(WidgetWrap):
         ]
         if len(devices) == 0:
             self._w = Padding.push_2(self._no_devices_content)
-            self.table.table_rows = []
+            self._row_cache.set_table_contents(self.table)
             return
         self._w = self.table
-        rows = []
 
-        rows.append(Color.info_minor(TableRow([
+        self._row_cache.row('header', None, lambda: Color.info_minor(TableRow([
             Text(""),
             (2, Text(_("DEVICE"))),
             Text(_("TYPE")),
@@ -368,36 +439,51 @@ class DeviceList(WidgetWrap):
                     device,
                     lambda part: part.available() == self.show_available):
                 if obj is not None:
-                    menu = self._action_menu_for_device(obj)
+                    actions = self._device_actions(obj)
+                    key = id(obj)
                 else:
-                    menu = Text("")
-                if obj is device:
-                    start, end = '[', ']'
-                else:
-                    start, end = '', ''
-                cells = [Text(start)] + cells + [menu, Text(end)]
-                if obj is not None:
-                    rows.append(make_action_menu_row(cells, menu))
-                else:
-                    rows.append(TableRow(cells))
+                    actions = None
+                    key = ('usage', id(device))
+                signature = (_cells_signature(cells), actions)
+                self._row_cache.row(
+                    key, signature,
+                    lambda: self._make_device_row(device, obj, cells, actions))
             if (self.show_available
                     and device.used > 0
                     and device.free_for_partitions > 0):
                 free = humanize_size(device.free_for_partitions)
-                rows.append(TableRow([
-                    Text(""),
-                    (3, Color.info_minor(Text(_("free space")))),
-                    Text(free, align="right"),
-                    Text(""),
-                    Text(""),
-                ]))
-            rows.append(TableRow([Text("")]))
-        self.table.set_contents(rows[:-1])
+                self._row_cache.row(
+                    ('free', id(device)), free, lambda: TableRow([
+                        Text(""),
+                        (3, Color.info_minor(Text(_("free space")))),
+                        Text(free, align="right"),
+                        Text(""),
+                        Text(""),
+                    ]))
+            self._row_cache.row(
+                ('gap', id(device)), None, lambda: TableRow([Text("")]))
+        self._row_cache.set_table_contents(self.table, -1)
+        rows = self.table.table_rows
         if self.table._w.focus_position >= len(rows):
             self.table._w.focus_position = len(rows) - 1
         while not self.table._w.focus.selectable():
             self.table._w.focus_position -= 1
 
+    def _make_device_row(self, device, obj, cells, actions):
+        if obj is not None:
+            menu = self._action_menu_for_device(obj, actions)
+        else:
+            menu = Text("")
+        if obj is device:
+            start, end = '[', ']'
+        else:
+            start, end = '', ''
+        cells = [Text(start)] + cells + [menu, Text(end)]
+        if obj is not None:
+            return make_action_menu_row(cells, menu)
+        else:
+            return TableRow(cells)
+
 
 class FilesystemView(BaseView):
     title = _("Storage configuration")
@@ -494,8 +580,10 @@ class FilesystemView(BaseView):
         self.mount_list.refresh_model_inputs()
         self.avail_list.refresh_model_inputs()
         self.used_list.refresh_model_inputs()
-        # This is an awful hack, actual thinking required:
-        self.lb.base_widget._select_first_selectable()
+        # The lists keep the focus on the same row where they can, so
+        # only move it if it has ended up on something unselectable.
+        if not self.lb.base_widget.focus.selectable():
+            self.lb.base_widget._select_first_selectable()
         can_install = self.model.can_install()
         self.done.enabled = can_install
         if self.showing_guidance:
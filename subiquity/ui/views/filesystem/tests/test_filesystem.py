@@ -42,3 +42,45 @@ class FilesystemViewTests(unittest.TestCase):
             view,
             lambda w: isinstance(w, urwid.Text) and "DISK-SERIAL" in w.text)
         self.assertIsNotNone(w, "could not find DISK-SERIAL in view")
+
+    def make_disk(self, model, serial):
+        return Disk(
+            m=model, serial=serial, path='/dev/' + serial,
+            info=FakeStorageInfo(size=100*(2**20), free=50*(2**20)))
+
+    def test_refresh_reuses_unchanged_rows(self):
+        model = mock.create_autospec(spec=FilesystemModel)
+        model._orig_config = []
+        model._actions = []
+        disk1 = self.make_disk(model, "DISK1")
+        view = self.make_view(model, [disk1])
+        table = view.avail_list.table
+        rows = [r.original_widget for r in table.table_rows]
+        view.refresh_model_inputs()
+        self.assertEqual(
+            rows, [r.original_widget for r in table.table_rows])
+        disk2 = self.make_disk(model, "DISK2")
+        model.all_devices.return_value = [disk1, disk2]
+        view.refresh_model_inputs()
+        new_rows = [r.original_widget for r in table.table_rows]
+        # The rows for disk1 are reused, the gap after it and the
+        # rows for disk2 are new.
+        self.assertEqual(rows, new_rows[:len(rows)])
+        self.assertEqual(len(new_rows), 2*len(rows))
+
+    def test_refresh_keeps_focus_on_device(self):
+        model = mock.create_autospec(spec=FilesystemModel)
+        model._orig_config = []
+        model._actions = []
+        disk1 = self.make_disk(model, "DISK1")
+        disk2 = self.make_disk(model, "DISK2")
+        view = self.make_view(model, [disk1, disk2])
+        table = view.avail_list.table
+        keys = view.avail_list._row_cache.keys
+        table._w.focus_position = keys.index(id(disk2))
+        disk0 = self.make_disk(model, "DISK0")
+        model.all_devices.return_value = [disk0, disk1, disk2]
+        view.refresh_model_inputs()
+        focus = table._w.focus_position
+        self.assertEqual(
+            view.avail_list._row_cache.keys[focus], id(disk2))
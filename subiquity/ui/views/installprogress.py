@@ -28,6 +28,7 @@ from subiquitycore.ui.buttons import (
     )
 from subiquitycore.ui.container import Columns, ListBox, Pile
 from subiquitycore.ui.form import Toggleable
+from subiquitycore.ui.logview import LineBuffer, LogListBox
 from subiquitycore.ui.spinner import Spinner
 from subiquitycore.ui.utils import button_pile, Padding, rewrap
 from subiquitycore.ui.stretchy import Stretchy
@@ -48,7 +49,7 @@ class ProgressView(BaseView):
 
     title = _("Install progress")
 
-    def __init__(self, controller):
+    def __init__(self, controller, log_spill_path=None):
         self.controller = controller
         self.ongoing = {}  # context -> line containing a spinner
 
@@ -72,7 +73,8 @@ class ProgressView(BaseView):
         ]
         self.event_pile = Pile(event_body)
 
-        self.log_listbox = ListBox()
+        self.log_lines = LineBuffer(spill_path=log_spill_path)
+        self.log_listbox = LogListBox(self.log_lines)
         log_linebox = MyLineBox(self.log_listbox, _("Full installer output"))
         log_body = [
             ('weight', 1, log_linebox),
@@ -83,28 +85,41 @@ class ProgressView(BaseView):
 
         super().__init__(self.event_pile)
 
-    def _add_line(self, lb, line):
+    def _add_lines(self, lb, lines):
         lb = lb.base_widget
         walker = lb.body
         at_end = len(walker) == 0 or lb.focus_position == len(walker) - 1
-        walker.append(line)
+        walker.extend(lines)
         if at_end:
             lb.set_focus(len(walker) - 1)
             lb.set_focus_valign('bottom')
 
+    def _add_line(self, lb, line):
+        self._add_lines(lb, [line])
+
+    def _event_text(self, context, message):
+        indent = '  ' * (context.full_name().count('/') - 2)
+        return Text(indent + message)
+
     def event_start(self, context, message):
         self.event_finish(context.parent)
         walker = self.event_listbox.base_widget.body
-        indent = '  ' * (context.full_name().count('/') - 2)
         spinner = Spinner(self.controller.app.aio_loop)
         spinner.start()
         new_line = Columns([
-            ('pack', Text(indent + message)),
+            ('pack', self._event_text(context, message)),
             ('pack', spinner),
             ], dividechars=1)
         self.ongoing[context] = len(walker)
         self._add_line(self.event_listbox, new_line)
 
+    def event_start_and_finish(self, context, message):
+        # The same as event_start followed by event_finish, but without
+        # the pointless spinner.
+        self.event_finish(context.parent)
+        self._add_line(
+            self.event_listbox, self._event_text(context, message))
+
     def event_finish(self, context):
         index = self.ongoing.pop(context, None)
         if index is None:
@@ -119,7 +134,10 @@ class ProgressView(BaseView):
             self.event_finish(context)
 
     def add_log_line(self, text):
-        self._add_line(self.log_listbox, Text(text))
+        self.add_log_lines([text])
+
+    def add_log_lines(self, texts):
+        self.log_listbox.base_widget.body.add_lines(texts)
 
     def set_status(self, text):
         self.event_linebox.set_title(text)
@@ -372,6 +372,7 @@ class SnapListView(BaseView):
         self.model = model
         self.controller = controller
         self.to_install = model.to_install.copy()
+        self._main_screen = None
         self.load()
 
     def loaded(self):
@@ -399,6 +400,16 @@ class SnapListView(BaseView):
             excerpt=_("Loading server snaps from store, please wait..."))
         schedule_task(self._wait(t, spinner))
 
+    def snap_list_refreshed(self):
+        # The list was shown from the cache and the store has now sent
+        # an up to date one.
+        if self._main_screen is None:
+            return
+        showing = self._w is self._main_screen
+        self.make_main_screen(self.model.get_snap_list())
+        if showing:
+            self.show_main_screen()
+
     def offer_retry(self):
         self._w = screen(
             [Text(_("Sorry, loading snaps from the store failed."))],
@@ -32,3 +32,19 @@ class IdentityViewTests(unittest.TestCase):
         self.assertIsNot(btn, None)
         view_helpers.click(btn)
         view.controller.click_reboot.assert_called_once_with()
+
+    def test_add_log_lines(self):
+        view = self.make_view()
+        view.add_log_lines(["one", "two", "three"])
+        self.assertEqual(
+            list(view.log_lines.lines), ["one", "two", "three"])
+        self.assertEqual(view.log_listbox.base_widget.focus_position, 2)
+
+    def test_event_start_and_finish(self):
+        view = self.make_view()
+        context = mock.Mock()
+        context.full_name.return_value = "/a/b"
+        view.event_start_and_finish(context, "message")
+        self.assertEqual(view.ongoing, {})
+        walker = view.event_listbox.base_widget.body
+        self.assertEqual([w.text for w in walker], ["message"])
@@ -0,0 +1,116 @@
+# Copyright 2020 Canonical, Ltd.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+""" Record timings of a whole run for scripts/replay-benchmark.py.
+
+When SUBIQUITY_BENCHMARK_REPORT is set in the environment, the
+application creates a BenchmarkRecorder and tells it about screen
+transitions and controller contexts as they happen, and the app's
+LoopMonitor reports how late the event loop runs callbacks. The
+results are written as JSON to the named file when the application
+finishes.
+"""
+
+import json
+import logging
+import resource
+import time
+
+
+log = logging.getLogger('subiquitycore.benchmark')
+
+ENV_VAR = 'SUBIQUITY_BENCHMARK_REPORT'
+
+
+def _summarize(values):
+    if not values:
+        return {'count': 0}
+    values = sorted(values)
+    return {
+        'count': len(values),
+        'mean': sum(values) / len(values),
+        'p95': values[int(0.95 * (len(values) - 1))],
+        'max': values[-1],
+        }
+
+
+class BenchmarkRecorder:
+
+    def __init__(self, path):
+        self.path = path
+        self.start_time = time.monotonic()
+        self.screens = []  # [name, seconds since start, seconds in start_ui]
+        # controller name -> [open context count, busy since, busy seconds]
+        self.controllers = {}
+        self.lags = []
+
+    def now(self):
+        return time.monotonic() - self.start_time
+
+    def record_lag(self, lag):
+        self.lags.append(lag)
+
+    def screen_selected(self, name, start_ui_time):
+        self.screens.append([name, self.now(), start_ui_time])
+
+    def controller_context_entered(self, name):
+        state = self.controllers.setdefault(name, [0, 0.0, 0.0])
+        if state[0] == 0:
+            state[1] = self.now()
+        state[0] += 1
+
+    def controller_context_exited(self, name):
+        state = self.controllers.get(name)
+        if state is None or state[0] == 0:
+            return
+        state[0] -= 1
+        if state[0] == 0:
+            state[2] += self.now() - state[1]
+
+    def report(self):
+        now = self.now()
+        controllers = {}
+        for name, (count, since, busy) in self.controllers.items():
+            if count > 0:
+                busy += now - since
+            controllers[name] = busy
+        transitions = []
+        for prev, cur in zip(self.screens, self.screens[1:]):
+            transitions.append({
+                'from': prev[0],
+                'to': cur[0],
+                'seconds': cur[1] - prev[1],
+                'start_ui': cur[2],
+                })
+        # ru_maxrss is in kilobytes on Linux.
+        peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+        return {
+            'wall_time': now,
+            'peak_rss': peak_rss,
+            'controllers': controllers,
+            'screens': [
+                {'name': name, 'at': at, 'start_ui': start_ui}
+                for name, at, start_ui in self.screens
+                ],
+            'transitions': transitions,
+            'loop_lag': _summarize(self.lags),
+            }
+
+    def finish(self):
+        try:
+            with open(self.path, 'w') as fp:
+                json.dump(self.report(), fp, indent=2)
+        except OSError:
+            log.exception("writing benchmark report failed")
@@ -14,12 +14,16 @@
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
 import asyncio
+import collections
 import fcntl
 import json
 import logging
 import os
 import struct
 import sys
+import threading
+import time
+import traceback
 import tty
 
 import urwid
@@ -34,6 +38,7 @@ from subiquitycore.controller import (
     )
 from subiquitycore.signals import Signal
 from subiquitycore.prober import Prober
+from subiquitycore import benchmark, startup_profiler
 from subiquitycore.ui.frame import SubiquityCoreUI
 from subiquitycore.utils import arun_command
 
@@ -239,8 +244,120 @@ class DummyKeycodesFilter:
         return keys
 
 
+DEFAULT_MAX_FPS = 30
+
+# urwid has no way to be told when a widget changes, so while any
+# AsyncioEventLoops are running CanvasCache.invalidate is replaced by
+# _invalidate_and_redraw, which also requests a redraw from each of them.
+# The original is put back when the last of them stops.
+_redrawing_loops = []
+_original_invalidate = None
+
+
+def _invalidate_and_redraw(widget):
+    _original_invalidate.__get__(None, urwid.CanvasCache)(widget)
+    for event_loop in _redrawing_loops:
+        event_loop.request_redraw()
+
+
 class AsyncioEventLoop(urwid.AsyncioEventLoop):
-    # This is fixed in the latest urwid.
+    """urwid's AsyncioEventLoop with the redraws it triggers rate limited.
+
+    urwid redraws the screen from "idle" callbacks, which the stock
+    implementation runs after every input and alarm callback (or polls
+    for many times a second). Here idle callbacks run at most max_fps
+    times a second, and only when something asked for a redraw: input
+    arriving, an alarm firing or, while the loop is running, a widget
+    being invalidated (which is how changes made from plain asyncio
+    callbacks and tasks are noticed). However many things change in one
+    frame the screen is drawn once, and when nothing changes it is not
+    drawn at all. If redraw is set to False idle callbacks are never run.
+    """
+
+    def __init__(self, *, loop, max_fps=DEFAULT_MAX_FPS):
+        super().__init__(loop=loop)
+        self.frame_interval = 1 / max(1, max_fps)
+        self.redraw = True
+        self.redraws_requested = 0
+        self.redraws_performed = 0
+        self._redraw_callbacks = {}
+        self._redraw_callback_handle = 0
+        self._frame_handle = None
+        self._last_frame = None
+        self._drawing = False
+
+    def _hook_invalidate(self):
+        global _original_invalidate
+        if not _redrawing_loops:
+            _original_invalidate = urwid.CanvasCache.__dict__['invalidate']
+            urwid.CanvasCache.invalidate = _invalidate_and_redraw
+        _redrawing_loops.append(self)
+
+    def _unhook_invalidate(self):
+        global _original_invalidate
+        _redrawing_loops.remove(self)
+        if not _redrawing_loops:
+            urwid.CanvasCache.invalidate = _original_invalidate
+            _original_invalidate = None
+
+    def run(self):
+        self._hook_invalidate()
+        try:
+            super().run()
+        finally:
+            self._unhook_invalidate()
+
+    def alarm(self, seconds, callback):
+        return self._loop.call_later(seconds, self._and_redraw(callback))
+
+    def watch_file(self, fd, callback):
+        self._loop.add_reader(fd, self._and_redraw(callback))
+        return fd
+
+    def enter_idle(self, callback):
+        self._redraw_callback_handle += 1
+        self._redraw_callbacks[self._redraw_callback_handle] = callback
+        self.request_redraw()
+        return self._redraw_callback_handle
+
+    def remove_enter_idle(self, handle):
+        return self._redraw_callbacks.pop(handle, None) is not None
+
+    def _and_redraw(self, callback):
+        def wrapper():
+            try:
+                return callback()
+            finally:
+                self.request_redraw()
+        return wrapper
+
+    def request_redraw(self):
+        if self._drawing:
+            # Widgets invalidated while the screen is being drawn have
+            # just been drawn.
+            return
+        self.redraws_requested += 1
+        if not self.redraw or self._frame_handle is not None:
+            return
+        if self._last_frame is None:
+            delay = 0
+        else:
+            delay = max(
+                0, self._last_frame + self.frame_interval - self._loop.time())
+        self._frame_handle = self._loop.call_later(delay, self._frame)
+
+    def _frame(self):
+        self._frame_handle = None
+        self._last_frame = self._loop.time()
+        if not self._redraw_callbacks:
+            return
+        self.redraws_performed += 1
+        self._drawing = True
+        try:
+            for callback in list(self._redraw_callbacks.values()):
+                callback()
+        finally:
+            self._drawing = False
 
     def _exception_handler(self, loop, context):
         exc = context.get('exception')
@@ -254,6 +371,140 @@ class AsyncioEventLoop(urwid.AsyncioEventLoop):
             loop.default_exception_handler(context)
 
 
+# The event loop is considered blocked if a callback or task step runs
+# for longer than this many seconds.
+SLOW_CALLBACK_THRESHOLD = 0.25
+LOOP_MONITOR_INTERVAL = 0.05
+# Setting this in the environment turns the loop monitor on; its value,
+# if it is a number, is the threshold in seconds (0 turns it off).
+LOOP_MONITOR_ENV_VAR = 'SUBIQUITY_LOOP_MONITOR'
+
+
+def loop_monitor_threshold(environ, default_on=False):
+    """Return the blocking threshold the loop monitor should use.
+
+    Returns None if the monitor should not run at all: it wakes the loop
+    LOOP_MONITOR_INTERVAL times a second and runs a watchdog thread, so
+    it is only on when asked for (or default_on is passed, as it is for
+    dry-run and benchmark runs).
+    """
+    value = environ.get(LOOP_MONITOR_ENV_VAR)
+    if value is None:
+        return SLOW_CALLBACK_THRESHOLD if default_on else None
+    try:
+        threshold = float(value)
+    except ValueError:
+        log.warning(
+            "ignoring invalid %s=%r", LOOP_MONITOR_ENV_VAR, value)
+        return SLOW_CALLBACK_THRESHOLD
+    if threshold <= 0:
+        return None
+    return threshold
+
+
+class LoopMonitor:
+    """Watch for the event loop being blocked.
+
+    A callback scheduled every LOOP_MONITOR_INTERVAL seconds measures how
+    late the loop runs it. A watchdog thread notices when that callback
+    has not run for more than the threshold and records the main
+    thread's stack at that point, which is where the loop is stuck, along
+    with the controller module it is in.
+    """
+
+    def __init__(self, aio_loop, threshold=SLOW_CALLBACK_THRESHOLD,
+                 max_records=20, on_lag=None):
+        self.aio_loop = aio_loop
+        self.threshold = threshold
+        self.on_lag = on_lag
+        self.lag_count = 0
+        self.lag_total = 0.0
+        self.lag_max = 0.0
+        # [seconds blocked, controller, formatted stack], most recent
+        # first.
+        self.slow = collections.deque(maxlen=max_records)
+        self._lock = threading.Lock()
+        self._last_beat = time.monotonic()
+        self._stall = None
+        self._handle = None
+        self._thread = None
+        self._stopped = threading.Event()
+        self._loop_thread_id = None
+
+    def start(self):
+        self._loop_thread_id = threading.get_ident()
+        self._last_beat = time.monotonic()
+        self._schedule()
+        self._thread = threading.Thread(
+            target=self._watch, name="loop-monitor", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+        if self._handle is not None:
+            self._handle.cancel()
+            self._handle = None
+
+    def _schedule(self):
+        expected = self.aio_loop.time() + LOOP_MONITOR_INTERVAL
+        self._handle = self.aio_loop.call_at(expected, self._beat, expected)
+
+    def _beat(self, expected):
+        lag = max(0.0, self.aio_loop.time() - expected)
+        self.lag_count += 1
+        self.lag_total += lag
+        self.lag_max = max(self.lag_max, lag)
+        if self.on_lag is not None:
+            self.on_lag(lag)
+        now = time.monotonic()
+        with self._lock:
+            stall, self._stall = self._stall, None
+            blocked = now - self._last_beat - LOOP_MONITOR_INTERVAL
+            self._last_beat = now
+        if stall is not None:
+            controller, stack = stall
+            log.debug(
+                "event loop blocked for %.3fs in %s at:\n%s",
+                blocked, controller, stack)
+            self.slow.appendleft([blocked, controller, stack])
+        self._schedule()
+
+    def _watch(self):
+        while not self._stopped.wait(LOOP_MONITOR_INTERVAL):
+            with self._lock:
+                if self._stall is not None:
+                    continue
+                overdue = time.monotonic() - self._last_beat
+                if overdue < LOOP_MONITOR_INTERVAL + self.threshold:
+                    continue
+                frame = sys._current_frames().get(self._loop_thread_id)
+                if frame is None:
+                    continue
+                self._stall = self._describe(frame)
+
+    def _describe(self, frame):
+        controller = None
+        f = frame
+        while f is not None:
+            modname = f.f_globals.get('__name__', '')
+            if '.controllers.' in modname:
+                controller = modname.rsplit('.', 1)[1]
+                break
+            f = f.f_back
+        return controller, ''.join(traceback.format_stack(frame))
+
+    def report(self):
+        lines = ["loop lag: {} samples, mean {:.3f}s, max {:.3f}s".format(
+            self.lag_count, self.lag_total / max(self.lag_count, 1),
+            self.lag_max)]
+        for blocked, controller, stack in self.slow:
+            lines.append("")
+            lines.append("blocked for {:.3f}s in {}:".format(
+                blocked, controller))
+            lines.append(stack.rstrip())
+        return "\n".join(lines)
+
+
 class ControllerSet:
 
     def __init__(self, app, names):
@@ -270,6 +521,10 @@ class ControllerSet:
     def load(self, name):
         self.controller_names.remove(name)
         log.debug("Importing controller: %s", name)
+        with startup_profiler.phase("controller " + name):
+            self._load(name)
+
+    def _load(self, name):
         klass = self._get_controller_class(name)
         if hasattr(self, name):
             c = 1
@@ -326,6 +581,8 @@ class Application:
             #    subiquity/controllers/installprogress.py
             #  - bpfail-full, bpfail-restricted: makes block probing fail, see
             #    subiquitycore/prober.py
+            #  - bpslow-<type>: makes the <type> (e.g. lvm) storage probe
+            #    time out, see subiquitycore/prober.py
             #  - copy-logs-fail: makes post-install copying of logs fail, see
             #    subiquity/controllers/installprogress.py
             self.debug_flags = os.environ.get('SUBIQUITY_DEBUG', '').split(',')
@@ -361,6 +618,12 @@ class Application:
 
         self.scale_factor = float(
             os.environ.get('SUBIQUITY_REPLAY_TIMESCALE', "1"))
+        max_fps = os.environ.get('SUBIQUITY_MAX_FPS', DEFAULT_MAX_FPS)
+        try:
+            self.max_fps = max(1.0, float(max_fps))
+        except ValueError:
+            log.warning("ignoring invalid SUBIQUITY_MAX_FPS=%r", max_fps)
+            self.max_fps = DEFAULT_MAX_FPS
         self.updated = os.path.exists(os.path.join(self.state_dir, 'updating'))
         self.signal = Signal()
         self.prober = prober
@@ -368,6 +631,11 @@ class Application:
         self.urwid_loop = None
         self.controllers = ControllerSet(self, self.controllers)
         self.context = self.context_cls.new(self)
+        self.loop_monitor = None
+        self.benchmark = None
+        benchmark_path = os.environ.get(benchmark.ENV_VAR)
+        if benchmark_path:
+            self.benchmark = benchmark.BenchmarkRecorder(benchmark_path)
 
     def new_event_loop(self):
         new_loop = asyncio.new_event_loop()
@@ -431,11 +699,15 @@ class Application:
         new.context.enter("starting UI")
         if self.opts.screens and new.name not in self.opts.screens:
             raise Skip
+        start = time.monotonic()
         try:
             new.start_ui()
         except Skip:
             new.context.exit("(skipped)")
             raise
+        if self.benchmark is not None:
+            self.benchmark.screen_selected(
+                new.name, time.monotonic() - start)
         state_path = os.path.join(self.state_dir, 'last-screen')
         with open(state_path, 'w') as fp:
             fp.write(new.name)
@@ -649,13 +921,18 @@ class Application:
     def run(self, input=None, output=None):
         log.debug("Application.run")
         screen = self.make_screen(input, output)
+        event_loop = AsyncioEventLoop(
+            loop=self.aio_loop, max_fps=self.max_fps)
+        if getattr(screen, 'output_discarded', False):
+            # Nobody will ever see what would be drawn.
+            event_loop.redraw = False
 
         self.urwid_loop = urwid.MainLoop(
             self.ui, palette=self.color_palette, screen=screen,
             handle_mouse=False, pop_ups=True,
             input_filter=self.input_filter.filter,
             unhandled_input=self.unhandled_input,
-            event_loop=AsyncioEventLoop(loop=self.aio_loop))
+            event_loop=event_loop)
 
         if self.opts.ascii:
             urwid.util.set_encoding('ascii')
@@ -664,7 +941,8 @@ class Application:
 
         self.toggle_color()
 
-        self.base_model = self.make_model()
+        with startup_profiler.phase("make_model"):
+            self.base_model = self.make_model()
         try:
             if self.opts.scripts:
                 self.run_scripts(self.opts.scripts)
@@ -679,11 +957,32 @@ class Application:
             self.aio_loop.call_soon(self.setraw)
             self.aio_loop.call_soon(
                 self.select_initial_screen, initial_controller_index)
+            self.aio_loop.call_soon(startup_profiler.finish)
             self._connect_base_signals()
 
-            self.start_controllers()
-
+            with startup_profiler.phase("start_controllers"):
+                self.start_controllers()
+
+            threshold = loop_monitor_threshold(
+                os.environ,
+                default_on=self.opts.dry_run or self.benchmark is not None)
+            if threshold is not None:
+                on_lag = None
+                if self.benchmark is not None:
+                    on_lag = self.benchmark.record_lag
+                self.loop_monitor = LoopMonitor(
+                    self.aio_loop, threshold=threshold, on_lag=on_lag)
+                self.loop_monitor.start()
             self.urwid_loop.run()
+            if self.loop_monitor is not None:
+                self.loop_monitor.stop()
+                log.debug(
+                    "event loop monitor: %s", self.loop_monitor.report())
+            log.debug(
+                "redraws: %d requested, %d performed",
+                event_loop.redraws_requested, event_loop.redraws_performed)
+            if self.benchmark is not None:
+                self.benchmark.finish()
         except Exception:
             log.exception("Exception in controller.run():")
             raise
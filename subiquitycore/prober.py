@@ -13,7 +13,10 @@
 # You should have received a copy of the GNU Affero General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
+import concurrent.futures
+import json
 import logging
+import os
 import time
 import yaml
 
@@ -25,6 +28,125 @@ from probert.network import (
 log = logging.getLogger('subiquitycore.prober')
 
 
+def _read_attr(path):
+    try:
+        with open(path) as fp:
+            return fp.read().strip()
+    except OSError:
+        return None
+
+
+def _read_dir(path):
+    try:
+        return sorted(os.listdir(path))
+    except OSError:
+        return []
+
+
+# The udev properties that describe what is on a device, as opposed to
+# how it is connected.
+_FINGERPRINT_UDEV_PREFIXES = ('ID_PART_TABLE_', 'ID_FS_', 'DM_', 'MD_')
+
+
+def _udev_properties(udev_data_dir, devno):
+    props = {}
+    try:
+        with open(os.path.join(udev_data_dir, "b" + devno)) as fp:
+            for line in fp:
+                if not line.startswith("E:"):
+                    continue
+                key, _, value = line[2:].rstrip("\n").partition("=")
+                if key.startswith(_FINGERPRINT_UDEV_PREFIXES):
+                    props[key] = value
+    except OSError:
+        pass
+    return props
+
+
+def block_device_fingerprints(sys_class_block='/sys/class/block',
+                              dev_dir='/dev', udev_data_dir='/run/udev/data'):
+    """Cheaply summarize the state of each block device.
+
+    Returns a dict mapping device path to a dict of things that will
+    change if the device (or what is on it) does: its size, serial, the
+    mtime of its device node, what udev knows about its partition table,
+    filesystem and device mapper or md membership, and its holders and
+    slaves. Nothing here touches the devices themselves, so this is fast
+    even if probing them is not.
+    """
+    r = {}
+    try:
+        names = sorted(os.listdir(sys_class_block))
+    except OSError:
+        return r
+    for name in names:
+        sysdir = os.path.join(sys_class_block, name)
+        devno = _read_attr(os.path.join(sysdir, 'dev'))
+        serial = _read_attr(os.path.join(sysdir, 'device', 'serial'))
+        if serial is None:
+            serial = _read_attr(os.path.join(sysdir, 'device', 'wwid'))
+        udev = {}
+        if devno is not None:
+            udev = _udev_properties(udev_data_dir, devno)
+        path = os.path.join(dev_dir, name.replace('!', '/'))
+        try:
+            mtime = os.stat(path).st_mtime_ns
+        except OSError:
+            mtime = None
+        r[path] = {
+            'size': _read_attr(os.path.join(sysdir, 'size')),
+            'serial': serial,
+            'udev': udev,
+            'holders': _read_dir(os.path.join(sysdir, 'holders')),
+            'slaves': _read_dir(os.path.join(sysdir, 'slaves')),
+            'mtime': mtime,
+            }
+    return r
+
+
+class StorageProbeCache:
+    """Storage probe data saved along with the fingerprints of the devices.
+
+    If none of the block devices have changed since the data was saved
+    (e.g. because the installer has just been restarted), the data can be
+    used instead of probing again.
+    """
+
+    version = 2
+
+    def __init__(self, path):
+        self.path = path
+
+    def load(self, fingerprints):
+        try:
+            with open(self.path) as fp:
+                cached = json.load(fp)
+        except (OSError, ValueError):
+            return None
+        if cached.get('version') != self.version:
+            return None
+        old = cached['fingerprints']
+        changed = sorted(
+            path for path in old.keys() | fingerprints.keys()
+            if old.get(path) != fingerprints.get(path))
+        if changed:
+            log.debug(
+                "not using cached storage probe data, %s changed", changed)
+            return None
+        log.debug("using cached storage probe data from %s", self.path)
+        return cached['storage']
+
+    def save(self, fingerprints, storage):
+        tmp = self.path + '.tmp'
+        with open(tmp, 'w') as fp:
+            json.dump({
+                'version': self.version,
+                'fingerprints': fingerprints,
+                'storage': storage,
+                }, fp)
+        os.rename(tmp, self.path)
+
+
 class Prober():
     def __init__(self, machine_config, debug_flags):
         self.saved_config = None
@@ -42,14 +164,28 @@ class Prober():
             observer = UdevObserver(receiver)
         return observer, observer.start()
 
-    def get_storage(self, probe_types=None):
+    def storage_probe_types(self):
+        if self.saved_config is not None:
+            return set(self.saved_config['storage'])
+        from probert.storage import Storage
+        return set(Storage().probe_map)
+
+    def get_storage(self, probe_types=None, *, restricted=None):
+        # restricted says which of the full and restricted probes this is
+        # for the bpfail-* debug flags. By default any probe for a subset
+        # of the types counts as restricted.
+        if restricted is None:
+            restricted = probe_types is not None
         if self.saved_config is not None:
             flag = 'bpfail-full'
-            if probe_types is not None:
+            if restricted:
                 flag = 'bpfail-restricted'
             if flag in self.debug_flags:
                 time.sleep(2)
                 1/0
+            for probe_type in probe_types or ():
+                if 'bpslow-' + probe_type in self.debug_flags:
+                    time.sleep(20)
             r = self.saved_config['storage'].copy()
             if probe_types is not None:
                 for k in self.saved_config['storage']:
@@ -58,3 +194,75 @@ class Prober():
             return r
         from probert.storage import Storage
         return Storage().probe(probe_types=probe_types)
+
+    def get_storage_by_type(self, probe_types=None, *, timeout, max_workers):
+        """Run each type of storage probe in a thread of its own.
+
+        At most max_workers probes run at once and each one is given
+        timeout seconds from when it starts. Returns a tuple of the probe
+        data for the types that succeeded and a dict mapping the types that
+        failed or timed out to a description of what went wrong. The
+        blockdev probe is essential, so if that fails an exception is
+        raised instead.
+        """
+        if probe_types is None:
+            probe_types = self.storage_probe_types()
+        started = {}
+
+        def probe(probe_type):
+            started[probe_type] = time.monotonic()
+            return self.get_storage(
+                {probe_type}, restricted=False)[probe_type]
+
+        executor = concurrent.futures.ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix='storage-probe')
+        futures = {
+            executor.submit(probe, probe_type): probe_type
+            for probe_type in sorted(probe_types)
+            }
+        results = {}
+        failures = {}
+        pending = set(futures)
+        # Threads cannot be interrupted, so a probe that has timed out keeps
+        # its worker busy until it returns (if ever).
+        hung = 0
+        try:
+            while pending:
+                deadlines = [
+                    started[futures[f]] + timeout
+                    for f in pending if futures[f] in started
+                    ]
+                if deadlines:
+                    wait = max(0, min(deadlines) - time.monotonic())
+                else:
+                    wait = timeout
+                done, pending = concurrent.futures.wait(
+                    pending, wait, concurrent.futures.FIRST_COMPLETED)
+                for f in done:
+                    probe_type = futures[f]
+                    try:
+                        results[probe_type] = f.result()
+                    except Exception as e:
+                        log.exception("%s storage probe failed", probe_type)
+                        failures[probe_type] = "failed: {!r}".format(e)
+                now = time.monotonic()
+                for f in list(pending):
+                    probe_type = futures[f]
+                    if probe_type in started:
+                        if now - started[probe_type] >= timeout:
+                            log.warning(
+                                "%s storage probe timed out", probe_type)
+                            failures[probe_type] = (
+                                "timed out after {}s".format(timeout))
+                            pending.remove(f)
+                            hung += 1
+                    elif hung >= max_workers:
+                        failures[probe_type] = "not run"
+                        pending.remove(f)
+                        f.cancel()
+        finally:
+            executor.shutdown(wait=False)
+        if 'blockdev' in failures:
+            raise Exception(
+                "blockdev storage probe " + failures['blockdev'])
+        return results, failures
@@ -0,0 +1,140 @@
+# Copyright 2020 Canonical, Ltd.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+""" Record where the time goes between starting and showing a screen.
+
+When SUBIQUITY_PROFILE_STARTUP is set in the environment, the entry
+point calls start() as early as it can. From then on the time taken
+by every module imported for the first time, and by any code wrapped
+in phase(), is recorded until finish() writes it all out as JSON.
+When profiling is not enabled, phase() does nothing and finish() is a
+no-op, so they can be left in place permanently.
+"""
+
+import builtins
+import contextlib
+import importlib.util
+import json
+import logging
+import sys
+import threading
+import time
+
+
+log = logging.getLogger('subiquitycore.startup_profiler')
+
+ENV_VAR = 'SUBIQUITY_PROFILE_STARTUP'
+
+_profiler = None
+
+
+class StartupProfiler:
+
+    def __init__(self, path):
+        self.path = path
+        self.start_time = time.perf_counter()
+        # [name, inclusive seconds, seconds excluding nested imports]
+        self.imports = []
+        self.phases = []  # [name, seconds]
+        # Imports happen in other threads too (e.g. probert's, via
+        # run_in_thread), so each thread has its own stack of the time
+        # spent in imports nested inside the ones in progress.
+        self._local = threading.local()
+        self._orig_import = None
+
+    def install(self):
+        self._orig_import = builtins.__import__
+        builtins.__import__ = self._import
+
+    def uninstall(self):
+        if self._orig_import is not None:
+            builtins.__import__ = self._orig_import
+            self._orig_import = None
+
+    def _import(self, name, globals=None, locals=None, fromlist=(),
+                level=0):
+        full_name = name
+        if level > 0 and globals and globals.get('__package__'):
+            full_name = importlib.util.resolve_name(
+                '.' * level + name, globals['__package__'])
+        if full_name in sys.modules:
+            return self._orig_import(name, globals, locals, fromlist, level)
+        entry = [full_name, 0.0, 0.0]
+        stack = getattr(self._local, 'stack', None)
+        if stack is None:
+            stack = self._local.stack = []
+        stack.append(0.0)
+        start = time.perf_counter()
+        try:
+            return self._orig_import(name, globals, locals, fromlist, level)
+        finally:
+            elapsed = time.perf_counter() - start
+            nested = stack.pop()
+            entry[1] = elapsed
+            entry[2] = elapsed - nested
+            if stack:
+                stack[-1] += elapsed
+            self.imports.append(entry)
+
+    @contextlib.contextmanager
+    def phase(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases.append([name, time.perf_counter() - start])
+
+    def report(self):
+        return {
+            'total': time.perf_counter() - self.start_time,
+            'phases': self.phases,
+            'imports': sorted(
+                self.imports, key=lambda entry: entry[2], reverse=True),
+            }
+
+    def write(self):
+        with open(self.path, 'w') as fp:
+            json.dump(self.report(), fp, indent=2)
+
+
+def start(path):
+    """Start profiling, to be written to path by finish()."""
+    global _profiler
+    if _profiler is not None:
+        return
+    _profiler = StartupProfiler(path)
+    _profiler.install()
+
+
+def phase(name):
+    if _profiler is None:
+        return contextlib.suppress()
+    return _profiler.phase(name)
+
+
+def finish():
+    global _profiler
+    if _profiler is None:
+        return
+    profiler, _profiler = _profiler, None
+    profiler.uninstall()
+    try:
+        profiler.write()
+    except OSError:
+        log.exception("writing startup profile failed")
+    else:
+        log.debug(
+            "startup took %.3fs, profile written to %s",
+            profiler.report()['total'], profiler.path)
@@ -0,0 +1,56 @@
+# Copyright 2020 Canonical, Ltd.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import json
+
+from subiquitycore.benchmark import BenchmarkRecorder
+from subiquitycore.tests import SubiTestCase
+
+
+class TestBenchmarkRecorder(SubiTestCase):
+
+    def test_controllers(self):
+        recorder = BenchmarkRecorder(self.tmp_path('report.json'))
+        recorder.controller_context_entered('Network')
+        recorder.controller_context_entered('Network')
+        recorder.controller_context_exited('Network')
+        recorder.controller_context_exited('Network')
+        recorder.controller_context_exited('Network')
+        recorder.controller_context_entered('Filesystem')
+        report = recorder.report()
+        self.assertEqual(
+            set(report['controllers']), {'Network', 'Filesystem'})
+        self.assertEqual(recorder.controllers['Network'][0], 0)
+
+    def test_transitions(self):
+        recorder = BenchmarkRecorder(self.tmp_path('report.json'))
+        recorder.screen_selected('Welcome', 0.1)
+        recorder.screen_selected('Keyboard', 0.2)
+        [transition] = recorder.report()['transitions']
+        self.assertEqual(transition['from'], 'Welcome')
+        self.assertEqual(transition['to'], 'Keyboard')
+        self.assertEqual(transition['start_ui'], 0.2)
+
+    def test_finish_writes_report(self):
+        path = self.tmp_path('report.json')
+        recorder = BenchmarkRecorder(path)
+        recorder.record_lag(0.1)
+        recorder.record_lag(0.3)
+        recorder.finish()
+        with open(path) as fp:
+            report = json.load(fp)
+        self.assertEqual(report['loop_lag']['count'], 2)
+        self.assertEqual(report['loop_lag']['max'], 0.3)
+        self.assertGreater(report['peak_rss'], 0)
@@ -0,0 +1,203 @@
+# Copyright 2020 Canonical, Ltd.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import asyncio
+import time
+import unittest
+from unittest import mock
+
+import urwid
+
+from subiquitycore.core import (
+    AsyncioEventLoop,
+    LoopMonitor,
+    loop_monitor_threshold,
+    LOOP_MONITOR_ENV_VAR,
+    SLOW_CALLBACK_THRESHOLD,
+    )
+
+
+def block_the_loop():
+    time.sleep(0.3)
+
+
+class TestLoopMonitor(unittest.TestCase):
+
+    def test_records_blocking_callback(self):
+        loop = asyncio.new_event_loop()
+        self.addCleanup(loop.close)
+        lags = []
+        monitor = LoopMonitor(loop, threshold=0.1, on_lag=lags.append)
+        monitor.start()
+        loop.call_later(0.1, block_the_loop)
+        loop.call_later(0.6, loop.stop)
+        loop.run_forever()
+        monitor.stop()
+        self.assertEqual(len(monitor.slow), 1)
+        [[blocked, controller, stack]] = monitor.slow
+        self.assertGreater(blocked, 0.2)
+        self.assertIsNone(controller)
+        self.assertIn('block_the_loop', stack)
+        self.assertGreater(monitor.lag_max, 0.2)
+        self.assertEqual(len(lags), monitor.lag_count)
+        self.assertIn('block_the_loop', monitor.report())
+
+    def test_threshold_from_environment(self):
+        self.assertIsNone(loop_monitor_threshold({}))
+        self.assertEqual(
+            loop_monitor_threshold({}, default_on=True),
+            SLOW_CALLBACK_THRESHOLD)
+        self.assertEqual(
+            loop_monitor_threshold({LOOP_MONITOR_ENV_VAR: '0.5'}), 0.5)
+        self.assertEqual(
+            loop_monitor_threshold({LOOP_MONITOR_ENV_VAR: ''}),
+            SLOW_CALLBACK_THRESHOLD)
+        self.assertIsNone(
+            loop_monitor_threshold(
+                {LOOP_MONITOR_ENV_VAR: '0'}, default_on=True))
+
+
+class FakeHandle:
+
+    def __init__(self, when, callback):
+        self.when = when
+        self.callback = callback
+        self.cancelled = False
+
+    def cancel(self):
+        self.cancelled = True
+
+
+class FakeLoop:
+    """Just enough of an asyncio loop to run timers on a fake clock."""
+
+    def __init__(self):
+        self.now = 0.0
+        self.handles = []
+
+    def time(self):
+        return self.now
+
+    def call_later(self, delay, callback):
+        handle = FakeHandle(self.now + delay, callback)
+        self.handles.append(handle)
+        return handle
+
+    def advance(self, seconds):
+        end = self.now + seconds
+        while True:
+            due = [h for h in self.handles
+                   if not h.cancelled and h.when <= end]
+            if not due:
+                break
+            handle = min(due, key=lambda h: h.when)
+            self.handles.remove(handle)
+            self.now = handle.when
+            handle.callback()
+        self.now = end
+
+
+class TestAsyncioEventLoop(unittest.TestCase):
+
+    def make_event_loop(self, **kw):
+        loop = FakeLoop()
+        event_loop = AsyncioEventLoop(loop=loop, **kw)
+        frames = []
+        event_loop.enter_idle(lambda: frames.append(loop.time()))
+        return loop, event_loop, frames
+
+    def test_redraws_coalesced(self):
+        loop, event_loop, frames = self.make_event_loop(max_fps=10)
+        for i in range(50):
+            event_loop.alarm(i / 100, lambda: None)
+        loop.advance(1)
+        self.assertEqual(event_loop.redraws_requested, 51)
+        self.assertEqual(event_loop.redraws_performed, len(frames))
+        self.assertEqual(
+            [round(f, 6) for f in frames], [0.0, 0.1, 0.2, 0.3, 0.4, 0.5])
+
+    def test_idle_when_nothing_changes(self):
+        loop, event_loop, frames = self.make_event_loop(max_fps=10)
+        loop.advance(1)
+        self.assertEqual(frames, [0.0])
+        event_loop.request_redraw()
+        loop.advance(1)
+        self.assertEqual(frames, [0.0, 1.0])
+
+    def test_invalidation_while_drawing_ignored(self):
+        loop = FakeLoop()
+        event_loop = AsyncioEventLoop(loop=loop, max_fps=10)
+        frames = []
+
+        def draw():
+            frames.append(loop.time())
+            event_loop.request_redraw()
+
+        event_loop.enter_idle(draw)
+        loop.advance(1)
+        self.assertEqual(frames, [0.0])
+
+    def test_widget_changes_redrawn_while_running(self):
+        loop = asyncio.new_event_loop()
+        self.addCleanup(loop.close)
+        event_loop = AsyncioEventLoop(loop=loop, max_fps=1000)
+        event_loop.enter_idle(lambda: None)
+        text = urwid.Text("")
+        loop.call_later(0.05, text.set_text, "changed")
+        loop.call_later(0.1, loop.stop)
+        event_loop.run()
+        self.assertEqual(event_loop.redraws_performed, 2)
+        self.assertIsInstance(
+            urwid.CanvasCache.__dict__['invalidate'], classmethod)
+
+    def test_invalidate_restored_when_run_fails(self):
+        original = urwid.CanvasCache.__dict__['invalidate']
+        event_loop = AsyncioEventLoop(loop=FakeLoop())
+        p = mock.patch.object(
+            urwid.AsyncioEventLoop, 'run', side_effect=RuntimeError)
+        with p, self.assertRaises(RuntimeError):
+            event_loop.run()
+        self.assertIs(urwid.CanvasCache.__dict__['invalidate'], original)
+
+    def test_invalidate_hook_shared_between_loops(self):
+        original = urwid.CanvasCache.__dict__['invalidate']
+        loop1, event_loop1, frames1 = self.make_event_loop()
+        loop2, event_loop2, frames2 = self.make_event_loop()
+        loop1.advance(1)
+        loop2.advance(1)
+        event_loop1._hook_invalidate()
+        event_loop2._hook_invalidate()
+        event_loop1._unhook_invalidate()
+        urwid.Text("").set_text("changed")
+        loop1.advance(1)
+        loop2.advance(1)
+        self.assertEqual(len(frames1), 1)
+        self.assertEqual(len(frames2), 2)
+        event_loop2._unhook_invalidate()
+        self.assertIs(urwid.CanvasCache.__dict__['invalidate'], original)
+
+    def test_max_fps_clamped(self):
+        event_loop = AsyncioEventLoop(loop=FakeLoop(), max_fps=0)
+        self.assertEqual(event_loop.frame_interval, 1)
+
+    def test_no_redraw(self):
+        loop = FakeLoop()
+        event_loop = AsyncioEventLoop(loop=loop)
+        event_loop.redraw = False
+        frames = []
+        event_loop.enter_idle(lambda: frames.append(loop.time()))
+        event_loop.alarm(0.01, lambda: None)
+        loop.advance(1)
+        self.assertEqual(frames, [])
@@ -0,0 +1,181 @@
+# Copyright 2020 Canonical, Ltd.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import os
+import threading
+from unittest import mock
+
+from subiquitycore.prober import (
+    block_device_fingerprints,
+    Prober,
+    StorageProbeCache,
+    )
+from subiquitycore.tests import SubiTestCase, populate_dir
+
+
+class SlowProber(Prober):
+
+    def __init__(self, storage, slow_types=(), failing_types=()):
+        super().__init__(None, ())
+        self.saved_config = {'storage': storage}
+        self.slow_types = slow_types
+        self.failing_types = failing_types
+        self.release = threading.Event()
+
+    def get_storage(self, probe_types=None, *, restricted=None):
+        [probe_type] = probe_types
+        if probe_type in self.slow_types:
+            self.release.wait()
+        if probe_type in self.failing_types:
+            raise Exception("oh no")
+        return super().get_storage(probe_types, restricted=restricted)
+
+
+class TestGetStorageByType(SubiTestCase):
+
+    storage = {
+        'blockdev': {'/dev/sda': {}},
+        'lvm': {'volume_groups': {}},
+        'raid': {'/dev/md0': {}},
+        }
+
+    def make_prober(self, **kw):
+        prober = SlowProber(self.storage, **kw)
+        self.addCleanup(prober.release.set)
+        return prober
+
+    def test_all_ok(self):
+        prober = self.make_prober()
+        results, failures = prober.get_storage_by_type(
+            timeout=1, max_workers=2)
+        self.assertEqual(results, self.storage)
+        self.assertEqual(failures, {})
+
+    def test_slow_and_failing(self):
+        prober = self.make_prober(slow_types={'lvm'}, failing_types={'raid'})
+        results, failures = prober.get_storage_by_type(
+            timeout=0.1, max_workers=2)
+        self.assertEqual(results, {'blockdev': self.storage['blockdev']})
+        self.assertEqual(set(failures), {'lvm', 'raid'})
+        self.assertIn('timed out', failures['lvm'])
+
+    def test_all_workers_hung(self):
+        prober = self.make_prober(slow_types={'blockdev', 'lvm'})
+        with self.assertRaises(Exception):
+            prober.get_storage_by_type(timeout=0.1, max_workers=2)
+
+    def test_queued_probes_not_run_when_workers_hung(self):
+        prober = self.make_prober(slow_types={'lvm'})
+        results, failures = prober.get_storage_by_type(
+            ['lvm', 'raid', 'blockdev'], timeout=0.1, max_workers=1)
+        self.assertEqual(results, {'blockdev': self.storage['blockdev']})
+        self.assertEqual(failures, {
+            'lvm': 'timed out after 0.1s',
+            'raid': 'not run',
+            })
+
+
+class TestDebugFlags(SubiTestCase):
+
+    storage = TestGetStorageByType.storage
+
+    def make_prober(self, flag):
+        prober = Prober(None, [flag])
+        prober.saved_config = {'storage': self.storage}
+        p = mock.patch('subiquitycore.prober.time.sleep')
+        p.start()
+        self.addCleanup(p.stop)
+        return prober
+
+    def test_bpfail_full(self):
+        prober = self.make_prober('bpfail-full')
+        with self.assertRaises(Exception):
+            prober.get_storage_by_type(timeout=1, max_workers=2)
+        self.assertEqual(
+            prober.get_storage({'blockdev'})['blockdev'],
+            self.storage['blockdev'])
+
+    def test_bpfail_restricted(self):
+        prober = self.make_prober('bpfail-restricted')
+        results, failures = prober.get_storage_by_type(
+            timeout=1, max_workers=2)
+        self.assertEqual(results, self.storage)
+        self.assertEqual(failures, {})
+        with self.assertRaises(ZeroDivisionError):
+            prober.get_storage({'blockdev'})
+
+
+class TestBlockDeviceFingerprints(SubiTestCase):
+
+    def make_tree(self):
+        root = self.tmp_dir()
+        populate_dir(root, {
+            'sys/class/block/sda/dev': '8:0\n',
+            'sys/class/block/sda/size': '2048\n',
+            'sys/class/block/sda/device/serial': 'SERIAL\n',
+            'sys/class/block/sda1/dev': '8:1\n',
+            'sys/class/block/sda1/size': '1024\n',
+            'sys/class/block/cciss!c0d0/dev': '104:0\n',
+            'sys/class/block/cciss!c0d0/size': '4096\n',
+            'sys/class/block/cciss!c0d0/device/wwid': 'WWID\n',
+            'run/udev/data/b8:0': 'S:disk/by-id/x\nE:ID_PART_TABLE_UUID=abc\n',
+            'dev/sda': '',
+            })
+        return root
+
+    def fingerprints(self, root):
+        return block_device_fingerprints(
+            os.path.join(root, 'sys/class/block'),
+            os.path.join(root, 'dev'),
+            os.path.join(root, 'run/udev/data'))
+
+    def test_fingerprints(self):
+        root = self.make_tree()
+        dev = os.path.join(root, 'dev')
+        fingerprints = self.fingerprints(root)
+        self.assertEqual(
+            set(fingerprints),
+            {dev + '/sda', dev + '/sda1', dev + '/cciss/c0d0'})
+        sda = fingerprints[dev + '/sda']
+        self.assertEqual(sda['size'], '2048')
+        self.assertEqual(sda['serial'], 'SERIAL')
+        self.assertEqual(sda['udev'], {'ID_PART_TABLE_UUID': 'abc'})
+        self.assertIsNotNone(sda['mtime'])
+        self.assertEqual(fingerprints[dev + '/cciss/c0d0']['serial'], 'WWID')
+        self.assertEqual(fingerprints[dev + '/sda1']['udev'], {})
+
+    def test_cache(self):
+        root = self.make_tree()
+        cache = StorageProbeCache(os.path.join(root, 'cache.json'))
+        fingerprints = self.fingerprints(root)
+        self.assertIsNone(cache.load(fingerprints))
+        storage = {'blockdev': {'/dev/sda': {}}}
+        cache.save(fingerprints, storage)
+        self.assertEqual(cache.load(self.fingerprints(root)), storage)
+        populate_dir(root, {'sys/class/block/sda1/size': '512\n'})
+        self.assertIsNone(cache.load(self.fingerprints(root)))
+
+    def test_cache_sees_new_filesystem_and_holders(self):
+        root = self.make_tree()
+        cache = StorageProbeCache(os.path.join(root, 'cache.json'))
+        cache.save(self.fingerprints(root), {'blockdev': {}})
+        populate_dir(root, {
+            'run/udev/data/b8:1': 'E:ID_FS_TYPE=ext4\nE:ID_FS_UUID=x\n',
+            })
+        fingerprints = self.fingerprints(root)
+        self.assertIsNone(cache.load(fingerprints))
+        cache.save(fingerprints, {'blockdev': {}})
+        populate_dir(root, {'sys/class/block/sda1/holders/md0': ''})
+        self.assertIsNone(cache.load(self.fingerprints(root)))
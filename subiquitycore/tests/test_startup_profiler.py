@@ -0,0 +1,73 @@
+# Copyright 2020 Canonical, Ltd.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import builtins
+import json
+import sys
+import threading
+import time
+
+from subiquitycore import startup_profiler
+from subiquitycore.tests import SubiTestCase
+
+
+class TestStartupProfiler(SubiTestCase):
+
+    def test_disabled(self):
+        with startup_profiler.phase("nothing"):
+            pass
+        startup_profiler.finish()
+
+    def test_profile(self):
+        path = self.tmp_path('profile.json')
+        orig_import = builtins.__import__
+        sys.modules.pop('colorsys', None)
+        startup_profiler.start(path)
+        try:
+            with startup_profiler.phase("stuff"):
+                import colorsys  # noqa: F401
+        finally:
+            startup_profiler.finish()
+        self.assertIs(builtins.__import__, orig_import)
+        with open(path) as fp:
+            report = json.load(fp)
+        self.assertEqual([p[0] for p in report['phases']], ["stuff"])
+        self.assertIn('colorsys', [i[0] for i in report['imports']])
+
+    def test_imports_in_threads(self):
+        profiler = startup_profiler.StartupProfiler(None)
+        started = threading.Event()
+        release = threading.Event()
+
+        def fake_import(name, *args):
+            if name == 'slow_thread_module':
+                started.set()
+                release.wait()
+            else:
+                time.sleep(0.01)
+
+        profiler._orig_import = fake_import
+        t = threading.Thread(
+            target=profiler._import, args=('slow_thread_module',))
+        t.start()
+        started.wait()
+        # An import in the main thread while the other thread's import
+        # is in progress is not counted as nested inside it.
+        profiler._import('main_thread_module')
+        release.set()
+        t.join()
+        entries = {entry[0]: entry for entry in profiler.imports}
+        slow = entries['slow_thread_module']
+        self.assertEqual(slow[1], slow[2])
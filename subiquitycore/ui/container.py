@@ -446,6 +446,21 @@ class ScrollBarListBox(urwid.WidgetDecoration):
             size = (size[0]-1, size[1])
         return lb.keypress(size, key)
 
+    def _scan_heights(self, lb, maxcol):
+        seen_focus = False
+        height = height_before_focus = 0
+        focus_widget, focus_pos = lb.body.get_focus()
+        # Scan through the rows calculating total height and the
+        # height of the rows before the focus widget.
+        for widget in lb.body:
+            rows = widget.rows((maxcol - 1,))
+            if widget is focus_widget:
+                seen_focus = True
+            elif not seen_focus:
+                height_before_focus += rows
+            height += rows
+        return height, height_before_focus
+
     def render(self, size, focus=False):
         lb = self.original_widget
         if self._scroll(size, focus):
@@ -459,18 +474,13 @@ class ScrollBarListBox(urwid.WidgetDecoration):
             offset, inset = lb.get_focus_offset_inset((maxcol - 1, maxrow))
             visible = lb.ends_visible((maxcol - 1, maxrow), focus)
 
-            seen_focus = False
-            height = height_before_focus = 0
-            focus_widget, focus_pos = lb.body.get_focus()
-            # Scan through the rows calculating total height and the
-            # height of the rows before the focus widget.
-            for widget in lb.body:
-                rows = widget.rows((maxcol - 1,))
-                if widget is focus_widget:
-                    seen_focus = True
-                elif not seen_focus:
-                    height_before_focus += rows
-                height += rows
+            scrollbar_heights = getattr(lb.body, 'scrollbar_heights', None)
+            if scrollbar_heights is not None:
+                # Bodies too big to scan (see subiquitycore.ui.logview)
+                # can say how tall they are themselves.
+                height, height_before_focus = scrollbar_heights()
+            else:
+                height, height_before_focus = self._scan_heights(lb, maxcol)
 
             # Calculate the number of rows off the top and bottom of
             # the listbox.
@@ -481,7 +491,7 @@ class ScrollBarListBox(urwid.WidgetDecoration):
             if 'bottom' in visible:
                 bottom = 0
             else:
-                bottom = height - top - maxrow
+                bottom = max(0, height - top - maxrow)
 
             # Prevent the box from being squished to 0 rows. Input of
             #
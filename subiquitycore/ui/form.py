@@ -217,7 +217,7 @@ class BoundFormField(object):
                 return
             self.in_error = False
             if not self.showing_extra and self.help is not NO_HELP:
-                self.under_text.set_text(self.help)
+                self._set_under_text(self.help)
             self.form.validated()
 
     def _validate(self):
@@ -241,7 +241,7 @@ class BoundFormField(object):
         if r is None:
             self.in_error = False
             if not self.showing_extra and self.help is not NO_HELP:
-                self.under_text.set_text(self.help)
+                self._set_under_text(self.help)
         else:
             self.in_error = True
             if show_error:
@@ -250,7 +250,13 @@ class BoundFormField(object):
 
     def show_extra(self, extra_markup):
         self.showing_extra = True
-        self.under_text.set_text(extra_markup)
+        self._set_under_text(extra_markup)
+
+    def _set_under_text(self, markup):
+        # The table caches the widths of its cells, so it has to be told
+        # when one changes.
+        self.under_text.set_text(markup)
+        self._table.invalidate()
 
     @property
     def value(self):
@@ -274,7 +280,7 @@ class BoundFormField(object):
         if val is None:
             val = ""
         self._help = val
-        self.under_text.set_text(val)
+        self._set_under_text(val)
 
     @property
     def caption(self):
@@ -283,6 +289,7 @@ class BoundFormField(object):
     @caption.setter
     def caption(self, val):
         self.caption_text.set_text(val)
+        self._table.invalidate()
 
     @property
     def enabled(self):
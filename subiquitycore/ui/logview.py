@@ -0,0 +1,170 @@
+# Copyright 2020 Canonical, Ltd.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+""" A ListBox for showing a large and growing amount of log output.
+
+A ListBox full of Text widgets costs a widget per line and the
+scrollbar has to render every one of them to work out its geometry.
+Instead, LogListBox keeps the raw lines in a LineBuffer, creates Text
+widgets only for the lines that are looked at and sizes its scrollbar
+by counting lines (so a line that wraps counts as one row).
+"""
+
+import array
+import collections
+import logging
+
+import urwid
+
+from subiquitycore.ui.container import ScrollBarListBox
+
+
+log = logging.getLogger('subiquitycore.ui.logview')
+
+DEFAULT_MAX_LINES = 10000
+
+
+class LineBuffer:
+    """The last max_lines lines added, plus optionally older ones on disk.
+
+    Lines are numbered from 0 in the order they were added. Lines that
+    fall out of memory are written to spill_path if it is given and can
+    still be read back from there; otherwise they are forgotten.
+    """
+
+    def __init__(self, max_lines=DEFAULT_MAX_LINES, spill_path=None):
+        self.max_lines = max_lines
+        self.spill_path = spill_path
+        self.first = 0  # number of lines[0]
+        self.lines = collections.deque()
+        self._spill = None
+        self._spill_offsets = array.array('Q')
+
+    @property
+    def start(self):
+        """The number of the oldest line that can still be read."""
+        if self._spill_offsets:
+            return 0
+        return self.first
+
+    @property
+    def end(self):
+        """One more than the number of the newest line."""
+        return self.first + len(self.lines)
+
+    def extend(self, lines):
+        self.lines.extend(lines)
+        excess = len(self.lines) - self.max_lines
+        if excess <= 0:
+            return
+        dropped = [self.lines.popleft() for i in range(excess)]
+        if self.spill_path is not None:
+            self._spill_lines(dropped)
+        self.first += excess
+
+    def _spill_lines(self, lines):
+        try:
+            if self._spill is None:
+                self._spill = open(self.spill_path, 'w+b')
+            self._spill.seek(0, 2)
+            for line in lines:
+                self._spill_offsets.append(self._spill.tell())
+                self._spill.write(line.encode('utf-8', 'replace') + b'\n')
+        except OSError:
+            log.exception("spilling log lines to %s failed", self.spill_path)
+            self.spill_path = None
+            self._spill_offsets = array.array('Q')
+
+    def __getitem__(self, index):
+        if index >= self.end or index < self.start:
+            raise IndexError(index)
+        if index >= self.first:
+            return self.lines[index - self.first]
+        self._spill.seek(self._spill_offsets[index])
+        return self._spill.readline()[:-1].decode('utf-8', 'replace')
+
+
+class LineBufferWalker(urwid.ListWalker):
+    """A ListWalker over a LineBuffer that makes Text widgets on demand.
+
+    Positions are line numbers in the buffer. If the focus is on the
+    last line when lines are added, it moves to the new last line.
+    """
+
+    cache_size = 500
+
+    def __init__(self, buffer):
+        self.buffer = buffer
+        self.focus = None
+        self._widgets = collections.OrderedDict()
+
+    def _widget(self, position):
+        w = self._widgets.get(position)
+        if w is None:
+            w = urwid.Text(self.buffer[position])
+            self._widgets[position] = w
+            if len(self._widgets) > self.cache_size:
+                self._widgets.popitem(last=False)
+        else:
+            self._widgets.move_to_end(position)
+        return w
+
+    def _valid(self, position):
+        return self.buffer.start <= position < self.buffer.end
+
+    def add_lines(self, lines):
+        if not lines:
+            return
+        at_end = self.focus is None or self.focus == self.buffer.end - 1
+        self.buffer.extend(lines)
+        if at_end:
+            self.focus = self.buffer.end - 1
+        elif self.focus < self.buffer.start:
+            self.focus = self.buffer.start
+        self._modified()
+
+    def get_focus(self):
+        if self.focus is None:
+            return None, None
+        return self._widget(self.focus), self.focus
+
+    def set_focus(self, position):
+        if not self._valid(position):
+            raise IndexError(position)
+        self.focus = position
+        self._modified()
+
+    def get_next(self, position):
+        if not self._valid(position + 1):
+            return None, None
+        return self._widget(position + 1), position + 1
+
+    def get_prev(self, position):
+        if not self._valid(position - 1):
+            return None, None
+        return self._widget(position - 1), position - 1
+
+    def scrollbar_heights(self):
+        """Return (total rows, rows before the focus) for the scrollbar."""
+        if self.focus is None:
+            return 0, 0
+        return (
+            self.buffer.end - self.buffer.start,
+            self.focus - self.buffer.start,
+            )
+
+
+def LogListBox(buffer):
+    return ScrollBarListBox(urwid.ListBox(LineBufferWalker(buffer)))
@@ -13,10 +13,16 @@
 # You should have received a copy of the GNU Affero General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
+import weakref
+
 from urwid import (
     Text,
     )
 
+# All running spinners are advanced by one timer that fires every TICK
+# seconds, so each style's rate must be a multiple of it.
+TICK = 0.1
+
 styles = {
     'dots': {
         'texts': [t.replace('*', '\N{bullet}')
@@ -31,6 +37,58 @@ styles = {
     }
 
 
+class SpinnerClock:
+    """Advances all the running spinners on an event loop from one timer.
+
+    Because every spinner changes in the same callback they are all
+    redrawn together. A spinner that has not been rendered since it last
+    changed is not on screen and is not advanced; when none of them are
+    on screen the timer stops until one of them is rendered again.
+    """
+
+    _clocks = weakref.WeakKeyDictionary()
+
+    @classmethod
+    def for_loop(cls, aio_loop):
+        clock = cls._clocks.get(aio_loop)
+        if clock is None:
+            clock = cls._clocks[aio_loop] = cls(aio_loop)
+        return clock
+
+    def __init__(self, aio_loop):
+        self.aio_loop = aio_loop
+        self.spinners = set()
+        self.ticks = 0
+        self.handle = None
+
+    def add(self, spinner):
+        self.spinners.add(spinner)
+        self.wake()
+
+    def remove(self, spinner):
+        self.spinners.discard(spinner)
+        if not self.spinners and self.handle is not None:
+            self.handle.cancel()
+            self.handle = None
+
+    def wake(self):
+        if self.handle is None and self.spinners:
+            self.handle = self.aio_loop.call_later(TICK, self._tick)
+
+    def _tick(self):
+        self.handle = None
+        self.ticks += 1
+        waiting = False
+        for spinner in list(self.spinners):
+            if not spinner.rendered:
+                continue
+            waiting = True
+            if self.ticks % spinner.ticks_per_frame == 0:
+                spinner.spin()
+        if waiting:
+            self.wake()
+
+
 class Spinner(Text):
     def __init__(self, aio_loop=None, style='spin', align='center'):
         self.aio_loop = aio_loop
@@ -38,22 +96,39 @@ class Spinner(Text):
         self.spin_text = styles[style]['texts']
         self.rate = styles[style]['rate']
         super().__init__('', align=align)
-        self.handle = None
+        self.clock = None
+        # Whether this spinner has been drawn since it last changed.
+        self.rendered = False
+
+    @property
+    def rate(self):
+        return self._rate
+
+    @rate.setter
+    def rate(self, rate):
+        self._rate = rate
+        self.ticks_per_frame = max(1, round(rate / TICK))
 
     def spin(self):
         self.spin_index = (self.spin_index + 1) % len(self.spin_text)
         self.set_text(self.spin_text[self.spin_index])
+        self.rendered = False
 
-    def _advance(self):
-        self.spin()
-        self.handle = self.aio_loop.call_later(self.rate, self._advance)
+    def render(self, size, focus=False):
+        self.rendered = True
+        if self.clock is not None:
+            self.clock.wake()
+        return super().render(size, focus)
 
     def start(self):
         self.stop()
-        self._advance()
+        self.spin()
+        self.rendered = True
+        self.clock = SpinnerClock.for_loop(self.aio_loop)
+        self.clock.add(self)
 
     def stop(self):
         self.set_text('')
-        if self.handle is not None:
-            self.handle.cancel()
-            self.handle = None
+        if self.clock is not None:
+            self.clock.remove(self)
+            self.clock = None
@@ -67,7 +67,7 @@ Example:
 ```
 """
 
-from collections import defaultdict
+from collections import Counter, defaultdict
 import logging
 
 
@@ -155,8 +155,21 @@ class TableRow(WidgetWrap):
             cols.append(urwid.Text(""))
         del cols[-1]
         self.columns = Columns(cols)
+        self.has_spanning_cells = any(c > 1 for c, _ in self.cells)
+        self.invalidate()
         super().__init__(self.columns)
 
+    def invalidate(self):
+        """Forget the natural widths of the cells.
+
+        These are worked out once and then cached, so this must be
+        called (usually via AbstractTable.invalidate) when the content
+        of a cell changes in a way that might change its width.
+        """
+        self._natural_widths = {}
+        self._spanning_widths = {}
+        self._widths = None
+
     def selectable(self):
         for w, _ in self._w.contents:
             if w.selectable():
@@ -175,12 +188,17 @@ class TableRow(WidgetWrap):
         """Return a mapping {underlying-index:natural-width}.
 
         Cells spanning multiple columns are ignored (handled in
-        adjust_for_spanning_cells).
+        adjust_for_spanning_cells). The returned mapping is cached and
+        must not be modified.
         """
-        widths = {}
-        for user_indices, cell in self._user_indices_cells():
-            if len(user_indices) == 1 and user_indices[0] not in unpacked_cols:
-                widths[2*user_indices[0]] = widget_width(cell)
+        key = frozenset(unpacked_cols)
+        widths = self._natural_widths.get(key)
+        if widths is None:
+            widths = self._natural_widths[key] = {}
+            for user_indices, cell in self._user_indices_cells():
+                if len(user_indices) == 1 and \
+                   user_indices[0] not in unpacked_cols:
+                    widths[2*user_indices[0]] = widget_width(cell)
         return widths
 
     def adjust_for_spanning_cells(self, unpacked_user_indices,
@@ -196,7 +214,10 @@ class TableRow(WidgetWrap):
             if len(user_indices) <= 1:
                 continue
             cur_width = _width(widths, user_indices)
-            cell_width = widget_width(cell)
+            cell_width = self._spanning_widths.get(user_indices[0])
+            if cell_width is None:
+                cell_width = widget_width(cell)
+                self._spanning_widths[user_indices[0]] = cell_width
             if cur_width < cell_width:
                 # If any of the spanned columns have no inherent size (i.e. all
                 # the cells in that column also span another column), only
@@ -218,6 +239,9 @@ class TableRow(WidgetWrap):
         missing means let the column shrink, a width being 0 means omit
         the column entirely.
         """
+        if widths == self._widths:
+            return
+        self._widths = widths
         cols = []
         for user_indices, cell in self._user_indices_cells():
             try:
@@ -235,19 +259,81 @@ class TableRow(WidgetWrap):
         self.columns.contents[:] = cols
 
 
+def _unpacked_user_indices(colspecs):
+    return {user_i for user_i, cs in colspecs.items() if not cs.pack}
+
+
+class _ColumnWidths:
+    """The natural widths of the columns of a changing set of rows.
+
+    For each column, this counts how many rows have each natural width
+    so that the widest can be found again after rows are added or
+    removed without looking at all the other rows. A row's widths are
+    only worked out (and then cached by the row) the first time they
+    are needed after it has been added.
+    """
+
+    def __init__(self, unpacked_user_indices):
+        self.unpacked_user_indices = unpacked_user_indices
+        # underlying index -> Counter({natural width: number of rows})
+        self._counts = defaultdict(Counter)
+        self._rows = {}  # id(row) -> (row, natural widths)
+        self._pending = {}  # id(row) -> row
+        self.spanning_rows = {}  # id(row) -> row
+
+    def add(self, row):
+        if id(row) not in self._rows:
+            self._pending[id(row)] = row
+
+    def remove(self, row):
+        self._pending.pop(id(row), None)
+        self.spanning_rows.pop(id(row), None)
+        row, widths = self._rows.pop(id(row), (None, {}))
+        for underlying_i, w in widths.items():
+            counts = self._counts[underlying_i]
+            counts[w] -= 1
+            if counts[w] == 0:
+                del counts[w]
+            if not counts:
+                del self._counts[underlying_i]
+
+    def natural_widths(self):
+        """Return {underlying-index: widest natural width in the column}."""
+        for row in self._pending.values():
+            widths = row.get_natural_widths(self.unpacked_user_indices)
+            self._rows[id(row)] = row, widths
+            for underlying_i, w in widths.items():
+                self._counts[underlying_i][w] += 1
+            if row.has_spanning_cells:
+                self.spanning_rows[id(row)] = row
+        self._pending.clear()
+        return {
+            underlying_i: max(counts)
+            for underlying_i, counts in self._counts.items()
+            }
+
+
 def _compute_widths_for_size(maxcol, table_rows, colspecs, default_spacing):
     """Return {cell-index:width} and total width for a table."""
+    column_widths = _ColumnWidths(_unpacked_user_indices(colspecs))
+    for row in table_rows:
+        column_widths.add(row.base_widget)
+    return _widths_for_size(maxcol, column_widths, colspecs, default_spacing)
+
+
+def _widths_for_size(maxcol, column_widths, colspecs, default_spacing):
+    """Return {cell-index:width} and total width for a table.
 
-    unpacked_user_indices = {
-        user_i for user_i, cs in colspecs.items() if not cs.pack}
+    column_widths is the _ColumnWidths for the rows of the table.
+    """
+
+    unpacked_user_indices = column_widths.unpacked_user_indices
 
     # Find the natural width for each column.
     # widths maps underyling index to width
     widths = {2*i: cs.min_width for i, cs in colspecs.items() if cs.pack}
-    for row in table_rows:
-        row_widths = row.base_widget.get_natural_widths(unpacked_user_indices)
-        for underlying_i, w in row_widths.items():
-            widths[underlying_i] = max(w, widths.get(underlying_i, 0))
+    for underlying_i, w in column_widths.natural_widths().items():
+        widths[underlying_i] = max(w, widths.get(underlying_i, 0))
 
     # count the columns...
     colcount = max(widths.keys())//2 + 1
@@ -272,8 +358,8 @@ def _compute_widths_for_size(maxcol, table_rows, colspecs, default_spacing):
 
     # Make sure columns are big enough for cells that span mutiple
     # columns.
-    for row in table_rows:
-        row.base_widget.adjust_for_spanning_cells(
+    for row in column_widths.spanning_rows.values():
+        row.adjust_for_spanning_cells(
             unpacked_user_indices, no_inherent_size, widths)
 
     # log.debug("%s", (maxcol, widths.items(),
@@ -332,7 +418,12 @@ class AbstractTable(WidgetWrap):
 
         super().__init__(self._make(self.table_rows))
         self._last_size = None
+        self._natural_width = None
         self.group = set([self])
+        # Shared by all the tables in the group.
+        self._column_widths = _ColumnWidths(
+            _unpacked_user_indices(self.colspecs))
+        self._add_rows(self.table_rows)
 
     def bind(self, other_table):
         """Bind two tables such that they will use the same column widths.
@@ -341,21 +432,41 @@ class AbstractTable(WidgetWrap):
         use the same colspecs.
         """
         new_group = self.group | other_table.group
+        column_widths = _ColumnWidths(_unpacked_user_indices(self.colspecs))
         for table in new_group:
             table.group = new_group
+            table._column_widths = column_widths
+            table._add_rows(table.table_rows)
+        self._layout_changed()
+
+    def _add_rows(self, rows):
+        for row in rows:
+            self._column_widths.add(row.base_widget)
+
+    def _remove_rows(self, rows):
+        for row in rows:
+            self._column_widths.remove(row.base_widget)
+
+    def _layout_changed(self):
+        for table in self.group:
+            table._last_size = None
+            table._natural_width = None
 
     def invalidate(self):
-        self._last_size = None
+        """Recompute the layout after the content of cells has changed."""
+        for row in self.table_rows:
+            row = row.base_widget
+            self._column_widths.remove(row)
+            row.invalidate()
+            self._column_widths.add(row)
+        self._layout_changed()
 
     def _compute_widths_for_size(self, size):
         # Configure the table (and any bound tables) for the given size.
         if self._last_size == size:
             return
-        rows = []
-        for table in self.group:
-            rows.extend(table.table_rows)
-        widths, total_width, has_unpacked = _compute_widths_for_size(
-            size[0], rows, self.colspecs, self.spacing)
+        widths, total_width, has_unpacked = _widths_for_size(
+            size[0], self._column_widths, self.colspecs, self.spacing)
         for table in self.group:
             table._last_size = size
             for row in table.table_rows:
@@ -364,12 +475,12 @@ class AbstractTable(WidgetWrap):
                 row.base_widget.set_widths(widths)
 
     def get_natural_width(self):
-        rows = []
-        for table in self.group:
-            rows.extend(table.table_rows)
-        widths, total_width, has_unpacked = _compute_widths_for_size(
-            100000, rows, self.colspecs, self.spacing)
-        return total_width
+        if self._natural_width is None:
+            widths, total_width, has_unpacked = _widths_for_size(
+                100000, self._column_widths, self.colspecs, self.spacing)
+            for table in self.group:
+                table._natural_width = total_width
+        return self._natural_width
 
     def rows(self, size, focus):
         self._compute_widths_for_size(size)
@@ -394,13 +505,16 @@ class TablePile(AbstractTable):
         return Pile([('pack', r) for r in rows])
 
     def insert_rows(self, index, new_rows):
-        self.invalidate()
+        self._layout_changed()
+        new_rows = [urwid.Padding(w) for w in new_rows]
+        self._add_rows(new_rows)
         self.table_rows[index:index] = new_rows
         self._w.contents[index:index] = [
-            (urwid.Padding(w), self._w.options('pack')) for w in new_rows]
+            (w, self._w.options('pack')) for w in new_rows]
 
     def remove_rows(self, start, end):
-        self.invalidate()
+        self._layout_changed()
+        self._remove_rows(self.table_rows[start:end])
         # MonitoredFocusList clamps the focus position to the new
         # length of the list when you remove elements but it doesn't
         # check that that the element it moves the focus to is
@@ -416,9 +530,21 @@ class TablePile(AbstractTable):
                 self._w.focus_position += 1
 
     def set_contents(self, rows):
-        """Update the list of rows. """
-        self.invalidate()
-        rows = [urwid.Padding(row) for row in rows]
+        """Update the list of rows.
+
+        Passing rows that are already in the table is cheap: if nothing
+        has changed, the column widths are not recomputed.
+        """
+        if len(rows) == len(self.table_rows) and all(
+                new is old.original_widget
+                for new, old in zip(rows, self.table_rows)):
+            return
+        self._layout_changed()
+        paddings = {id(row.original_widget): row for row in self.table_rows}
+        rows = [paddings.pop(id(row), None) or urwid.Padding(row)
+                for row in rows]
+        self._remove_rows(paddings.values())
+        self._add_rows(rows)
         self.table_rows = rows
         empty_before = len(self._w.contents) == 0
         self._w.contents[:] = [(row, self._w.options('pack')) for row in rows]
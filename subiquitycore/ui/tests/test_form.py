@@ -0,0 +1,45 @@
+# Copyright 2020 Canonical, Ltd.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+from unittest import mock, TestCase
+
+from subiquitycore.ui.form import (
+    Form,
+    StringField,
+    )
+
+
+class HelpForm(Form):
+    name = StringField("Name:", help="help")
+
+    def validate_name(self):
+        if self.name.value == "bad":
+            return "bad name"
+
+
+class TestBoundFormField(TestCase):
+
+    def test_under_text_change_invalidates_table(self):
+        form = HelpForm()
+        field = form.name
+        with mock.patch.object(field._table, 'invalidate') as invalidate:
+            field.show_extra("extra")
+            self.assertEqual(invalidate.call_count, 1)
+            field.help = "more help"
+            self.assertEqual(invalidate.call_count, 2)
+            field.value = "bad"
+            field.validate()
+            self.assertEqual(field.under_text.text, "bad name")
+            self.assertEqual(invalidate.call_count, 3)
@@ -0,0 +1,63 @@
+# Copyright 2020 Canonical, Ltd.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+from subiquitycore.tests import SubiTestCase
+from subiquitycore.ui.logview import (
+    LineBuffer,
+    LogListBox,
+    )
+
+
+class TestLineBuffer(SubiTestCase):
+
+    def test_ring(self):
+        buffer = LineBuffer(max_lines=3)
+        buffer.extend(["a", "b"])
+        buffer.extend(["c", "d", "e"])
+        self.assertEqual((buffer.start, buffer.end), (2, 5))
+        self.assertEqual([buffer[i] for i in range(2, 5)], ["c", "d", "e"])
+        with self.assertRaises(IndexError):
+            buffer[1]
+
+    def test_spill(self):
+        buffer = LineBuffer(max_lines=2, spill_path=self.tmp_path('spill'))
+        buffer.extend(["a", "b", "c"])
+        buffer.extend(["d", "\N{SNOWMAN}"])
+        self.assertEqual(len(buffer.lines), 2)
+        self.assertEqual((buffer.start, buffer.end), (0, 5))
+        self.assertEqual(
+            [buffer[i] for i in range(5)], ["a", "b", "c", "d", "\N{SNOWMAN}"])
+
+
+class TestLogListBox(SubiTestCase):
+
+    def test_follows_end(self):
+        lb = LogListBox(LineBuffer(max_lines=100))
+        walker = lb.base_widget.body
+        walker.add_lines(["line {}".format(i) for i in range(10)])
+        self.assertEqual(lb.base_widget.focus_position, 9)
+        lb.base_widget.set_focus(5)
+        walker.add_lines(["more"])
+        self.assertEqual(lb.base_widget.focus_position, 5)
+
+    def test_render_makes_only_visible_widgets(self):
+        lb = LogListBox(LineBuffer(max_lines=10000))
+        walker = lb.base_widget.body
+        walker.add_lines(["line {}".format(i) for i in range(10000)])
+        canvas = lb.render((40, 5))
+        self.assertEqual(canvas.rows(), 5)
+        self.assertIn(b"line 9999", b"".join(canvas.text))
+        self.assertLess(len(walker._widgets), 20)
+        self.assertEqual(walker.scrollbar_heights(), (10000, 9999))
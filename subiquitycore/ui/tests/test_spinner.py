@@ -0,0 +1,77 @@
+# Copyright 2020 Canonical, Ltd.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import asyncio
+import unittest
+
+from subiquitycore.ui.spinner import (
+    Spinner,
+    SpinnerClock,
+    )
+
+
+class TestSpinnerClock(unittest.TestCase):
+
+    def setUp(self):
+        self.loop = asyncio.new_event_loop()
+        self.addCleanup(self.loop.close)
+
+    def run_for(self, seconds, every=None):
+        # Render the spinners in every, as a screen redraw would.
+        def redraw():
+            for spinner in every or ():
+                spinner.render((10,))
+            self.loop.call_later(0.05, redraw)
+        redraw()
+        self.loop.call_later(seconds, self.loop.stop)
+        self.loop.run_forever()
+
+    def test_one_timer(self):
+        spin = Spinner(self.loop)
+        dots = Spinner(self.loop, style='dots')
+        spin.start()
+        dots.start()
+        clock = SpinnerClock.for_loop(self.loop)
+        self.assertEqual(clock.spinners, {spin, dots})
+        self.run_for(0.45, every=[spin, dots])
+        self.assertEqual(spin.spin_index, 5 % len(spin.spin_text))
+        self.assertEqual(dots.spin_index, 3)
+        spin.stop()
+        dots.stop()
+        self.assertIsNone(clock.handle)
+
+    def test_pauses_when_not_rendered(self):
+        spin = Spinner(self.loop)
+        spin.start()
+        clock = SpinnerClock.for_loop(self.loop)
+        self.run_for(0.45)
+        self.assertEqual(spin.spin_index, 2)
+        self.assertIsNone(clock.handle)
+        spin.render((10,))
+        self.assertIsNotNone(clock.handle)
+        spin.stop()
+
+    def test_rate_change(self):
+        spin = Spinner(self.loop)
+        spin.rate = 0.3
+        self.assertEqual(spin.ticks_per_frame, 3)
+        spin.start()
+        self.addCleanup(spin.stop)
+        clock = SpinnerClock.for_loop(self.loop)
+        start = spin.spin_index
+        for i in range(6):
+            spin.rendered = True
+            clock._tick()
+        self.assertEqual(spin.spin_index, start + 2)
@@ -14,13 +14,15 @@
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
 from collections import defaultdict
-from unittest import TestCase
+from unittest import mock, TestCase
 
 from urwid import Text
 
 from subiquitycore.ui.table import (
+    _ColumnWidths,
     _compute_widths_for_size,
     ColSpec,
+    TablePile,
     TableRow,
     )
 
@@ -143,3 +145,66 @@ class TestComputeWidthsForSize(TestCase):
             ({0: 10, 1: 0, 3: 0, 4: 10}, 28, False),
             (widths, total, has_unpacked),
             )
+
+
+class TestColumnWidths(TestCase):
+
+    def test_max_after_remove(self):
+        rows = [TableRow([Text("x"*size)]) for size in (3, 10, 10, 5)]
+        column_widths = _ColumnWidths(set())
+        for row in rows:
+            column_widths.add(row)
+        self.assertEqual({0: 10}, column_widths.natural_widths())
+        column_widths.remove(rows[1])
+        self.assertEqual({0: 10}, column_widths.natural_widths())
+        column_widths.remove(rows[2])
+        self.assertEqual({0: 5}, column_widths.natural_widths())
+        for row in rows:
+            column_widths.remove(row)
+        self.assertEqual({}, column_widths.natural_widths())
+
+    def test_row_widths_cached_until_invalidated(self):
+        text = Text("x"*5)
+        row = TableRow([text])
+        self.assertEqual({0: 5}, row.get_natural_widths(set()))
+        text.set_text("x"*8)
+        self.assertEqual({0: 5}, row.get_natural_widths(set()))
+        row.invalidate()
+        self.assertEqual({0: 8}, row.get_natural_widths(set()))
+
+
+class TestTablePile(TestCase):
+
+    def test_set_contents_only_measures_new_rows(self):
+        rows = [TableRow([Text("x"*size)]) for size in (3, 10)]
+        table = TablePile(rows)
+        self.assertEqual(10, table.get_natural_width())
+        new_row = TableRow([Text("x"*12)])
+        p = mock.patch(
+            'subiquitycore.ui.table.widget_width', side_effect=lambda w: 12)
+        with p as widget_width:
+            table.set_contents([rows[0], new_row])
+            self.assertEqual(12, table.get_natural_width())
+            table.render((40,))
+        widget_width.assert_called_once_with(new_row.cells[0][1])
+        table.set_contents(rows[:1])
+        self.assertEqual(3, table.get_natural_width())
+
+    def test_invalidate_remeasures(self):
+        text = Text("x"*5)
+        table = TablePile([TableRow([text])])
+        self.assertEqual(5, table.get_natural_width())
+        text.set_text("x"*8)
+        self.assertEqual(5, table.get_natural_width())
+        table.invalidate()
+        self.assertEqual(8, table.get_natural_width())
+
+    def test_bound_tables_share_widths(self):
+        table1 = TablePile([TableRow([Text("x"*5)])])
+        table2 = TablePile([TableRow([Text("x"*8)])])
+        table1.bind(table2)
+        self.assertEqual(8, table1.get_natural_width())
+        table2.insert_rows(1, [TableRow([Text("x"*11)])])
+        self.assertEqual(11, table1.get_natural_width())
+        table2.remove_rows(0, 2)
+        self.assertEqual(5, table1.get_natural_width())
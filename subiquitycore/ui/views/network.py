@@ -274,6 +274,7 @@ class NetworkView(BaseView):
         first_row.cells[1][1].set_text(dev.name)
         first_row.cells[2][1].set_text(dev.type)
         first_row.cells[3][1].set_text(self._notes_for_device(dev))
+        old_table.invalidate()
         old_table.remove_rows(1, len(old_table.table_rows))
         old_table.insert_rows(1, self._address_rows_for_device(dev))
 
@@ -93,7 +93,7 @@ async def astart_command(cmd, *, stdout=subprocess.PIPE,
                          env=None, **kw):
     log.debug("astart_command called: %s", cmd)
     return await asyncio.create_subprocess_exec(
-        *cmd, stdout=stdout, stderr=stderr,
+        *cmd, stdin=stdin, stdout=stdout, stderr=stderr,
         env=_clean_env(env), **kw)
 
 